@@ -2,23 +2,37 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config as config
-from typing import Dict, Any
+from typing import Any, Dict, List, Optional
 from mrkl import MRKLAgent
-   
-def agent_flow(query: str) -> Dict[str, Any]:
-    """主函數：執行 MRKL Agent，儲存整個查詢過程和最終結果"""
+from agent.observation_packer import observation_budget
+from utils.metrics import stage_timer
+
+_shared_agent = None
+
+
+def get_agent() -> MRKLAgent:
+    """取得共用的 MRKL Agent：LLM client、工具與 AgentExecutor 只建立一次，之後的請求重複使用（不保存對話狀態，可多執行緒共用）"""
+    global _shared_agent
+    if _shared_agent is None:
+        _shared_agent = MRKLAgent()
+    return _shared_agent
+
+def agent_flow(query: str, agent: MRKLAgent = None, callbacks: Optional[List[Any]] = None) -> Dict[str, Any]:
+    """主函數：執行 MRKL Agent，儲存整個查詢過程和最終結果；未指定 agent 時使用共用實例
+    observation_tokens 為本次工具 Observation 打包前後的估算 tokens 與節省量；callbacks 傳給本次 agent 執行（/agent/stream）"""
     steps = [
         {"start": "開始 Agent 執行..."},
     ]
-    agent = MRKLAgent()
-    result, final_answer = agent.query(query)
+    with stage_timer("agent"), observation_budget() as budget:
+        result, final_answer = (agent or get_agent()).query(query, callbacks=callbacks)
     steps.extend(result)
     steps.append({"end": "Agent 執行完成"})
     print(steps)
     return {
             "query": query,
             "steps": steps,
-            "final_result": final_answer
+            "final_result": final_answer,
+            "observation_tokens": budget.report()
         }
 
 # =======================
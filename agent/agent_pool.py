@@ -0,0 +1,82 @@
+"""
+agent/agent_pool.py - agent 工作池：在固定數量的工作執行緒執行同步的 ReAct 迴圈，不阻塞 event loop
+- 同時執行上限 config.AGENT_MAX_CONCURRENCY，其餘請求排隊；等候數超過 config.AGENT_MAX_QUEUE 時直接拒絕（AgentPoolFull）
+- 佇列等候時間、等候 / 執行中數量與拒絕次數寫入 Prometheus（utils/metrics.py 的 observe_queue，queue="agent"）
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from utils.metrics import observe_queue
+
+
+class AgentPoolFull(Exception):
+    """等候中的請求已達上限"""
+
+
+# =======================
+# agent 工作池
+# =======================
+class AgentWorkerPool:
+    def __init__(self, max_workers: int, max_queue: int, name: str = "agent") -> None:
+        """初始化工作池，max_workers 為同時執行上限，max_queue 為等候中的請求上限"""
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _wrap(self, submitted: float, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """在工作執行緒中執行，記錄佇列等候時間並更新計數"""
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            observe_queue(self.name, self.queued, self.running, wait=time.perf_counter() - submitted)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                observe_queue(self.name, self.queued, self.running)
+
+    def start(self, func: Callable, *args: Any, **kwargs: Any) -> asyncio.Future:
+        """將同步函式送入工作池並回傳 asyncio Future（需在 event loop 內呼叫）；等候數已達上限時立即拋出 AgentPoolFull"""
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                observe_queue(self.name, self.queued, self.running, rejected=True)
+                raise AgentPoolFull(f"agent 佇列已滿（等候 {self.queued} 筆，上限 {self.max_queue}）")
+            self.queued += 1
+            observe_queue(self.name, self.queued, self.running)
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(self._wrap, time.perf_counter(), func, *args, **kwargs))
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """在工作池中執行同步函式並 await 結果；等候數已達上限時拋出 AgentPoolFull"""
+        return await self.start(func, *args, **kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        """回傳工作池狀態"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queued": self.queued,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+
+    def shutdown(self) -> None:
+        """關閉工作池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,154 @@
+"""
+agent/agent_stream.py - /agent/stream 的 Server-Sent Events：ReAct 迴圈執行中即送出每個步驟與最終回答的 token
+- AgentStreamCallback：LangChain 回呼（在 agent 工作執行緒觸發），將 Action / Observation / 最終回答 token 轉為事件
+- AgentEventStream：以 call_soon_threadsafe 將工作執行緒的事件交給 event loop，依序編碼為 SSE；閒置時送出 heartbeat 註解
+- 事件：start（開始）、action（thought / action / action_input）、observation（工具回傳的 Observation）、
+        token（最終回答片段，LLM 串流輸出 "Final Answer:" 之後的內容）、final（與 /agent 相同的完整結果）、error
+- 用戶端中斷連線時，下一次回呼拋出 AgentStreamCancelled 結束 ReAct 迴圈，釋放工作執行緒
+- replay_events：回答快取命中時，以相同事件格式送出已儲存的步驟與回答
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+from uuid import UUID
+import orjson
+from langchain_core.callbacks import BaseCallbackHandler
+from utils.api_response import select_fields
+from utils.metrics import observe_stage
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+
+class AgentStreamCancelled(Exception):
+    """用戶端已中斷串流連線"""
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> bytes:
+    """編碼單一 SSE 事件（data 為單行 JSON）"""
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+def wants_tokens(run_manager: Any) -> bool:
+    """本次 LLM 呼叫是否有串流回呼需要逐 token 輸出（沒有時維持一次性回應）"""
+    return run_manager is not None and any(isinstance(handler, AgentStreamCallback) for handler in run_manager.handlers)
+
+
+# =======================
+# LangChain 回呼：ReAct 步驟 → 事件
+# =======================
+class AgentStreamCallback(BaseCallbackHandler):
+    raise_error = True  # 讓 AgentStreamCancelled 中斷 agent 執行
+
+    def __init__(self, stream: "AgentEventStream") -> None:
+        """以 run_id 記錄每次 LLM 呼叫已輸出的內容與已送出的最終回答長度"""
+        self.stream = stream
+        self._buffers: Dict[UUID, str] = {}
+        self._sent: Dict[UUID, int] = {}
+
+    def _check_cancelled(self) -> None:
+        """用戶端已中斷時停止 agent"""
+        if self.stream.cancelled:
+            raise AgentStreamCancelled("用戶端已中斷串流連線")
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[Any], *, run_id: UUID, **kwargs: Any) -> None:
+        self._check_cancelled()
+        self._buffers[run_id] = ""
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._check_cancelled()
+        self._buffers[run_id] = ""
+
+    def on_llm_new_token(self, token: Any, *, chunk: Any = None, run_id: UUID, **kwargs: Any) -> None:
+        """累積 LLM 輸出，出現 "Final Answer:" 後將新增的回答內容送出"""
+        text = chunk.text if chunk is not None else str(token)
+        buffer = self._buffers.get(run_id, "") + text
+        self._buffers[run_id] = buffer
+        index = buffer.find(FINAL_ANSWER_MARKER)
+        if index < 0:
+            return
+        answer = buffer[index + len(FINAL_ANSWER_MARKER):].lstrip()
+        sent = self._sent.get(run_id, 0)
+        if len(answer) > sent:
+            self.stream.emit("token", {"text": answer[sent:]})
+            self._sent[run_id] = len(answer)
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._buffers.pop(run_id, None)
+        self._sent.pop(run_id, None)
+
+    def on_agent_action(self, action: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.stream.emit("action", {
+            "thought": action.log.split("\n")[0],
+            "action": action.tool,
+            "action_input": action.tool_input
+        })
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._check_cancelled()
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.stream.emit("observation", {"action": kwargs.get("name"), "observation": str(output)})
+
+
+# =======================
+# 回答快取命中：已儲存的結果 → SSE
+# =======================
+async def replay_events(query: str, result: Dict[str, Any], fields: Optional[List[str]] = None) -> AsyncIterator[bytes]:
+    """依序輸出已儲存結果的 action / observation / token 與 final 事件"""
+    yield format_sse("start", {"query": query})
+    for step in result.get("steps", []):
+        if "thought" in step and "action" in step:
+            yield format_sse("action", {key: step[key] for key in ("thought", "action", "action_input")})
+            yield format_sse("observation", {"action": step["action"], "observation": step.get("observation", "")})
+    yield format_sse("token", {"text": result.get("final_result", "")})
+    yield format_sse("final", select_fields(result, fields))
+
+
+# =======================
+# 工作執行緒事件 → SSE
+# =======================
+class AgentEventStream:
+    def __init__(self) -> None:
+        """需在 event loop 內建立"""
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.cancelled = False
+
+    def emit(self, event: str, data: Dict[str, Any]) -> None:
+        """工作執行緒呼叫：將事件交給 event loop（thread-safe）"""
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (event, data))
+
+    def callbacks(self) -> List[BaseCallbackHandler]:
+        """傳給 agent 的回呼"""
+        return [AgentStreamCallback(self)]
+
+    async def events(self, query: str, future: asyncio.Future, fields: Optional[List[str]] = None) -> AsyncIterator[bytes]:
+        """依序輸出事件直到 agent 執行結束，最後輸出 final（或 error）；future 為工作池中執行的 agent_flow"""
+        start = time.perf_counter()
+        first_event = True
+        future.add_done_callback(lambda _: self._queue.put_nowait(None))  # 在工作執行緒送出的所有事件之後
+        try:
+            yield format_sse("start", {"query": query})
+            while True:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=config.AGENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+                if item is None:
+                    break
+                if first_event:
+                    observe_stage("agent_first_event", time.perf_counter() - start)
+                    first_event = False
+                yield format_sse(*item)
+            try:
+                yield format_sse("final", select_fields(future.result(), fields))
+            except Exception as e:
+                yield format_sse("error", {"error": str(e)})
+        finally:
+            if not future.done():
+                print("⚠️ 用戶端中斷串流連線，停止 agent 執行")
+                self.cancelled = True
@@ -0,0 +1,209 @@
+"""
+agent/answer_cache.py - agent 回答快取：相同問題直接回傳已儲存的 steps 與最終回答，不再呼叫 Bedrock 與 retriever
+- 鍵：正規化後的問題（全半形統一、去除空白與標點、英文轉小寫，與預取比對相同）
+- 版本：每筆回答記錄其工具實際查詢的 collection 與當時的索引版本號（utils/index_version.py）；
+  indexer / summary 更新任一 collection 後版本號改變，讀取時視為過期並移除
+- 期限與淘汰：超過 AGENT_ANSWER_CACHE_TTL_SECONDS 過期；記憶體 LRU 上限 AGENT_ANSWER_CACHE_SIZE，
+  SQLite 持久層（AGENT_ANSWER_CACHE_PATH）依最後使用時間保留 AGENT_ANSWER_CACHE_DISK_SIZE 筆，重啟後仍可命中
+- 持久層讀寫在背景執行緒執行（utils/sqlite_store.py），過期與超量項目每 AGENT_ANSWER_CACHE_PRUNE_INTERVAL 秒淘汰一次
+- 只快取成功的回答：步驟中有錯誤、工具回傳錯誤（retriever 失敗）或達到迭代 / 時間上限而停止時不寫入
+- 未呼叫任何工具的回答記錄所有工具 collection 的版本，任一 collection 更新即失效
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from agent.prefetch import normalize_query
+from utils.metrics import count_answer_cache
+from utils.sqlite_store import SQLiteStore
+
+AGENT_STOPPED_MESSAGE = "Agent stopped due to iteration limit or time limit."  # LangChain AgentExecutor 達到上限時的回答
+
+
+def chunk_collection(folder: str) -> str:
+    """資料夾的 chunk collection 名稱（與 utils/collection_utils.resolve_collection 相同；agent 未安裝 qdrant-client）"""
+    return "chunk" if config.COLLECTION_LAYOUT == "single" else f"chunk_{folder}"
+
+def tool_collections() -> Dict[str, List[str]]:
+    """工具名稱 → 查詢的 collection 名稱（版本檔的鍵）；全資料夾搜尋工具對應所有工具資料夾"""
+    mapping = {spec["name"]: [chunk_collection(spec["collection"])] for spec in config.AGENT_SEARCH_TOOLS}
+    if config.AGENT_FANOUT_TOOL:
+        mapping[config.AGENT_FANOUT_TOOL["name"]] = sorted({name for names in mapping.values() for name in names})
+    return mapping
+
+def answer_collections(steps: List[Dict[str, Any]]) -> List[str]:
+    """回答過程中工具實際查詢的 collection；未呼叫工具時為所有工具 collection（回答仍可能因索引更新而改變）"""
+    mapping = tool_collections()
+    used = {name for step in steps for name in mapping.get(step.get("action"), [])}
+    return sorted(used or {name for names in mapping.values() for name in names})
+
+def is_cacheable(result: Dict[str, Any]) -> bool:
+    """成功完成、未達迭代 / 時間上限且工具未回傳錯誤的回答才快取"""
+    steps = result.get("steps", [])
+    final_result = str(result.get("final_result") or "")
+    if not final_result or final_result.startswith(AGENT_STOPPED_MESSAGE):
+        return False
+    if any("error" in step or step.get("stopped") for step in steps):
+        return False
+    return not any(str(step.get("observation", "")).startswith("❌") for step in steps)
+
+
+# =======================
+# agent 回答快取：記憶體 LRU + SQLite 持久層
+# =======================
+class AnswerCache:
+    def __init__(self, index_versions: Any, max_entries: int = config.AGENT_ANSWER_CACHE_SIZE, ttl: float = config.AGENT_ANSWER_CACHE_TTL_SECONDS,
+                 disk_path: Optional[str] = config.AGENT_ANSWER_CACHE_PATH, disk_max_entries: int = config.AGENT_ANSWER_CACHE_DISK_SIZE) -> None:
+        """初始化快取，index_versions 提供各 collection 目前的版本號；disk_path 為 None 時只使用記憶體"""
+        self.index_versions = index_versions
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()  # key -> (建立時間, {collection: 版本號}, 回答)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._disk = None
+        if disk_path and max_entries > 0:
+            try:
+                self._disk = SQLiteStore(
+                    disk_path,
+                    schema=[
+                        "CREATE TABLE IF NOT EXISTS agent_answer ("
+                        "key TEXT PRIMARY KEY, versions TEXT NOT NULL, result TEXT NOT NULL, "
+                        "created_at REAL NOT NULL, accessed_at REAL NOT NULL)",
+                        "CREATE INDEX IF NOT EXISTS agent_answer_accessed_at ON agent_answer (accessed_at)",
+                        "CREATE INDEX IF NOT EXISTS agent_answer_created_at ON agent_answer (created_at)"
+                    ],
+                    name="answer-cache",
+                    prune=self._prune,
+                    prune_interval=config.AGENT_ANSWER_CACHE_PRUNE_INTERVAL
+                )
+                print(f"✅ agent 回答快取持久層已開啟：{disk_path}")
+            except Exception as e:
+                print(f"⚠️ agent 回答快取持久層開啟失敗，僅使用記憶體: {str(e)}")
+                self._disk = None
+
+    def _remember(self, key: str, entry: Tuple[float, Dict[str, int], Dict[str, Any]]) -> None:
+        """寫入記憶體 LRU，超過上限時淘汰最久未使用的項目（呼叫端需持有鎖）"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        """刪除過期項目，超過上限時刪除最久未使用的項目（背景執行緒定期執行，以 created_at / accessed_at 索引查找）"""
+        conn.execute("DELETE FROM agent_answer WHERE created_at < ?", (time.time() - self.ttl,))
+        if self.disk_max_entries > 0:
+            conn.execute(
+                "DELETE FROM agent_answer WHERE accessed_at <= ("
+                "SELECT accessed_at FROM agent_answer ORDER BY accessed_at DESC LIMIT 1 OFFSET ?)",
+                (self.disk_max_entries,)
+            )
+
+    def _forget(self, key: str) -> None:
+        """移除過期項目（呼叫端需持有鎖；持久層排入背景執行緒刪除）"""
+        self._memory.pop(key, None)
+        if self._disk is not None:
+            self._disk.write(("DELETE FROM agent_answer WHERE key = ?", (key,)))
+
+    async def _load(self, key: str) -> Optional[Tuple[float, Dict[str, int], Dict[str, Any]]]:
+        """從記憶體或持久層取出項目；持久層於背景執行緒讀取，不阻塞 event loop"""
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is not None or self._disk is None:
+            return entry
+        row = await self._disk.fetchone("SELECT created_at, versions, result FROM agent_answer WHERE key = ?", (key,))
+        if row is None:
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        return row[0], json.loads(row[1]), json.loads(row[2])
+
+    async def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """查詢快取；過期或所用 collection 的版本號已改變時移除並回傳 None"""
+        if self.max_entries <= 0:
+            return None
+        key = normalize_query(question)
+        if not key:
+            return None
+        entry = await self._load(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                count_answer_cache("miss")
+                return None
+            created_at, versions, result = entry
+            if time.time() - created_at > self.ttl:
+                self._forget(key)
+                self.expirations += 1
+                self.misses += 1
+                count_answer_cache("expired")
+                return None
+            if any(self.index_versions.get(collection) != version for collection, version in versions.items()):
+                self._forget(key)
+                self.invalidations += 1
+                self.misses += 1
+                count_answer_cache("invalidated")
+                return None
+            self._remember(key, entry)
+            if self._disk is not None:
+                self._disk.write(("UPDATE agent_answer SET accessed_at = ? WHERE key = ?", (time.time(), key)))
+            self.hits += 1
+            count_answer_cache("hit")
+            return {**result, "query": question, "cached": True}
+
+    def put(self, question: str, result: Dict[str, Any], versions: Dict[str, int]) -> None:
+        """
+        寫入快取；versions 應為 agent 執行前讀到的版本快照，避免執行期間索引更新造成誤用
+        記憶體立即生效，持久層排入背景執行緒寫入（可於 event loop 或 done callback 中呼叫）
+        """
+        if self.max_entries <= 0 or not is_cacheable(result):
+            return
+        key = normalize_query(question)
+        if not key:
+            return
+        used_versions = {collection: versions.get(collection, 0) for collection in answer_collections(result.get("steps", []))}
+        stored = {field: value for field, value in result.items() if field != "query"}
+        now = time.time()
+        with self._lock:
+            self._remember(key, (now, used_versions, stored))
+        if self._disk is not None:
+            self._disk.write((
+                "INSERT OR REPLACE INTO agent_answer (key, versions, result, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(used_versions), json.dumps(stored, ensure_ascii=False), now, now)
+            ))
+        print(f"💾 回答已快取：{question} | collection 版本 {used_versions}")
+
+    def close(self) -> None:
+        """等待持久層寫入完成並關閉"""
+        if self._disk is not None:
+            self._disk.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """回傳快取統計資訊"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
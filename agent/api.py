@@ -1,12 +1,42 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
-from agent_pipeline import agent_flow 
+from typing import Any, Dict, List, Optional
+from agent_pipeline import agent_flow, get_agent
+from agent_pool import AgentWorkerPool, AgentPoolFull
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+from utils.api_response import encode_response, select_fields, add_compression
+from utils.metrics import set_service, add_metrics_route
+from agent.agent_stream import AgentEventStream, replay_events
+from agent.answer_cache import AnswerCache
+from utils.index_version import IndexVersions
+
+# =======================
+# 啟動時建立共用的 agent、工作池與回答快取
+# =======================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("🔄 建立共用 MRKL Agent...")
+    app.state.agent = get_agent()
+    app.state.answer_cache = AnswerCache(index_versions=IndexVersions())
+    # ReAct 迴圈（LLM 與工具呼叫皆為同步）在工作池執行，event loop 可同時接收其他請求
+    app.state.agent_pool = AgentWorkerPool(config.AGENT_MAX_CONCURRENCY, config.AGENT_MAX_QUEUE)
+    print(f"✅ agent 工作池啟動：同時執行 {config.AGENT_MAX_CONCURRENCY} 筆，最多等候 {config.AGENT_MAX_QUEUE} 筆")
+    yield
+    app.state.agent_pool.shutdown()
+    app.state.answer_cache.close()
 
 # =======================
 # 初始化 FastAPI 應用
 # =======================
-app = FastAPI(title="MRKL Agent API")
+app = FastAPI(title="MRKL Agent API", lifespan=lifespan, default_response_class=ORJSONResponse)
+add_compression(app)
+set_service("agent")
+add_metrics_route(app)  # GET /metrics：LLM / 工具呼叫耗時直方圖（Prometheus text format）
 
 # =======================
 # 定義 API 查詢請求模型
@@ -14,20 +44,74 @@ app = FastAPI(title="MRKL Agent API")
 class QueryRequest(BaseModel):
     """使用者查詢請求格式"""
     query: str  # 查詢內容
+    fields: Optional[List[str]] = None  # 回應欄位（query / steps / final_result / observation_tokens / cached），None 表示全部
+    use_cache: bool = True  # False 時不讀取回答快取，重新執行 agent（結果仍會寫入快取）
+
+def cache_answer(cache: AnswerCache, query: str, versions: Dict[str, int], future: Any) -> None:
+    """串流請求的 agent 執行完成後寫入回答快取（future 的 done callback）"""
+    if not future.cancelled() and future.exception() is None:
+        cache.put(query, future.result(), versions)
 
 # =======================
 # API 路由設定
 # =======================
+@app.get("/health")
+async def health(request: Request) -> Dict[str, Any]:
+    """健康檢查：不經過 agent，工作池忙碌時仍可立即回應"""
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "agent_pool": request.app.state.agent_pool.stats()
+    }
+
+@app.get("/cache/stats")
+async def cache_stats(request: Request) -> Dict[str, Any]:
+    """回傳回答快取統計資訊，用於評估快取大小與 TTL"""
+    return request.app.state.answer_cache.stats()
+
 @app.post("/agent")
-async def ask_agent(req: QueryRequest) -> Dict[str, Any]:
-    """處理 Agent 查詢請求並返回結果"""
+async def ask_agent(req: QueryRequest, request: Request) -> Response:
+    """處理 Agent 查詢請求並返回結果（orjson JSON，或依 Accept 標頭回傳 MessagePack）；回答快取命中時直接返回，等候中的請求已滿時回傳 503"""
+    cache = request.app.state.answer_cache
+    cached = await cache.get(req.query) if req.use_cache else None
+    if cached is not None:
+        return encode_response(request, select_fields(cached, req.fields))
     try:
-        result_dict = agent_flow(
-            req.query
+        versions = cache.index_versions.snapshot()  # 執行前的索引版本，執行期間索引更新時此回答會在下次讀取時失效
+        result_dict = await request.app.state.agent_pool.run(
+            agent_flow, req.query, request.app.state.agent
         )
-        return result_dict
+        cache.put(req.query, result_dict, versions)
+        return encode_response(request, select_fields(result_dict, req.fields))
+    except AgentPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        return {"error": str(e)}
+        return encode_response(request, {"error": str(e)})
+
+@app.post("/agent/stream")
+async def ask_agent_stream(req: QueryRequest, request: Request) -> StreamingResponse:
+    """以 Server-Sent Events 串流 Agent 執行過程：每個步驟發生時即送出，最終回答逐 token 送出，最後為與 /agent 相同的 final 事件
+    回答快取命中時以相同事件格式一次送出已儲存的步驟與回答"""
+    cache = request.app.state.answer_cache
+    cached = await cache.get(req.query) if req.use_cache else None
+    if cached is not None:
+        events = replay_events(req.query, cached, req.fields)
+    else:
+        stream = AgentEventStream()
+        versions = cache.index_versions.snapshot()
+        try:
+            future = request.app.state.agent_pool.start(
+                agent_flow, req.query, request.app.state.agent, stream.callbacks()
+            )
+        except AgentPoolFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        future.add_done_callback(lambda done: cache_answer(cache, req.query, versions, done))
+        events = stream.events(req.query, future, req.fields)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # 避免代理伺服器緩衝事件
+    )
 
 
 # =======================
@@ -37,6 +121,8 @@ async def ask_agent(req: QueryRequest) -> Dict[str, Any]:
 result_dict = {
     "query": query,
     "steps": steps,
-    "final_result": final_answer
+    "final_result": final_answer,
+    "observation_tokens": {...},
+    "cached": True  # 僅回答快取命中時
 }
 """
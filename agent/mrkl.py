@@ -2,55 +2,95 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config as config
-from typing import List, Tuple, Dict
-from langchain.tools import Tool
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, List, Optional, Tuple, Dict
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import generate_from_stream
+from langchain_core.outputs import ChatResult
 from langchain.agents import initialize_agent, AgentType
 from langchain_aws import ChatBedrockConverse
-from agent.search_tools import search_customer_policy, search_form, search_medical, search_product
+from agent.search_tools import build_batch_items, build_search_tools
+from agent.prefetch import prefetch_scope
+from agent.agent_stream import wants_tokens
+from agent.retriever_client import RetrieverClient, deadline_scope
+from utils.metrics import observe_stage
 
 
 # =======================
-# MRKL Agent 類別：四個資料夾分別設定四個搜索工具
+# LLM 呼叫耗時：LangChain 回呼在每次 LLM 呼叫開始 / 結束時觸發，寫入 llm_call 階段指標
+# =======================
+class LLMLatencyCallback(BaseCallbackHandler):
+    def __init__(self):
+        """以 run_id 對應每次 LLM 呼叫的開始時間"""
+        self._start_times = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[Any], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start_times[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start_times[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        start = self._start_times.pop(run_id, None)
+        if start is not None:
+            observe_stage("llm_call", time.perf_counter() - start)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        start = self._start_times.pop(run_id, None)
+        if start is not None:
+            observe_stage("llm_call", time.perf_counter() - start, error=True)
+
+
+# =======================
+# Bedrock LLM：/agent/stream 時改以 converse_stream 呼叫，回應逐段觸發 on_llm_new_token
+# =======================
+class StreamingChatBedrockConverse(ChatBedrockConverse):
+    def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        """有串流回呼時以 converse_stream 產生回應（完整內容與 converse 相同），否則維持一次性呼叫"""
+        if not wants_tokens(run_manager):
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        chunks = []
+        for chunk in self._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            chunks.append(chunk)
+        return generate_from_stream(iter(chunks))
+
+
+# =======================
+# MRKL Agent 類別：依 config.AGENT_SEARCH_TOOLS 為每個資料夾設定搜索工具
 # =======================
 class MRKLAgent:
     def __init__(self):
-        """初始化 MRKL Agent，使用 Amazon Bedrock LLM"""
+        """初始化 MRKL Agent，使用 Amazon Bedrock LLM（config.LLM_BACKEND = "stub" 時改用本地假 LLM）"""
         print("🚀 Initializing MRKLAgent")
         try:
-            self.llm = ChatBedrockConverse(
-                model_id=config.BEDROCK_MODEL_ID,
-                max_tokens=config.MAX_TOKENS,
-                temperature=config.TEMPERATURE,
-                top_p=config.TOP_P,
-            )
-            print("✅ Bedrock LLM initialized successfully")
+            if config.LLM_BACKEND == "stub":
+                # 本地壓測：不呼叫 Bedrock，以固定延遲回覆 ReAct 格式
+                from agent.stub_llm import StubReActChatModel
+                self.llm = StubReActChatModel(callbacks=[LLMLatencyCallback()])
+                print("✅ Stub LLM initialized successfully")
+            else:
+                self.llm = StreamingChatBedrockConverse(
+                    model_id=config.BEDROCK_MODEL_ID,
+                    max_tokens=config.MAX_TOKENS,
+                    temperature=config.TEMPERATURE,
+                    top_p=config.TOP_P,
+                    callbacks=[LLMLatencyCallback()]
+                )
+                print("✅ Bedrock LLM initialized successfully")
         except Exception as e:
             print("❌ Failed to initialize Bedrock LLM:", str(e))
         self._setup_tools()
         self._setup_agent()       
     
     def _setup_tools(self) -> None:
-        """設置工具"""
-        self.search_form_tool = Tool(
-            name="Form Search",
-            func=search_form,
-            description="搜索「申請書、表單、聲明書」的collection"
-        )
-        self.search_product_tool = Tool(
-            name="Product Search",
-            func=search_product,
-            description="搜索「商品、行銷」的collection"
-        )
-        self.search_policy_tool = Tool(
-            name="Customer Policy Search",
-            func=search_customer_policy,
-            description="搜索「客戶服務、理賠、契約變更」的collection"
-        )
-        self.search_medical_tool = Tool(
-            name="Medical Search",
-            func=search_medical,
-            description="搜索「投保、核保、醫務」的collection"
-        )
+        """設置工具：所有工具共用同一個 retriever client（keep-alive 連線池）；預取在獨立的執行緒池執行"""
+        self.retriever_client = RetrieverClient()
+        self.tools = build_search_tools(self.retriever_client)
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=config.AGENT_MAX_CONCURRENCY, thread_name_prefix="prefetch")
     
     def _setup_agent(self) -> None:
         """設置 Agent"""
@@ -58,12 +98,7 @@ class MRKLAgent:
         try:
             # 初始化 agent 設定
             self.agent = initialize_agent(
-                tools=[
-                    self.search_form_tool,
-                    self.search_product_tool,
-                    self.search_policy_tool,
-                    self.search_medical_tool
-                ],
+                tools=self.tools,
                 llm=self.llm,
                 agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
                 agent_kwargs={
@@ -80,12 +115,17 @@ class MRKLAgent:
         except Exception as e:
             print("❌ Failed to set up MRKL Agent:", str(e))
 
-    def query(self, question: str) -> Tuple[List[Dict[str, str]], str]:
-        """處理查詢，返回中間步驟和最終答案"""
+    def query(self, question: str, callbacks: Optional[List[BaseCallbackHandler]] = None) -> Tuple[List[Dict[str, str]], str]:
+        """處理查詢，返回中間步驟和最終答案；callbacks 為本次執行額外的 LangChain 回呼（例如 /agent/stream 的事件輸出）"""
         try:
             print("🚀 Invoking MRKL Agent")
-            # 呼叫 agent
-            response = self.agent.invoke({"input": question})
+            start = time.perf_counter()
+            # 呼叫 agent：工具呼叫的逾時不超過本次執行的剩餘時間；開啟預取時，第一次 LLM 呼叫期間同時檢索所有資料夾
+            with ExitStack() as stack:
+                stack.enter_context(deadline_scope(config.max_execution_time))
+                if config.AGENT_PREFETCH:
+                    stack.enter_context(prefetch_scope(self.prefetch_executor, self.retriever_client, question, build_batch_items(question)))
+                response = self.agent.invoke({"input": question}, config={"callbacks": callbacks} if callbacks else None)
             print("✅ MRKL Agent invocation successful")
             print(f"Response: {response} | Type: {type(response)}")
             print(f"Intermediate Steps: {response.get('intermediate_steps'[0])}")
@@ -103,6 +143,9 @@ class MRKLAgent:
             final_step = {
                 "final_answer": response.get("output", "未能獲取回答")
             }
+            # 達到迭代次數或執行時間上限：回答為停止訊息或強制產生的內容，標記後不寫入回答快取
+            if len(inter_steps) >= config.max_iterations or time.perf_counter() - start >= config.max_execution_time:
+                final_step["stopped"] = True
             inter_steps.append(final_step)
             return inter_steps, final_step["final_answer"]
         except Exception as e:
@@ -0,0 +1,170 @@
+"""
+agent/observation_packer.py - 將 retriever 回傳的 chunk 打包成有 token 額度的 Observation
+- 去重：以行為單位（忽略空白），已出現過的段落不再重複放入（同一文件重複索引、不同文件共用的條款範本、表格與內文重複）
+- 合併：同一 (filename, page) 的多個片段合併為一份文件，分數取最高者
+- 額度：依分數由高到低放入文件，直到單次 Observation 上限（AGENT_OBSERVATION_TOKEN_BUDGET）或本次執行剩餘額度
+  （AGENT_RUN_TOKEN_BUDGET，observation_budget 以 contextvar 在同一次 agent 執行的工具呼叫間共用）；最後一份文件截斷至剩餘額度
+- tokens 以字元估算：CJK 字元每字 1 token，其他字元每 4 字 1 token
+- 每次打包前後的估算 tokens 累計於 ObservationBudget（agent 回應的 observation_tokens）與 Prometheus 指標
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from utils.metrics import count_observation_tokens
+
+SEPARATOR = "------------------------------------------------------------"  # 前端以此分隔 Observation 中的文件
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+TRUNCATED_SUFFIX = "…（截斷）"
+OMITTED_NOTICE = "（另有 {count} 份相關度較低的文件因長度限制省略）"
+_run_budget: ContextVar[Optional["ObservationBudget"]] = ContextVar("observation_budget", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 tokens：CJK 字元每字 1 token，其他字元每 4 字 1 token"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截斷文字使估算 tokens 不超過 max_tokens"""
+    used = 0.0
+    for i, char in enumerate(text):
+        used += 1 if CJK_PATTERN.match(char) else 0.25
+        if used > max_tokens:
+            return text[:i]
+    return text
+
+
+# =======================
+# 單次 agent 執行的 Observation 額度
+# =======================
+class ObservationBudget:
+    def __init__(self, run_tokens: int) -> None:
+        """初始化本次執行的額度與統計"""
+        self.run_tokens = run_tokens
+        self.observations = 0
+        self.raw_tokens = 0
+        self.packed_tokens = 0
+        self._lock = threading.Lock()
+
+    def allowance(self) -> int:
+        """下一次 Observation 可使用的 tokens：單次上限與本次執行剩餘額度的較小值"""
+        with self._lock:
+            return max(0, min(config.AGENT_OBSERVATION_TOKEN_BUDGET, self.run_tokens - self.packed_tokens))
+
+    def record(self, raw_tokens: int, packed_tokens: int) -> None:
+        """記錄一次 Observation 打包前後的 tokens"""
+        with self._lock:
+            self.observations += 1
+            self.raw_tokens += raw_tokens
+            self.packed_tokens += packed_tokens
+
+    def report(self) -> Dict[str, int]:
+        """回傳本次執行的 Observation tokens 統計"""
+        with self._lock:
+            return {
+                "observations": self.observations,
+                "raw_tokens": self.raw_tokens,
+                "packed_tokens": self.packed_tokens,
+                "saved_tokens": self.raw_tokens - self.packed_tokens
+            }
+
+@contextmanager
+def observation_budget(run_tokens: int = config.AGENT_RUN_TOKEN_BUDGET) -> Iterator[ObservationBudget]:
+    """設定本次 agent 執行的 Observation 額度（同一執行緒 / asyncio task 內的工具呼叫共用）"""
+    budget = ObservationBudget(run_tokens)
+    token = _run_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _run_budget.reset(token)
+
+
+# =======================
+# 格式化與打包
+# =======================
+def format_results(results: List[Dict[str, Any]]) -> str:
+    """完整格式：每個 chunk 全文（不打包時使用，也作為計算節省 tokens 的基準）"""
+    formatted_results = []
+    for i, result in enumerate(results, 1):
+        formatted = (
+            f"📄 文件 {i}\n"
+            f"   來源: {result.get('filename', '未知')} (第{result.get('page', 'N/A')}頁)\n"
+            f"   相似度: {result.get('similarity_score', 0):.3f}\n"
+            f"   完整內容: {result.get('full_content', '').strip()}\n"
+            f"{SEPARATOR}"
+        )
+        formatted_results.append(formatted)
+    return "\n".join(formatted_results)
+
+def merge_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """依分數由高到低合併同一 (filename, page) 的片段，並去除已出現過的段落；回傳依最高分排序的文件"""
+    documents = {}
+    seen_lines = set()
+    for result in sorted(results, key=lambda x: x.get("similarity_score", 0), reverse=True):
+        key = (result.get("filename", "未知"), result.get("page", "N/A"))
+        document = documents.setdefault(key, {"filename": key[0], "page": key[1], "score": result.get("similarity_score", 0), "hits": 0, "lines": []})
+        document["hits"] += 1
+        for line in result.get("full_content", "").split("\n"):
+            normalized = WHITESPACE_PATTERN.sub("", line)
+            if normalized and normalized not in seen_lines:
+                seen_lines.add(normalized)
+                document["lines"].append(line.strip())
+    return [document for document in documents.values() if document["lines"]]
+
+def pack_results(results: List[Dict[str, Any]], max_tokens: int) -> str:
+    """將合併後的文件依分數放入 Observation，直到 max_tokens；省略的文件數附在最後（預留其長度）"""
+    documents = merge_results(results)
+    blocks, used = [], estimate_tokens(OMITTED_NOTICE.format(count=len(documents)))
+    for i, document in enumerate(documents, 1):
+        hits = f"，{document['hits']} 個片段" if document["hits"] > 1 else ""
+        header = (
+            f"📄 文件 {i}\n"
+            f"   來源: {document['filename']} (第{document['page']}頁{hits})\n"
+            f"   相似度: {document['score']:.3f}\n"
+            f"   內容: "
+        )
+        content = "\n".join(document["lines"])
+        overhead = estimate_tokens(header) + estimate_tokens(SEPARATOR) + 1
+        remaining = max_tokens - used - overhead
+        if remaining < config.AGENT_OBSERVATION_MIN_TOKENS and blocks:
+            break
+        content_tokens = estimate_tokens(content)
+        truncated = content_tokens > remaining
+        if truncated:
+            content = truncate_to_tokens(content, max(remaining - estimate_tokens(TRUNCATED_SUFFIX), 0)) + TRUNCATED_SUFFIX
+        blocks.append(f"{header}{content}\n{SEPARATOR}")
+        used += overhead + min(content_tokens, max(remaining, 0))
+        if truncated:
+            break
+    omitted = len(documents) - len(blocks)
+    if omitted:
+        blocks.append(OMITTED_NOTICE.format(count=omitted))
+    return "\n".join(blocks)
+
+def pack_observation(results: List[Dict[str, Any]]) -> str:
+    """retriever 結果 → Observation 文字；依本次執行剩餘額度打包，並記錄打包前後的 tokens"""
+    if not results:
+        return "沒有找到相關文件。"
+    raw_text = format_results(results)
+    raw_tokens = estimate_tokens(raw_text)
+    budget = _run_budget.get()
+    allowance = budget.allowance() if budget is not None else config.AGENT_OBSERVATION_TOKEN_BUDGET
+    if not config.AGENT_OBSERVATION_PACKING:
+        text = raw_text
+    elif allowance < config.AGENT_OBSERVATION_MIN_TOKENS:
+        text = "本次查詢的檢索內容已達長度上限，請根據已取得的資料回答。"
+    else:
+        text = pack_results(results, allowance)
+    packed_tokens = estimate_tokens(text)
+    if budget is not None:
+        budget.record(raw_tokens, packed_tokens)
+    count_observation_tokens(raw_tokens, packed_tokens)
+    print(f"📦 Observation：{len(results)} 個片段 | 約 {raw_tokens} → {packed_tokens} tokens（額度 {allowance}）")
+    return text
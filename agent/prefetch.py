@@ -0,0 +1,114 @@
+"""
+agent/prefetch.py - 推測式預取：問題進來時即以原始問題對所有 collection 發出 /retrieve/batch，與第一次 LLM Thought 同時進行
+- prefetch_scope 於 agent 執行緒設定本次執行的預取（contextvar，與 deadline_scope 相同）；預取在 prefetch 執行緒池執行，
+  複製目前的 contextvar，retriever 呼叫同樣受 agent 剩餘時間限制
+- 工具呼叫的 Action Input 與原始問題正規化後相同（忽略全半形、大小寫、空白與標點）時直接使用預取結果，不同時照常呼叫 retriever
+- 預取命中 / 未命中 / 未使用 / 失敗次數寫入 Prometheus（rag_agent_prefetch_total）
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import asyncio
+import re
+import unicodedata
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Dict, Iterator, List, Optional
+from agent.retriever_client import RetrieverClient, remaining_time
+from utils.metrics import count_prefetch
+
+NORMALIZE_PATTERN = re.compile(r"[\W_]+")
+_current: ContextVar[Optional["RetrievalPrefetch"]] = ContextVar("retrieval_prefetch", default=None)
+
+
+def normalize_query(query: str) -> str:
+    """比對用的查詢字串：全半形統一、去除空白與標點、轉小寫"""
+    return NORMALIZE_PATTERN.sub("", unicodedata.normalize("NFKC", str(query))).lower()
+
+def group_batch_results(batch: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """/retrieve/batch 回應 → {collection: results}；發生錯誤的項目不列入（改由工具重新呼叫）"""
+    grouped = {}
+    for item in batch.get("results", []):
+        if "error" in item:
+            print(f"⚠️ 批次檢索項目失敗: {item.get('collection')} | {item['error']}")
+            continue
+        grouped[item.get("collection")] = item.get("results", [])
+    return grouped
+
+
+# =======================
+# 單次 agent 執行的預取
+# =======================
+class RetrievalPrefetch:
+    def __init__(self, query: str, future: Future) -> None:
+        """記錄預取的問題與執行中的 /retrieve/batch"""
+        self.key = normalize_query(query)
+        self.future = future
+        self.hits = 0
+        self.misses = 0
+
+    def _record(self, hit: bool) -> None:
+        """記錄工具呼叫是否使用預取"""
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        count_prefetch("hit" if hit else "miss")
+
+    def _timeout(self) -> float:
+        """等候預取的上限：agent 剩餘時間，未設定時為 RETRIEVER_TIMEOUT_SECONDS"""
+        remaining = remaining_time()
+        return config.RETRIEVER_TIMEOUT_SECONDS if remaining is None else max(remaining, 0)
+
+    def get(self, query: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """查詢與預取問題相同時等候並回傳預取結果；不同或預取失敗時回傳 None"""
+        if normalize_query(query) != self.key:
+            self._record(False)
+            return None
+        try:
+            grouped = group_batch_results(self.future.result(timeout=self._timeout()))
+        except Exception as e:
+            print(f"⚠️ 預取失敗，改為直接呼叫 retriever: {type(e).__name__}: {str(e)}")
+            count_prefetch("error")
+            return None
+        self._record(True)
+        return grouped
+
+    async def aget(self, query: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """get 的非同步版本：以 asyncio 等候預取，不阻塞 event loop"""
+        if normalize_query(query) != self.key:
+            self._record(False)
+            return None
+        try:
+            batch = await asyncio.wait_for(asyncio.wrap_future(self.future), timeout=self._timeout())
+        except Exception as e:
+            print(f"⚠️ 預取失敗，改為直接呼叫 retriever: {type(e).__name__}: {str(e)}")
+            count_prefetch("error")
+            return None
+        self._record(True)
+        return group_batch_results(batch)
+
+@contextmanager
+def prefetch_scope(executor: Executor, client: RetrieverClient, query: str, items: List[Dict[str, Any]]) -> Iterator[RetrievalPrefetch]:
+    """開始預取並設定為本次 agent 執行的預取；離開時取消尚未開始的預取，並記錄未被使用的預取"""
+    prefetch = RetrievalPrefetch(query, executor.submit(copy_context().run, client.retrieve_batch, items))
+    token = _current.set(prefetch)
+    try:
+        yield prefetch
+    finally:
+        _current.reset(token)
+        prefetch.future.cancel()
+        if prefetch.hits == 0:
+            count_prefetch("unused")
+
+def get_prefetched(query: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """本次執行有預取且查詢相同時回傳 {collection: results}，否則回傳 None"""
+    prefetch = _current.get()
+    return None if prefetch is None else prefetch.get(query)
+
+async def aget_prefetched(query: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """get_prefetched 的非同步版本"""
+    prefetch = _current.get()
+    return None if prefetch is None else await prefetch.aget(query)
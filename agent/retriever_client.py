@@ -0,0 +1,156 @@
+"""
+agent/retriever_client.py - agent 呼叫 retriever /retrieve、/retrieve/batch 的 HTTP client（同步 / 非同步）
+- keep-alive 連線池：同步為 requests.Session（HTTPAdapter 連線池，可由 agent 工作池的多個執行緒共用），非同步為 httpx.AsyncClient；
+  連線數上限 RETRIEVER_POOL_SIZE，超過時等候可用連線
+- 逾時：連線 RETRIEVER_CONNECT_TIMEOUT_SECONDS；讀取取 RETRIEVER_TIMEOUT_SECONDS 與 agent 剩餘時間（deadline_scope）的較小值
+- 重試：連線失敗、逾時與 502 / 503 / 504 最多重試 RETRIEVER_MAX_RETRIES 次，指數退避加隨機 jitter（full jitter），
+  不會等候超過 agent 剩餘時間；其他 4xx / 5xx 不重試
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS_CODES = {502, 503, 504}
+_deadline: ContextVar[Optional[float]] = ContextVar("agent_deadline", default=None)
+
+
+class RetrieverError(Exception):
+    """重試後仍無法取得 retriever 回應，或 agent 剩餘時間不足"""
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """設定本次 agent 執行的截止時間（contextvar：同一執行緒 / 同一 asyncio task 內的工具呼叫共用）"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_time() -> Optional[float]:
+    """agent 剩餘時間（秒），未設定截止時間時為 None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# =======================
+# Retriever client
+# =======================
+class RetrieverClient:
+    def __init__(self, base_url: str = config.RETRIEVER_URL, pool_size: int = config.RETRIEVER_POOL_SIZE,
+                 timeout: float = config.RETRIEVER_TIMEOUT_SECONDS, connect_timeout: float = config.RETRIEVER_CONNECT_TIMEOUT_SECONDS,
+                 max_retries: int = config.RETRIEVER_MAX_RETRIES, backoff: float = config.RETRIEVER_RETRY_BACKOFF_SECONDS) -> None:
+        """初始化連線池；非同步 client 於第一次 aretrieve 時建立（需在 event loop 內）"""
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=True)  # 連線池滿時等候，不另開臨時連線
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._async_client = None
+
+    def _read_timeout(self) -> float:
+        """本次呼叫的讀取逾時：不超過 agent 剩餘時間"""
+        remaining = remaining_time()
+        if remaining is None:
+            return self.timeout
+        if remaining <= 0:
+            raise RetrieverError("agent 已達執行時間上限，不再呼叫 retriever")
+        return min(self.timeout, remaining)
+
+    def _retry_delay(self, attempt: int) -> Optional[float]:
+        """第 attempt 次重試前的等候時間（full jitter）；已無重試次數或剩餘時間不足時回傳 None"""
+        if attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, self.backoff * 2 ** attempt)
+        remaining = remaining_time()
+        if remaining is not None and remaining <= delay + self.connect_timeout:
+            return None
+        return delay
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """同步 POST，失敗時依設定重試，回傳回應 JSON"""
+        attempt = 0
+        while True:
+            try:
+                response = self._session.post(f"{self.base_url}{path}", json=payload, timeout=(self.connect_timeout, self._read_timeout()))
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()
+                error = f"Retriever API returned status code {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            except requests.HTTPError as e:
+                raise RetrieverError(f"Retriever API returned status code {e.response.status_code}") from e
+            delay = self._retry_delay(attempt)
+            if delay is None:
+                raise RetrieverError(f"{error}（已重試 {attempt} 次）")
+            print(f"⚠️ retriever 呼叫失敗，{delay:.2f} 秒後重試（第 {attempt + 1} 次）: {error}")
+            time.sleep(delay)
+            attempt += 1
+
+    async def _apost(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """非同步 POST，失敗時依設定重試，回傳回應 JSON"""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size))
+        attempt = 0
+        while True:
+            try:
+                response = await self._async_client.post(
+                    f"{self.base_url}{path}", json=payload,
+                    timeout=httpx.Timeout(self._read_timeout(), connect=self.connect_timeout)
+                )
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()
+                error = f"Retriever API returned status code {response.status_code}"
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            except httpx.HTTPStatusError as e:
+                raise RetrieverError(f"Retriever API returned status code {e.response.status_code}") from e
+            delay = self._retry_delay(attempt)
+            if delay is None:
+                raise RetrieverError(f"{error}（已重試 {attempt} 次）")
+            print(f"⚠️ retriever 呼叫失敗，{delay:.2f} 秒後重試（第 {attempt + 1} 次）: {error}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def retrieve(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """同步呼叫 POST /retrieve"""
+        return self._post("/retrieve", payload)
+
+    def retrieve_batch(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """同步呼叫 POST /retrieve/batch：多個 collection 在 retriever 端同時檢索，查詢向量只計算一次"""
+        return self._post("/retrieve/batch", {"items": items})
+
+    async def aretrieve(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """非同步呼叫 POST /retrieve"""
+        return await self._apost("/retrieve", payload)
+
+    async def aretrieve_batch(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """非同步呼叫 POST /retrieve/batch"""
+        return await self._apost("/retrieve/batch", {"items": items})
+
+    def close(self) -> None:
+        """關閉同步連線池"""
+        self._session.close()
+
+    async def aclose(self) -> None:
+        """關閉非同步連線池"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
@@ -2,182 +2,116 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config as config
-import requests
+from utils.metrics import timed, stage_timer
+from agent.retriever_client import RetrieverClient, RetrieverError
+from agent.observation_packer import pack_observation
+from agent.prefetch import aget_prefetched, get_prefetched, group_batch_results
 import time
 from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+from langchain.tools import Tool
 
-# HOST = "retriever" # 雲端
-HOST = "localhost"   # 本地
 
-def search_form(query: str) -> str:
-    """ 
-    1. 搜索「其他各項表單」（chunk_other）
-    """
-    try:
-        print(f"🔍 問題：{query} | Collection: chunk_other | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        search_start = time.time()
-        # 呼叫 Retriever API
-        response = requests.post(
-            f"http://{HOST}:8000/retrieve",
-            json={
-                "query": query,
-                "top_k": config.TOP_K,
-                "threshold": config.THRESHOLD_SCORE,
-                "search_type": "chunk",
-                "collection": "other"
-            }
-        )
-        # 處理回應
-        if response.status_code == 200:
-            results = response.json().get("results", [])
-            if not results:
-                return "沒有找到相關文件。"
-            elapsed = round(time.time() - search_start, 4)
-            print(f"✅ 搜尋結果返回，處理 format | 耗時：{elapsed} 秒")
-            #  格式化結果
-            formatted_results = []
-            for i, result in enumerate(results, 1):
-                formatted = (
-                    f"📄 文件 {i}\n"
-                    f"   來源: {result.get('filename', '未知')} (第{result.get('page', 'N/A')}頁)\n"
-                    f"   相似度: {result.get('similarity_score', 0):.3f}\n"
-                    f"   完整內容: {result.get('full_content', '').strip()}\n"
-                    "------------------------------------------------------------"
-                )
-                formatted_results.append(formatted)
-            print(f"✅ 格式化完成 | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            return "\n".join(formatted_results)
-        else:
-            return f"❌ Error: Retriever API returned status code {response.status_code}"
-    except Exception as e:
-        return f"❌ Exception: {str(e)}"
+def build_payload(query: str, collection: str) -> Dict[str, Any]:
+    """工具呼叫的 /retrieve 請求內容（chunk 搜尋、accurate 模式）"""
+    return {
+        "query": query,
+        "top_k": config.TOP_K,
+        "threshold_score": config.THRESHOLD_SCORE,
+        "search_type": "chunk",
+        "fields": config.AGENT_TOOL_FIELDS,
+        "mode": "accurate",
+        "collection": collection
+    }
 
-def search_product(query: str) -> str:
-    """ 
-    2. 搜索「商品總覽」（chunk_product-overview）
-    """
-    try:
-        print(f"🔍 問題：{query} | Collection: chunk_product-overview | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        search_start = time.time()
-        # 呼叫 Retriever API
-        response = requests.post(
-            f"http://{HOST}:8000/retrieve",
-            json={
-                "query": query,
-                "top_k": config.TOP_K,
-                "threshold": config.THRESHOLD_SCORE,
-                "search_type": "chunk",
-                "collection": "product-overview"     
-            }
-        )
-        # 處理回應
-        if response.status_code == 200:
-            results = response.json().get("results", [])
-            if not results:
-                return "沒有找到相關文件。"
-            elapsed = round(time.time() - search_start, 4)
-            print(f"✅ 搜尋結果返回，處理 format | 耗時：{elapsed} 秒")
-            #  格式化結果
-            formatted_results = []
-            for i, result in enumerate(results, 1):
-                formatted = (
-                    f"📄 文件 {i}\n"
-                    f"   來源: {result.get('filename', '未知')} (第{result.get('page', 'N/A')}頁)\n"
-                    f"   相似度: {result.get('similarity_score', 0):.3f}\n"
-                    f"   完整內容: {result.get('full_content', '').strip()}\n"
-                    "------------------------------------------------------------"
-                )
-                formatted_results.append(formatted)
-            print(f"✅ 格式化完成 | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            return "\n".join(formatted_results)
-        else:
-            return f"❌ Error: Retriever API returned status code {response.status_code}"
-    except Exception as e:
-        return f"❌ Exception: {str(e)}"
-        
-def search_customer_policy(query: str) -> str:
-    """ 
-    3. 搜索「客戶服務保單服務」（chunk_costomer-policy-service）
-    """
-    try:
-        print(f"🔍 問題：{query} | Collection: chunk_costomer-policy-service | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        search_start = time.time()
-        # 呼叫 Retriever API
-        response = requests.post(
-            f"http://{HOST}:8000/retrieve",
-            json={
-                "query": query,
-                "top_k": config.TOP_K,
-                "threshold": config.THRESHOLD_SCORE,
-                "search_type": "chunk",
-                "collection": "costomer-policy-service"     
-            }
-        )
-        # 處理回應
-        if response.status_code == 200:
-            results = response.json().get("results", [])
-            if not results:
-                return "沒有找到相關文件。"
-            elapsed = round(time.time() - search_start, 4)
-            print(f"✅ 搜尋結果返回，處理 format | 耗時：{elapsed} 秒")
-            # 格式化結果
-            formatted_results = []
-            for i, result in enumerate(results, 1):
-                formatted = (
-                    f"📄 文件 {i}\n"
-                    f"   來源: {result.get('filename', '未知')} (第{result.get('page', 'N/A')}頁)\n"
-                    f"   相似度: {result.get('similarity_score', 0):.3f}\n"
-                    f"   完整內容: {result.get('full_content', '').strip()}\n"
-                    "------------------------------------------------------------"
-                )
-                formatted_results.append(formatted)
-            print(f"✅ 格式化完成 | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            return "\n".join(formatted_results)
-        else:
-            return f"❌ Error: Retriever API returned status code {response.status_code}"
-    except Exception as e:
-        return f"❌ Exception: {str(e)}"
+def build_batch_items(query: str) -> List[Dict[str, Any]]:
+    """所有工具資料夾的 /retrieve/batch 項目（全資料夾搜尋與推測式預取共用）"""
+    return [build_payload(query, spec["collection"]) for spec in config.AGENT_SEARCH_TOOLS]
 
-def search_medical(query: str) -> str:
-    """ 
-    4. 搜索「投保與醫務」（chunk_application-and-medical）
-    """
-    try:
-        print(f"🔍 問題：{query} | Collection: chunk_application-and-medical | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        search_start = time.time()
-        # 呼叫 Retriever API
-        response = requests.post(
-            f"http://{HOST}:8000/retrieve",
-            json={
-                "query": query,
-                "top_k": config.TOP_K,
-                "threshold": config.THRESHOLD_SCORE,
-                "search_type": "chunk",
-                "collection": "application-and-medical"     
-            }
-        )
-        # 處理回應
-        if response.status_code == 200:
-            results = response.json().get("results", [])
-            if not results:
-                return "沒有找到相關文件。"
-            elapsed = round(time.time() - search_start, 4)
-            print(f"✅ 搜尋結果返回，處理 format | 耗時：{elapsed} 秒")
-            # 格式化結果
-            formatted_results = []
-            for i, result in enumerate(results, 1):
-                formatted = (
-                    f"📄 文件 {i}\n"
-                    f"   來源: {result.get('filename', '未知')} (第{result.get('page', 'N/A')}頁)\n"
-                    f"   相似度: {result.get('similarity_score', 0):.3f}\n"
-                    f"   完整內容: {result.get('full_content', '').strip()}\n"
-                    "------------------------------------------------------------"
-                )
-                formatted_results.append(formatted)
-            print(f"✅ 格式化完成 | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            return "\n".join(formatted_results)
-        else:
-            return f"❌ Error: Retriever API returned status code {response.status_code}"
-    except Exception as e:
-        return f"❌ Exception: {str(e)}"
-    
\ No newline at end of file
+def merge_by_score(grouped: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """合併各資料夾結果，依分數由高到低保留前 TOP_K 筆"""
+    merged = [result for results in grouped.values() for result in results]
+    return sorted(merged, key=lambda x: x.get("similarity_score", 0), reverse=True)[:config.TOP_K]
+
+def make_search_functions(client: RetrieverClient, collection: str) -> Tuple[Callable[[str], str], Callable]:
+    """建立單一資料夾的同步 / 非同步搜尋函式（共用 client 的連線池）"""
+    @timed("tool_call", collection=collection, search_type="chunk")
+    def search(query: str) -> str:
+        try:
+            print(f"🔍 問題：{query} | Collection: chunk_{collection} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            search_start = time.time()
+            prefetched = get_prefetched(query)
+            if prefetched is not None and collection in prefetched:
+                results = prefetched[collection]
+                print("⚡ 使用預取結果")
+            else:
+                results = client.retrieve(build_payload(query, collection)).get("results", [])
+            print(f"✅ 搜尋結果返回，處理 format | 耗時：{round(time.time() - search_start, 4)} 秒")
+            return pack_observation(results)
+        except RetrieverError as e:
+            return f"❌ Error: {str(e)}"
+        except Exception as e:
+            return f"❌ Exception: {str(e)}"
+
+    async def asearch(query: str) -> str:
+        try:
+            print(f"🔍 問題：{query} | Collection: chunk_{collection} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            with stage_timer("tool_call", collection, "chunk"):
+                prefetched = await aget_prefetched(query)
+                if prefetched is not None and collection in prefetched:
+                    results = prefetched[collection]
+                else:
+                    results = (await client.aretrieve(build_payload(query, collection))).get("results", [])
+            return pack_observation(results)
+        except RetrieverError as e:
+            return f"❌ Error: {str(e)}"
+        except Exception as e:
+            return f"❌ Exception: {str(e)}"
+
+    return search, asearch
+
+def make_fanout_functions(client: RetrieverClient) -> Tuple[Callable[[str], str], Callable]:
+    """建立全資料夾搜尋函式：一次 /retrieve/batch 同時搜尋所有工具資料夾，結果依分數合併"""
+    @timed("tool_call", collection="all", search_type="chunk")
+    def search(query: str) -> str:
+        try:
+            print(f"🔍 問題：{query} | Collection: 全部 | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            search_start = time.time()
+            grouped = get_prefetched(query)
+            if grouped is None:
+                grouped = group_batch_results(client.retrieve_batch(build_batch_items(query)))
+            else:
+                print("⚡ 使用預取結果")
+            print(f"✅ 搜尋結果返回，處理 format | 耗時：{round(time.time() - search_start, 4)} 秒")
+            return pack_observation(merge_by_score(grouped))
+        except RetrieverError as e:
+            return f"❌ Error: {str(e)}"
+        except Exception as e:
+            return f"❌ Exception: {str(e)}"
+
+    async def asearch(query: str) -> str:
+        try:
+            print(f"🔍 問題：{query} | Collection: 全部 | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            with stage_timer("tool_call", "all", "chunk"):
+                grouped = await aget_prefetched(query)
+                if grouped is None:
+                    grouped = group_batch_results(await client.aretrieve_batch(build_batch_items(query)))
+            return pack_observation(merge_by_score(grouped))
+        except RetrieverError as e:
+            return f"❌ Error: {str(e)}"
+        except Exception as e:
+            return f"❌ Exception: {str(e)}"
+
+    return search, asearch
+
+def build_search_tools(client: RetrieverClient = None) -> List[Tool]:
+    """依 config.AGENT_SEARCH_TOOLS 為每個資料夾建立搜尋工具，另加全資料夾搜尋工具（config.AGENT_FANOUT_TOOL）；所有工具共用同一個 RetrieverClient"""
+    client = client or RetrieverClient()
+    tools = []
+    for spec in config.AGENT_SEARCH_TOOLS:
+        search, asearch = make_search_functions(client, spec["collection"])
+        tools.append(Tool(name=spec["name"], func=search, coroutine=asearch, description=spec["description"]))
+    if config.AGENT_FANOUT_TOOL:
+        search, asearch = make_fanout_functions(client)
+        tools.append(Tool(name=config.AGENT_FANOUT_TOOL["name"], func=search, coroutine=asearch, description=config.AGENT_FANOUT_TOOL["description"]))
+    return tools
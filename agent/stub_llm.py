@@ -0,0 +1,62 @@
+"""
+agent/stub_llm.py - 本地壓測用的 ReAct 假 LLM（config.LLM_BACKEND = "stub"）
+- 不呼叫 Bedrock，只依 prompt 狀態回覆固定格式：尚無 Observation 時選一個工具搜尋，已有 Observation 時輸出 Final Answer
+- 工具依問題雜湊固定選擇（同一問題每次走相同路徑），每次呼叫以 STUB_LLM_LATENCY_SECONDS 模擬模型延遲
+- /agent/stream 有串流回呼時，先等候一半延遲再將回覆分段觸發 on_llm_new_token（模擬 Bedrock converse_stream）
+- 不保存狀態，可由多個請求同時使用
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import re
+import time
+import hashlib
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from agent.agent_stream import wants_tokens
+
+QUESTION_MARKERS = ("\nQuestion:", "\nQ:")
+STREAM_CHUNK_CHARS = 4  # 串流時每段字元數
+TOOL_LIST_PATTERN = re.compile(r"should be one of \[(.*?)\]")
+
+
+class StubReActChatModel(BaseChatModel):
+    latency: float = config.STUB_LLM_LATENCY_SECONDS  # 每次呼叫的模擬延遲（秒）
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-react"
+
+    def _reply(self, prompt: str) -> str:
+        """依 prompt 中目前問題之後的 Observation 數量決定下一步"""
+        marker_index = max(prompt.rfind(marker) for marker in QUESTION_MARKERS)
+        scratchpad = prompt[marker_index:] if marker_index >= 0 else prompt
+        question = scratchpad.split(":", 1)[-1].strip().split("\n")[0]
+        observations = scratchpad.split("Observation:")[1:]
+        tool_match = TOOL_LIST_PATTERN.search(prompt)
+        if not observations and tool_match:
+            tools = [tool.strip() for tool in tool_match.group(1).split(",") if tool.strip()]
+            tool = tools[int(hashlib.md5(question.encode("utf-8")).hexdigest(), 16) % len(tools)]
+            return f"Thought: 需要查詢文件回答「{question}」\nAction: {tool}\nAction Input: {question}"
+        reference = observations[-1].split("\nThought:")[0].strip()[:200] if observations else "無"
+        return (
+            "Thought: 已取得檢索內容，可以回答\n"
+            f"Final Answer: - 來源：stub\n- 參考內容：{reference}\n- 回答：（stub LLM）{question}"
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        reply = self._reply(prompt)
+        if wants_tokens(run_manager):
+            # 串流：第一段於一半延遲後送出，其餘分段平均分攤另一半延遲
+            pieces = [reply[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(reply), STREAM_CHUNK_CHARS)]
+            time.sleep(self.latency / 2)
+            for piece in pieces:
+                run_manager.on_llm_new_token(piece, chunk=ChatGenerationChunk(message=AIMessageChunk(content=piece)))
+                time.sleep(self.latency / 2 / len(pieces))
+        else:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
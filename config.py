@@ -1,4 +1,7 @@
-import torch
+try:
+    import torch
+except ImportError:  # frontend 映像未安裝 torch，只使用其他設定
+    torch = None
 from langchain.prompts import PromptTemplate, FewShotPromptTemplate
 
 
@@ -11,15 +14,86 @@ PDF_BASE_DIRECTORY = "../pdf_files"
 
 # === 嵌入模型設定 ===
 # MODEL_NAME = "/s3-mount/model"
-device = "cuda" if torch.cuda.is_available() else "cpu"
+device = "cuda" if torch is not None and torch.cuda.is_available() else "cpu"
 MODEL_KWARGS = {"device": device}
 # === 地端 ===
 MODEL_NAME = "../model"
 PERSIST_DIRECTORY = "../db"
 
+# === 嵌入模型推論後端 ===
+EMBEDDING_BACKEND = "torch"  # "torch"：PyTorch fp32（原始模型）；"onnx"：ONNX Runtime（tools/export_onnx.py 匯出）
+# ONNX_MODEL_PATH = "/s3-mount/model_onnx"
+ONNX_MODEL_PATH = "../model_onnx"
+ONNX_QUANTIZED = True  # 使用 dynamic int8 量化模型（model_int8.onnx），False 則使用 fp32 ONNX（model.onnx）
+ONNX_INTRA_OP_THREADS = 4  # 單次推論的執行緒數；與 MODEL_MAX_CONCURRENCY 相乘不宜超過節點 vCPU 數
+ONNX_MAX_LENGTH = 8192  # tokenizer 截斷長度（與 BGE-M3 encode 預設相同）
+
 # === Qdrant設定 ===
 QDRANT_HOST = "qdrant"  
 QDRANT_PORT = 6333
+# QDRANT_MODE = "server"  # 雲端：連線 Qdrant 服務（檢索端使用 AsyncQdrantClient）
+QDRANT_MODE = "local"  # 地端：本地檔案模式（檢索端於專用執行緒存取）
+EMBEDDING_DIM = 1024  # BGE-M3 向量維度
+# summary collection 的具名向量：title+summary 用於搜尋，title 用於 rerank
+SUMMARY_VECTOR_NAME = "summary"
+TITLE_VECTOR_NAME = "title"
+
+# === collection 配置 ===
+# "per_folder"：每個 PDF 資料夾各自一個 chunk_{folder} / summary_{folder} collection
+# "single"：單一 chunk / summary collection，以 payload 的 folder 欄位（tenant 索引）區分資料夾
+COLLECTION_LAYOUT = "per_folder"
+FOLDER_FIELD = "folder"
+ALL_FOLDERS = "all"  # single 配置下 collection 指定為 all（或未指定）時搜尋所有資料夾
+
+# === 檢索引擎 ===
+VECTOR_ENGINE = "qdrant"  # "qdrant"：依 QDRANT_MODE 查詢 Qdrant；"mmap"：唯讀記憶體映射矩陣（由 Qdrant 匯出，見 utils/mmap_index.py）
+# MMAP_INDEX_DIRECTORY = "/s3-mount/mmap_index"
+MMAP_INDEX_DIRECTORY = "../mmap_index"
+MMAP_INDEX_DTYPE = "float16"  # "float16" / "int8"（每列 scale，記憶體為 float32 的 1/4）
+MMAP_SEARCH_CONCURRENCY = 2  # mmap 引擎同時計算的查詢數（NumPy 內積會釋放 GIL）
+
+# === 混合檢索設定（dense + BGE-M3 sparse lexical weights，RRF 融合）===
+HYBRID_SEARCH = True  # 索引時一併寫入 sparse 向量，檢索時預設使用混合檢索
+SPARSE_VECTOR_NAME = "sparse"
+HYBRID_PREFETCH_MULTIPLIER = 2  # dense / sparse 各取 top_k * 倍數 筆候選後再融合
+# 混合檢索的閾值策略：threshold_score 只套用於 dense prefetch；sparse prefetch 以下列 lexical 分數下限過濾
+# 兩者皆在 Qdrant 內過濾，融合後不再截斷，結果數量可達 top_k
+# BGE-M3 lexical 分數為共同 token 權重乘積的總和：只有常見字 / 助詞重疊時約 0.01～0.05，料號、代碼等關鍵字命中通常 > 0.1
+# None 表示有任一共同 token 即保留（dense 閾值形同失效，不建議）
+HYBRID_SPARSE_SCORE_THRESHOLD = 0.1
+
+# === 向量量化設定（依搜尋類型）===
+QUANTIZATION = {
+    "chunk": "scalar",  # None / "scalar"（int8）/ "binary"
+    "summary": "scalar"
+}
+QUANTIZATION_ALWAYS_RAM = True  # 量化向量常駐記憶體
+VECTORS_ON_DISK = True  # 量化時原始 float32 向量存放於磁碟，僅 rescore 時讀取
+QUANTIZATION_RESCORE = True  # 以原始向量重新計分
+QUANTIZATION_OVERSAMPLING = 2.0  # 量化搜尋取 top_k * oversampling 筆候選再 rescore
+
+# === HNSW 索引設定檔（建立 collection 時使用）===
+HNSW_PROFILES = {
+    "default": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000, "on_disk": False},
+    "high_recall": {"m": 32, "ef_construct": 256, "full_scan_threshold": 10000, "on_disk": False},
+    "low_memory": {"m": 8, "ef_construct": 64, "full_scan_threshold": 10000, "on_disk": True}  # HNSW 圖存放磁碟
+}
+HNSW_PROFILE = "default"
+
+# === 查詢模式（/retrieve 的 mode 欄位）===
+# 量化 collection 可另加 "quantization": "rescore" / "no_rescore" / "ignore"，未設定時依 QUANTIZATION_RESCORE
+SEARCH_MODES = {
+    "fast": {"hnsw_ef": 32, "exact": False, "oversampling": 1.5},  # 前端文件搜尋：略降 recall 換取延遲
+    "accurate": {"hnsw_ef": 256, "exact": False, "oversampling": None},  # agent 工具呼叫；oversampling None 表示 QUANTIZATION_OVERSAMPLING
+    "exact": {"hnsw_ef": None, "exact": True, "oversampling": None, "quantization": "ignore"}  # 以原始向量暴力搜尋（不使用量化向量），評估 ground truth 用
+}
+DEFAULT_SEARCH_MODE = "accurate"
+
+# === payload 索引 / 結構化過濾（/retrieve 的 filters 欄位只接受這些欄位）===
+PAYLOAD_INDEX_FIELDS = {
+    "chunk": ["filename"],
+    "summary": ["intent", "file_type", "filename"]
+}
 
 # === indexer 前處理 ===
 chunk_batch_size = 20
@@ -27,6 +101,48 @@ chunk_batch_size = 20
 # === 搜尋設定 ===
 TOP_K = 30
 THRESHOLD_SCORE = 0.5
+# /retrieve 預設輸出欄位（呼叫端可用 fields 指定，例如另外要求 content_preview）
+RESULT_FIELDS = {
+    "chunk": ["similarity_score", "filename", "page", "full_content"],
+    "summary": ["similarity_score", "filename", "title", "file_type", "metadata", "summary"]
+}
+
+# === 檢索服務並行設定 ===
+MODEL_MAX_CONCURRENCY = 2  # 同時執行模型推論的上限，其餘請求排隊等候
+QDRANT_LOCAL_MAX_CONCURRENCY = 1  # 本地模式 Qdrant 存取執行緒數（本地模式非執行緒安全，建議為 1）
+EMBEDDING_BATCH_MAX_SIZE = 32  # 查詢向量動態批次：單批最多筆數
+EMBEDDING_BATCH_MAX_WAIT_MS = 5  # 查詢向量動態批次：第一筆請求最多等候毫秒數
+# pre-fork 多 worker（retriever/gunicorn.conf.py）：模型由 master 載入後共用，索引統一由 Qdrant 服務持有
+RETRIEVER_WORKERS = 1  # worker 數；大於 1 時需 QDRANT_MODE = "server" 或 VECTOR_ENGINE = "mmap"（本地模式檔案鎖不允許多個 process 開啟）
+RETRIEVER_TORCH_THREADS = None  # 每個 worker 的 PyTorch 執行緒數，None 表示 vCPU 數 / worker 數
+
+# === 查詢向量快取 ===
+EMBEDDING_CACHE_SIZE = 2048  # 記憶體 LRU 筆數上限，0 表示停用
+EMBEDDING_CACHE_PATH = None  # SQLite 持久層路徑，None 表示僅使用記憶體
+# EMBEDDING_CACHE_PATH = "../cache/query_embedding.sqlite"
+EMBEDDING_CACHE_DISK_SIZE = 100000  # 持久層筆數上限，0 表示不限制
+EMBEDDING_CACHE_PRUNE_INTERVAL = 60  # 持久層超過上限的淘汰間隔（秒），於背景執行緒執行
+
+# === 檢索結果快取 ===
+RESULT_CACHE_SIZE = 1024  # /retrieve 結果快取筆數上限，0 表示停用
+# 索引版本檔：indexer / summary upsert 後更新版本號，檢索端據此讓快取失效
+# INDEX_VERSION_PATH = "/s3-mount/shared_data/index_versions.json"
+INDEX_VERSION_PATH = "../index_versions.json"
+INDEX_VERSION_CHECK_INTERVAL = 0.0  # 檢查版本檔的最短間隔（秒），0 表示每次請求都檢查
+
+# === API 回應序列化（utils/api_response.py，retriever / agent 共用）===
+# JSON 一律以 orjson 編碼；請求帶 Accept: application/msgpack 且已安裝 msgpack 時改回 MessagePack
+RESPONSE_COMPRESSION = True  # 依 Accept-Encoding 壓縮回應：br（需 brotli-asgi）優先，否則 gzip
+RESPONSE_COMPRESSION_MIN_SIZE = 1024  # 小於此位元組數的回應不壓縮
+RESPONSE_BROTLI_QUALITY = 4  # brotli 壓縮等級（0-11），線上回應取速度與大小的平衡
+RESPONSE_GZIP_LEVEL = 6  # gzip 壓縮等級（1-9）
+RESPONSE_COMPRESSION_EXCLUDED_PATHS = [r"/stream$"]  # 不壓縮的路徑（regex）：串流回應經壓縮器緩衝後事件無法即時送達
+
+# === 監控指標（utils/metrics.py，Prometheus text format）===
+# 各階段耗時直方圖的 bucket（秒）：涵蓋查詢向量化 / 搜尋（毫秒級）到 LLM / agent（數十秒）
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_MULTIPROC_DIR = "/tmp/prometheus_multiproc"  # retriever 多 worker 時各 worker 寫入此目錄，/metrics 彙整全部 worker
+FRONTEND_METRICS_PORT = 9102  # Streamlit 無法新增路由，前端指標另開此 port 提供
 
 # === Bedrock model 設定 ===
 BEDROCK_MODEL_ID = "apac.anthropic.claude-3-7-sonnet-20250219-v1:0"
@@ -35,9 +151,48 @@ MAX_TOKENS = 512
 TEMPERATURE = 0.5
 TOP_P = 0.9
 
+# === LLM 後端 ===
+LLM_BACKEND = "bedrock"  # "bedrock"：Amazon Bedrock；"stub"：本地壓測用的 ReAct 假 LLM（agent/stub_llm.py），不呼叫外部服務
+STUB_LLM_LATENCY_SECONDS = 1.5  # stub LLM 每次呼叫的模擬延遲（秒），接近 Bedrock 單次回應時間
+
 # === agent 設定 ===
 max_iterations=10
 max_execution_time=60
+AGENT_MAX_CONCURRENCY = 4  # 同時執行的 ReAct 迴圈數（共用同一個 MRKLAgent，各佔一個工作執行緒）
+AGENT_MAX_QUEUE = 32  # 等候中的請求上限，超過時 /agent 回傳 503
+AGENT_STREAM_HEARTBEAT_SECONDS = 15  # /agent/stream 無事件時送出 SSE 註解的間隔，避免閒置連線被代理伺服器中斷
+FRONTEND_AGENT_STREAM = True  # 前端以 /agent/stream 逐步顯示 Agent 思考過程與回答；False 時呼叫 /agent 等候完整結果
+# agent 回答快取（agent/answer_cache.py）：以正規化問題為鍵，所用 collection 的索引版本號（INDEX_VERSION_PATH）改變時失效
+AGENT_ANSWER_CACHE_SIZE = 512  # 記憶體 LRU 筆數上限，0 表示停用
+AGENT_ANSWER_CACHE_TTL_SECONDS = 24 * 3600  # 回答保留時間（秒），索引未更新時仍定期重新產生
+AGENT_ANSWER_CACHE_PATH = "../cache/agent_answer.sqlite"  # SQLite 持久層路徑（重啟後仍可命中），None 表示僅使用記憶體
+AGENT_ANSWER_CACHE_DISK_SIZE = 10000  # 持久層筆數上限，0 表示不限制
+AGENT_ANSWER_CACHE_PRUNE_INTERVAL = 60  # 持久層過期 / 超量項目的淘汰間隔（秒），於背景執行緒執行
+
+# === agent 檢索工具設定（agent/retriever_client.py、agent/search_tools.py）===
+RETRIEVER_URL = "http://localhost:8000"  # 本地
+# RETRIEVER_URL = "http://retriever:8000"  # 雲端
+RETRIEVER_POOL_SIZE = 16  # keep-alive 連線池大小（不小於 AGENT_MAX_CONCURRENCY）
+RETRIEVER_CONNECT_TIMEOUT_SECONDS = 3
+RETRIEVER_TIMEOUT_SECONDS = 30  # 單次工具呼叫的讀取逾時上限，另受 agent 剩餘時間（max_execution_time）限制
+RETRIEVER_MAX_RETRIES = 2  # 連線失敗、逾時、502 / 503 / 504 時的重試次數
+RETRIEVER_RETRY_BACKOFF_SECONDS = 0.2  # 指數退避基數（第 n 次重試等候 0 ~ 基數 × 2^n 秒的隨機時間）
+AGENT_TOOL_FIELDS = ["similarity_score", "filename", "page", "full_content"]
+# 工具 Observation 打包（agent/observation_packer.py）：去重、合併同頁片段，依分數保留內容直到 token 額度（以字元估算）
+AGENT_OBSERVATION_PACKING = True  # False 時沿用完整格式（所有片段全文）
+AGENT_OBSERVATION_TOKEN_BUDGET = 2000  # 單次工具呼叫的 Observation 上限
+AGENT_RUN_TOKEN_BUDGET = 8000  # 單次 agent 執行所有 Observation 合計上限
+AGENT_OBSERVATION_MIN_TOKENS = 150  # 剩餘額度低於此值時不再放入文件
+# 每個資料夾一個 chunk 搜尋工具：name / description 為 agent 看到的工具名稱與說明
+AGENT_SEARCH_TOOLS = [
+    {"name": "Form Search", "collection": "other", "description": "搜索「申請書、表單、聲明書」的collection"},
+    {"name": "Product Search", "collection": "product-overview", "description": "搜索「商品、行銷」的collection"},
+    {"name": "Customer Policy Search", "collection": "customer-policy-service", "description": "搜索「客戶服務、理賠、契約變更」的collection"},
+    {"name": "Medical Search", "collection": "application-and-medical", "description": "搜索「投保、核保、醫務」的collection"}
+]
+# 全資料夾搜尋工具：一次 /retrieve/batch 同時搜尋上列所有資料夾，結果依分數合併（None 表示不提供）
+AGENT_FANOUT_TOOL = {"name": "All Collections Search", "description": "同時搜索以上所有collection，結果依相似度合併（不確定問題屬於哪一類時使用）"}
+AGENT_PREFETCH = True  # 問題進來時即以原始問題預取所有資料夾（與第一次 LLM 呼叫同時進行），Action Input 與問題相同的工具呼叫直接使用預取結果
 
 # === Prompt 設定 ===
 SUMMARY_PROMPT="""
@@ -139,6 +294,22 @@ INTENT_COLLECTION_MAP = {
     "9": "other",
     "10": "other"   
 }
+# 意圖編號 → summary payload 的 intent 標籤（與 SUMMARY 提示詞的意圖列表相同），前端依此以 filters 只搜尋該意圖的文件
+INTENT_LABEL_MAP = {
+    "1": "商品行銷",
+    "2": "投保核保醫務",
+    "3": "理賠規範",
+    "4": "契約保單變更",
+    "5": "繳費收費管理",
+    "6": "增員組織發展",
+    "7": "申請書表單聲明書",
+    "8": "制度規範獎勵",
+    "9": "E化操作手冊",
+    "10": "公司資訊新聞刊物"
+}
+# 命中關鍵字意圖時以 {"intent": [標籤]} 過濾 summary；需先執行 migrate_collections.py payload-index 回填 intent 後再開啟
+# 過濾後沒有結果時前端會不帶過濾條件重新搜尋該組查詢
+FRONTEND_INTENT_FILTER = False
 
 ALL_COLLECTIONS = [
     "product-overview",
@@ -2,6 +2,7 @@
 frontend/app.py - Streamlit 前端應用程式
 - 建立使用者介面讓使用者能夠輸入查詢問題
 - 分為 Agent 或 Document Search 進行查詢，最後顯示結果並收集使用者回饋
+- Agent 查詢預設以 /agent/stream（Server-Sent Events）逐步顯示思考過程與回答（config.FRONTEND_AGENT_STREAM）
 """
 import streamlit as st
 import requests
@@ -9,15 +10,19 @@ import pandas as pd
 import os
 import datetime
 import time
-from typing import Tuple, List, Dict
+from typing import Any, Iterator, Tuple, List, Dict
 from intent import expand_query
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config as config
+from utils.metrics import set_service, start_metrics_server, stage_timer, observe_stage
 import json
 import logging
 # === 設定 logging ===
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+# === 監控指標：Streamlit 無法新增 /metrics 路由，另開 port 提供 ===
+set_service("frontend")
+start_metrics_server(config.FRONTEND_METRICS_PORT)
 def debug_log(msg):
     """同時輸出到 console 和 Streamlit"""
     logging.info(msg)
@@ -41,16 +46,18 @@ def run_agent(query: str) -> Tuple[list, str]:
         try:
             url = f"http://{AGENT_HOST}:8001/agent"
             payload = {
-                "query": query
+                "query": query,
+                "fields": ["steps", "final_result"]  # 頁面只需要步驟與最終答案
             }
             debug_log(f"📤 呼叫 Agent API：{url}")
             call_agent_start = time.time()
-            response = requests.post(url, json=payload)
+            with stage_timer("agent_api"):
+                response = requests.post(url, json=payload)
             if response.status_code == 200:
                 data = response.json()
                 call_agent_elapsed = round(time.time() - call_agent_start, 4)
                 debug_log(f"🕒 Query：{query} | Agent API 呼叫 & 執行耗時：{call_agent_elapsed} 秒")
-                return data.get("steps", []), data.get("final_answer", "")
+                return data.get("steps", []), data.get("final_result", "")
             else:
                 st.error("Agent API 連接失敗")
                 return [], ""
@@ -58,39 +65,129 @@ def run_agent(query: str) -> Tuple[list, str]:
             st.error(f"執行 Agent 查詢時發生錯誤: {str(e)}")
             return [], ""
 
+def iter_sse(response: requests.Response) -> Iterator[Tuple[str, Any]]:
+    """解析 Server-Sent Events 回應，依序產生 (event, data)；heartbeat 註解略過"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith(":"):
+            continue
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+def run_agent_stream(query: str) -> Tuple[list, str]:
+    """ 1. Agent Search（串流）：呼叫 /agent/stream，步驟與回答到達時即顯示，完成後返回 steps 與最終答案"""
+    url = f"http://{AGENT_HOST}:8001/agent/stream"
+    payload = {
+        "query": query,
+        "fields": ["steps", "final_result"]
+    }
+    steps, final_answer = [], ""
+    placeholder = st.empty()  # 串流期間的即時畫面，完成後由 display_agent_results 顯示完整結果
+    try:
+        debug_log(f"📤 呼叫 Agent Stream API：{url}")
+        call_agent_start = time.time()
+        first_event_elapsed = None
+        with stage_timer("agent_api"), requests.post(url, json=payload, stream=True) as response:
+            if response.status_code != 200:
+                st.error("Agent API 連接失敗")
+                return [], ""
+            response.encoding = "utf-8"
+            with placeholder.container():
+                st.subheader("🧠 Agent 思考過程")
+                status = st.status("Agent 正在思考中...")
+                answer_box = None
+                for event, data in iter_sse(response):
+                    if event != "start" and first_event_elapsed is None:
+                        first_event_elapsed = round(time.time() - call_agent_start, 4)
+                        observe_stage("agent_api_first_event", first_event_elapsed)
+                    if event == "action":
+                        status.update(label=f"🛠 {data['action']}：{data['action_input']}")
+                        display_agent_action(data)
+                    elif event == "observation":
+                        display_agent_observation(data["observation"])
+                    elif event == "token":
+                        if answer_box is None:
+                            status.update(label="✍️ 產生回答中...")
+                            st.subheader("🎯 最終回答")
+                            answer_box = st.empty()
+                        final_answer += data["text"]
+                        answer_box.markdown(final_answer)
+                    elif event == "final":
+                        steps, final_answer = data.get("steps", []), data.get("final_result", final_answer)
+                    elif event == "error":
+                        st.error(f"執行 Agent 查詢時發生錯誤: {data['error']}")
+                status.update(label="✅ Agent 執行完成", state="complete")
+        call_agent_elapsed = round(time.time() - call_agent_start, 4)
+        debug_log(f"🕒 Query：{query} | 第一個步驟：{first_event_elapsed} 秒 | Agent API 呼叫 & 執行耗時：{call_agent_elapsed} 秒")
+    except Exception as e:
+        st.error(f"執行 Agent 查詢時發生錯誤: {str(e)}")
+    if steps:
+        placeholder.empty()
+    return steps, final_answer
+
 def run_document_search(intent_classify: tuple) -> Tuple[List[Dict], int]:
-    """ 2. Document Search：呼叫 Retriever API，返回 final_results 與 total_counts"""
+    """ 2. Document Search：以單一批次請求呼叫 Retriever API，返回 final_results 與 total_counts"""
     with st.spinner("搜尋中..."):
         final_results = []
         total_count = 0
-        for intent_collection, expanded_query in intent_classify:
+        items = []
+        for intent_collection, expanded_query, intent in intent_classify:
             if intent_collection:
                 st.info(f"**擴充後查詢：** {expanded_query} (分類至 {intent_collection})")
-                try:
-                    url = f"http://{RETRIEVER_HOST}:8000/search"
-                    payload = {
-                        "query": expanded_query,
-                        "top_k": config.TOP_K,
-                        "threashold_score": config.THRESHOLD_SCORE,
-                        "collection": intent_collection,
-                        "search_type": "summary"
-                    }
-                    debug_log(f"📤 呼叫 Document Search API：{url}")
-                    call_search_start = time.time()
-                    response = requests.post(url, json=payload)
-                    if response.status_code == 200:
-                        data = response.json()
-                        call_search_elapsed = round(time.time() - call_search_start, 4)
-                        debug_log(f"🕒 Query：{expanded_query} | Collection：summary_{intent_collection} | Retriver API 呼叫 & 執行耗時：{call_search_elapsed} 秒")
-                        results = data.get("results", [])
-                        count = data.get("total_count", 0)
-                        final_results.extend(results)
-                        total_count += count
-                        st.success(f"✅ 搜尋完成")
-                    else:
-                        st.error("API 連接失敗")
-                except Exception as e:
-                    st.error(f"執行查詢時發生錯誤: {str(e)}")
+                item = {
+                    "query": expanded_query,
+                    "top_k": config.TOP_K,
+                    "threshold_score": config.THRESHOLD_SCORE,
+                    "collection": intent_collection,
+                    "search_type": "summary",
+                    "mode": "fast"  # 互動式文件搜尋：略降 recall 換取延遲
+                }
+                intent_label = config.INTENT_LABEL_MAP.get(intent)
+                if config.FRONTEND_INTENT_FILTER and intent_label:
+                    # 命中意圖時只搜尋標記該意圖的文件（intent payload 索引），不掃描整個 collection
+                    item["filters"] = {"intent": [intent_label]}
+                items.append(item)
+        if not items:
+            return final_results, total_count
+        try:
+            url = f"http://{RETRIEVER_HOST}:8000/retrieve/batch"
+            debug_log(f"📤 呼叫 Document Search API：{url}（{len(items)} 組查詢）")
+            call_search_start = time.time()
+            with stage_timer("document_search_api", search_type="summary"):
+                response = requests.post(url, json={"items": items})
+                item_results = response.json().get("results", []) if response.status_code == 200 else None
+                # 意圖過濾後沒有結果（例如 collection 尚未回填 intent）時，不帶過濾條件重新搜尋該組查詢
+                retry_indexes = [
+                    i for i, (item, item_result) in enumerate(zip(items, item_results or []))
+                    if item.get("filters") and not item_result.get("error") and not item_result.get("total_count")
+                ]
+                if retry_indexes:
+                    debug_log(f"🔁 {len(retry_indexes)} 組查詢經意圖過濾後無結果，改為不過濾重新搜尋")
+                    retry_items = [{k: v for k, v in items[i].items() if k != "filters"} for i in retry_indexes]
+                    retry_response = requests.post(url, json={"items": retry_items})
+                    if retry_response.status_code == 200:
+                        for i, retry_result in zip(retry_indexes, retry_response.json().get("results", [])):
+                            item_results[i] = retry_result
+            if item_results is not None:
+                call_search_elapsed = round(time.time() - call_search_start, 4)
+                debug_log(f"🕒 {len(items)} 組查詢 | Retriver API 呼叫 & 執行耗時：{call_search_elapsed} 秒")
+                for item_result in item_results:
+                    if item_result.get("error"):
+                        st.error(f"查詢 summary_{item_result.get('collection')} 時發生錯誤: {item_result['error']}")
+                        continue
+                    final_results.extend(item_result.get("results", []))
+                    total_count += item_result.get("total_count", 0)
+                st.success(f"✅ 搜尋完成")
+            else:
+                st.error("API 連接失敗")
+        except Exception as e:
+            st.error(f"執行查詢時發生錯誤: {str(e)}")
         return final_results, total_count
 
 # =======================
@@ -138,6 +235,24 @@ def save_feedback(query: str, pdf_name: str, rating: str) -> None:
 # =======================
 # 結果渲染：分為 Agent 與 Document 結果
 # =======================
+def display_agent_action(step: dict) -> None:
+    """Agent 步驟的 Thought / Action / Action Input"""
+    st.markdown(f"**💭 Thought：** {step['thought']}")
+    st.markdown(f"**🛠 Action：** {step['action']}")
+    st.markdown(f"**📥 Action Input：** {step['action_input']}")
+
+def display_agent_observation(observation: str) -> None:
+    """Agent 步驟的 Observation：依分隔線拆成文件"""
+    st.markdown("**👀 Observation：**")
+    documents = observation.split("------------------------------------------------------------")
+    for j, doc in enumerate(documents, 1):
+        doc = doc.strip()
+        if not doc:
+            continue
+        with st.expander(f"📄 文件 {j}"):
+            st.write(doc)
+    st.markdown("---")
+
 def display_agent_results(agent_steps: list) -> None:
     """ 1. Agent 結果渲染"""
     st.subheader("🧠 Agent 思考過程")
@@ -146,18 +261,8 @@ def display_agent_results(agent_steps: list) -> None:
             if "start" in step:
                 st.success("🚀 " + step["start"])
             elif "thought" in step and "action" in step:
-                st.markdown(f"**💭 Thought：** {step['thought']}")
-                st.markdown(f"**🛠 Action：** {step['action']}")
-                st.markdown(f"**📥 Action Input：** {step['action_input']}")
-                st.markdown("**👀 Observation：**")
-                documents = step['observation'].split("------------------------------------------------------------")
-                for j, doc in enumerate(documents, 1):
-                    doc = doc.strip()
-                    if not doc:
-                        continue
-                    with st.expander(f"📄 文件 {j}"):
-                        st.write(doc)
-                st.markdown("---")
+                display_agent_action(step)
+                display_agent_observation(step["observation"])
             elif "final_answer" in step:
                 st.subheader("🎯 最終回答")
                 st.markdown(step["final_answer"])
@@ -240,10 +345,13 @@ with tab1:
         
         if len(query) > 8:
             # 長 query → 直接 Agent
-            st.session_state.agent_steps, st.session_state.agent_answer = run_agent(query)
+            if config.FRONTEND_AGENT_STREAM:
+                st.session_state.agent_steps, st.session_state.agent_answer = run_agent_stream(query)
+            else:
+                st.session_state.agent_steps, st.session_state.agent_answer = run_agent(query)
         else:
             # 短 query → 嘗試 intent mapping
-            checker, intent_classify = expand_query(query)  # 回傳 list of tuples [(collection, expanded_query), ...]
+            checker, intent_classify = expand_query(query)  # 回傳 list of tuples [(collection, expanded_query, intent), ...]
             if checker:
                 # 命中 mapping → document search specific collections
                 st.session_state.final_results, st.session_state.total_counts = run_document_search(intent_classify)
@@ -251,9 +359,13 @@ with tab1:
                 # 沒命中 mapping → document search all collections
                 st.info("查無相關分類，將 query 搜尋全部 collection")
                 intent_classify = []
-                for collection in config.ALL_COLLECTIONS:
-                    # 把 query 配對到每個 collection
-                    intent_classify.append((collection, query))
+                if config.COLLECTION_LAYOUT == "single":
+                    # 單一 collection 配置：一次查詢涵蓋所有資料夾
+                    intent_classify.append((config.ALL_FOLDERS, query, None))
+                else:
+                    for collection in config.ALL_COLLECTIONS:
+                        # 把 query 配對到每個 collection
+                        intent_classify.append((collection, query, None))
                 st.session_state.final_results, st.session_state.total_counts = run_document_search(intent_classify)
     # 顯示結果 
     if st.session_state.agent_steps:
@@ -34,8 +34,8 @@ print(f"✅ 成功從 {len(global_keywords)} 個關鍵字載入結巴自定義
 # 擴充查詢函數
 def expand_query(query: str) -> Tuple[bool, list]:
     """
-    回傳 list of tuples: (collection, expanded_query)
-    每個 intent 對應一個 expanded query
+    回傳 list of tuples: (collection, expanded_query, intent)
+    每個 intent 對應一個 expanded query；沒匹配到時 intent 為 None
     """
     results = []
     # 使用結巴斷詞
@@ -55,11 +55,11 @@ def expand_query(query: str) -> Tuple[bool, list]:
                 # 移除標點，轉空格
                 cleaned_related_words = re.sub(r'[、,，]', ' ', related_words).strip()
                 expanded_query = matched_keyword + " " + cleaned_related_words
-                results.append((collection, expanded_query))
+                results.append((collection, expanded_query, intent))
     else:
         # 沒匹配到
         checker = False
-        results.append(("NA", query))  
+        results.append(("NA", query, None))  
     return checker, results
 
 # 使用範例
@@ -77,16 +77,17 @@ if __name__ == "__main__":
 results = expand_query(input_query)
 
 results = [
-    (intent_collection, expanded_query),
-    (intent_collection, expanded_query),
+    (intent_collection, expanded_query, intent),
+    (intent_collection, expanded_query, intent),
     ...
 ]
 results = [
-    ('product', '保險金 保額 保險金額 基本保額'),
-    ('claims', '保險金 理賠金 保險給付 給付金 保險金扣抵醫療費 保險金扣抵醫療費授權書 保險金扣抵醫療費服務流程 保險金扣抵醫療費相關問題'),
-    ('changes', '保險金 保險理賠金 保險金申請書 理賠申請')
+    ('product', '保險金 保額 保險金額 基本保額', '1'),
+    ('claims', '保險金 理賠金 保險給付 給付金 保險金扣抵醫療費 保險金扣抵醫療費授權書 保險金扣抵醫療費服務流程 保險金扣抵醫療費相關問題', '3'),
+    ('changes', '保險金 保險理賠金 保險金申請書 理賠申請', '4')
 ]
 
 results[0][0] = "intent_collection" = 'product'
 results[0][1] = "expanded_query" = '保險金 保額 保險金額 基本保額'
+results[0][2] = "intent" = '1'
 """
@@ -5,14 +5,15 @@ import config as config
 import time
 import json
 from typing import Dict, Optional
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
 from utils.get_file_utils import get_folder_paths, process_all_folders
 from utils.log_utils import get_processed_files, create_time_log_entry, log_to_file
+from utils.mmap_index import publish_collection
 from chunking import process_json_to_chunks
 from utils.ocr_utils import convert_pdf_to_json
 from utils.embedding_utils import EmbeddingProcessor
+from utils.embedding_backend import load_embedding_model
+from utils.collection_utils import create_collection
 
 
 class Indexer:
@@ -50,13 +51,7 @@ class Indexer:
             chunk_info = self.client.get_collection(chunk_collection)
             print(f"{chunk_collection} 集合連接成功，包含 {chunk_info.points_count} 條記錄")
         except Exception: # 若不存在則建立新集合
-            self.client.create_collection(
-                collection_name=chunk_collection,
-                vectors_config=VectorParams(
-                    size=1024,
-                    distance=Distance.COSINE
-                )
-            )
+            create_collection(self.client, chunk_collection, "chunk")
             print(f"已創建向量集合: {chunk_collection} ")
         
         # 確保 JSON 資料夾存在，不存在即建立
@@ -134,7 +129,7 @@ class Indexer:
                     data = json.load(f)
                 chunks = list(data.values())
                 # 呼叫 chunk_embedding_upsert 進行 embedding + upsert
-                embed_success = self.embedding_processor.chunk_embedding_upsert(chunks, json_filename, chunk_collection, indexer_embed_log_directory)
+                embed_success = self.embedding_processor.chunk_embedding_upsert(chunks, json_filename, chunk_collection, indexer_embed_log_directory, folder=folder_name)
                 if embed_success:
                     embed_sucess_count += 1
                     print(f"✅ 成功向量化並儲存: {json_filename}")
@@ -145,6 +140,9 @@ class Indexer:
                 embed_failed_count += 1
                 print(f" ❌ 讀取或向量化時發生錯誤: {json_filename}, Error: {str(e)}")
         
+        # 有執行 upsert（含部分失敗）時發佈更新：mmap 引擎先重新匯出唯讀矩陣，再更新索引版本號讓檢索端快取失效
+        if embed_sucess_count + embed_failed_count > 0:
+            publish_collection(self.client, chunk_collection)
         # === 最終統計 ===
         print("\n📊 處理結果總結:")
         print(f" 階段 I (OCR) 成功/失敗: {ocr_success_count}/{ocr_failed_count}")
@@ -168,10 +166,7 @@ def main():
     # qdrant_client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT) # 使用網路存取模式
     print("✅ Qdrant 連接成功！")
     print("🔄 BGE-M3 模型載入...")
-    embedding_model = HuggingFaceEmbeddings(
-                model_name=config.MODEL_NAME,
-                model_kwargs=config.MODEL_KWARGS
-            )
+    embedding_model = load_embedding_model()
     print("✅ BGE-M3 模型載入完成！")
     embedding_processor = EmbeddingProcessor(embedding_model=embedding_model, client=qdrant_client)
     indexer = Indexer(embedding_processor=embedding_processor, client=qdrant_client)
@@ -1,34 +1,72 @@
 from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Union, Optional
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
 from search import VectorSearch
 from rerank import Rerank
 from retrieve_pipeline import Retriever
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from result_cache import ResultCache
+from executor import BlockingExecutor
+from batcher import EmbeddingBatcher
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config as config
+from utils.index_version import IndexVersions
+from utils.mmap_index import MmapIndexNotExported
+from utils.embedding_backend import load_embedding_model
+from utils.api_response import encode_response, add_compression
+from utils.metrics import set_service, add_metrics_route
 
 
+# pre-fork 模式（gunicorn.conf.py）由 master 預先載入的模型，worker fork 後以 copy-on-write 共用權重
+PRELOADED_EMBEDDING_MODEL = None
+
+def preload_embedding_model() -> None:
+    """
+    pre-fork 模式：fork 前在 master 載入模型（master 不可執行推論，避免 fork 後執行緒池狀態不一致）
+    ONNX Runtime session 不能跨 fork 使用，ONNX 後端改由各 worker 自行載入（int8 模型約為 fp32 的 1/4）
+    """
+    global PRELOADED_EMBEDDING_MODEL
+    if config.EMBEDDING_BACKEND == "onnx":
+        print("ℹ️ ONNX 後端不預先載入，由各 worker 載入")
+        return
+    print(f"🔄 [master {os.getpid()}] 預先載入 EMBEDDING 模型...")
+    PRELOADED_EMBEDDING_MODEL = load_embedding_model()
+    print(f"✅ [master {os.getpid()}] EMBEDDING 模型載入完成，worker 將共用此模型！")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("🔄 開始載入 EMBEDDING 模型...")
-    EMBEDDING_MODEL = HuggingFaceEmbeddings(
-        model_name=config.MODEL_NAME,
-        model_kwargs=config.MODEL_KWARGS
-    )
-    print("✅ EMBEDDING 模型載入完成！")
+    if PRELOADED_EMBEDDING_MODEL is not None:
+        EMBEDDING_MODEL = PRELOADED_EMBEDDING_MODEL
+        print(f"✅ [worker {os.getpid()}] 使用 master 預先載入的 EMBEDDING 模型")
+    else:
+        print("🔄 開始載入 EMBEDDING 模型...")
+        EMBEDDING_MODEL = load_embedding_model()
+        print("✅ EMBEDDING 模型載入完成！")
 
     print("🔄 實例化 searcher & reranker...")
-    search_tool = VectorSearch(embedding_model=EMBEDDING_MODEL)
-    rerank_tool = Rerank(embedding_model=EMBEDDING_MODEL)
+    # searcher 與 reranker 共用同一個模型執行器與批次器，合計的推論並行數受 MODEL_MAX_CONCURRENCY 限制
+    model_executor = BlockingExecutor(config.MODEL_MAX_CONCURRENCY, "model")
+    embedding_batcher = EmbeddingBatcher(
+        embedding_model=EMBEDDING_MODEL,
+        executor=model_executor,
+        max_batch_size=config.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=config.EMBEDDING_BATCH_MAX_WAIT_MS
+    )
+    search_tool = VectorSearch(embedding_model=EMBEDDING_MODEL, model_executor=model_executor, embedding_batcher=embedding_batcher)
+    rerank_tool = Rerank(embedding_model=EMBEDDING_MODEL, embedding_batcher=embedding_batcher)
     print("✅ searcher & reranker 實例化完成！")
     
+    app.state.model_executor = model_executor
+    app.state.embedding_batcher = embedding_batcher
+    app.state.search_tool = search_tool
+    app.state.result_cache = ResultCache(index_versions=IndexVersions(), max_entries=config.RESULT_CACHE_SIZE)
     app.state.retriever = Retriever(
         search_tool=search_tool,
-        rerank_tool=rerank_tool
+        rerank_tool=rerank_tool,
+        result_cache=app.state.result_cache
     )
     print("✅ RAG 檢索器初始化完成！")
 
@@ -37,8 +75,13 @@ async def lifespan(app: FastAPI):
 
     # === shutdown 處理（可選）===
     print("🛑 服務正在關閉...")
+    await search_tool.close()
+    model_executor.shutdown()
 
-app = FastAPI(title="RAG Retrieve API", lifespan=lifespan)
+app = FastAPI(title="RAG Retrieve API", lifespan=lifespan, default_response_class=ORJSONResponse)
+add_compression(app)
+set_service("retriever")
+add_metrics_route(app)  # GET /metrics：各階段耗時直方圖（Prometheus text format）
 
 # =======================
 # 定義 API 查詢請求模型
@@ -50,26 +93,117 @@ class QueryRequest(BaseModel):
     threshold_score: float = config.THRESHOLD_SCORE  # 相似度閾值
     collection: Optional[str]   # 查詢 intent，用來指定 collection 名稱
     search_type: str  # 查詢類型：chunk 或 summary
+    hybrid: Optional[bool] = None  # 是否使用 dense + sparse 混合檢索，None 表示依 config.HYBRID_SEARCH
+    fields: Optional[List[str]] = None  # 輸出欄位，None 表示 config.RESULT_FIELDS 預設值
+    mode: Optional[str] = None  # 查詢模式（config.SEARCH_MODES：fast / accurate / exact），None 表示 config.DEFAULT_SEARCH_MODE
+    filters: Optional[Dict[str, Union[str, List[str]]]] = None  # 結構化過濾，例如 {"intent": ["理賠規範"]}，欄位見 config.PAYLOAD_INDEX_FIELDS
+
+class BatchQueryItem(BaseModel):
+    """批次查詢中的單一項目"""
+    query: str  # 查詢內容
+    collection: Optional[str]  # 查詢 intent，用來指定 collection 名稱
+    search_type: str  # 查詢類型：chunk 或 summary
+    top_k: int = config.TOP_K  # 返回結果數量
+    threshold_score: float = config.THRESHOLD_SCORE  # 相似度閾值
+    hybrid: Optional[bool] = None  # 是否使用混合檢索，None 表示依 config.HYBRID_SEARCH
+    fields: Optional[List[str]] = None  # 輸出欄位，None 表示 config.RESULT_FIELDS 預設值
+    mode: Optional[str] = None  # 查詢模式（config.SEARCH_MODES：fast / accurate / exact），None 表示 config.DEFAULT_SEARCH_MODE
+    filters: Optional[Dict[str, Union[str, List[str]]]] = None  # 結構化過濾，例如 {"intent": ["理賠規範"]}，欄位見 config.PAYLOAD_INDEX_FIELDS
+
+class BatchQueryRequest(BaseModel):
+    """批次查詢請求格式：一次送出多組 (query, collection, search_type)"""
+    items: List[BatchQueryItem]
+
+def check_search_mode(mode: Optional[str]) -> None:
+    """查詢模式需為 config.SEARCH_MODES 中的名稱"""
+    if mode is not None and mode not in config.SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"不支援的查詢模式: {mode}，可用模式: {list(config.SEARCH_MODES)}")
+
+def check_filters(search_type: str, filters: Optional[Dict[str, Any]]) -> None:
+    """過濾欄位需為該搜尋類型建有 payload 索引的欄位（config.PAYLOAD_INDEX_FIELDS）"""
+    allowed_fields = config.PAYLOAD_INDEX_FIELDS.get(search_type, [])
+    unknown_fields = [field for field in (filters or {}) if field not in allowed_fields]
+    if unknown_fields:
+        raise HTTPException(status_code=400, detail=f"{search_type} 不支援的過濾欄位: {unknown_fields}，可用欄位: {allowed_fields}")
+    empty_fields = [field for field, values in (filters or {}).items() if values in ([], "")]
+    if empty_fields:
+        raise HTTPException(status_code=400, detail=f"過濾欄位的值不可為空: {empty_fields}")
 
 # =======================
 # API 路由設定
 # =======================
+@app.get("/health")
+async def health(request: Request) -> Dict[str, Any]:
+    """健康檢查：不經過模型與 Qdrant，模型執行器忙碌時仍可立即回應"""
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "model_executor": request.app.state.model_executor.stats()
+    }
+
 @app.post("/retrieve")
-async def retrieve(req: QueryRequest, request: Request) -> Dict[str, Union[List[Any], int]]:
-    """使用檢索器處理搜尋請求並返回結果"""
+async def retrieve(req: QueryRequest, request: Request) -> Response:
+    """使用檢索器處理搜尋請求並返回結果（orjson JSON，或依 Accept 標頭回傳 MessagePack）"""
     retriever = request.app.state.retriever
 
     if retriever is None:
         raise HTTPException(status_code=503, detail="檢索服務尚未啟動或初始化失敗。")
+    check_search_mode(req.mode)
+    check_filters(req.search_type, req.filters)
     try:
         final_output = await retriever.retrieve(
             query=req.query,
             top_k=req.top_k,
             threshold_score=req.threshold_score,
             collection=req.collection,
-            search_type=req.search_type
+            search_type=req.search_type,
+            hybrid=req.hybrid,
+            fields=req.fields,
+            mode=req.mode,
+            filters=req.filters
         )
-        return final_output
+        return encode_response(request, final_output)
+    except MmapIndexNotExported as e:
+        print(f"❌ {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"❌ 檢索過程中發生錯誤: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"檢索服務內部錯誤: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"檢索服務內部錯誤: {str(e)}")
+
+
+@app.post("/retrieve/batch")
+async def retrieve_batch(req: BatchQueryRequest, request: Request) -> Response:
+    """批次檢索：一次請求取代多次 /retrieve，結果依項目順序分組返回（回應格式同 /retrieve）"""
+    retriever = request.app.state.retriever
+
+    if retriever is None:
+        raise HTTPException(status_code=503, detail="檢索服務尚未啟動或初始化失敗。")
+    for item in req.items:
+        check_search_mode(item.mode)
+        check_filters(item.search_type, item.filters)
+    try:
+        batch_results = await retriever.retrieve_batch([item.model_dump() for item in req.items])
+        return encode_response(request, {
+            "results": batch_results,
+            "total_count": sum(item["total_count"] for item in batch_results)
+        })
+    except Exception as e:
+        print(f"❌ 批次檢索過程中發生錯誤: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"檢索服務內部錯誤: {str(e)}")
+
+
+@app.get("/cache/stats")
+async def cache_stats(request: Request) -> Dict[str, Any]:
+    """回傳快取統計資訊，用於評估快取大小"""
+    search_tool = request.app.state.search_tool
+    return {
+        "query_embedding": search_tool.embedding_cache.stats(),
+        "retrieve_result": request.app.state.result_cache.stats(),
+        "index_versions": request.app.state.result_cache.index_versions.snapshot()
+    }
+
+
+@app.get("/batcher/stats")
+async def batcher_stats(request: Request) -> Dict[str, Any]:
+    """回傳查詢向量動態批次的批次大小分布與佇列等候時間"""
+    return request.app.state.embedding_batcher.stats()
@@ -0,0 +1,128 @@
+import asyncio
+import bisect
+import time
+from collections import Counter
+from typing import Any, Dict, List
+from executor import BlockingExecutor
+
+QUEUE_WAIT_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 250, 500, 1000]
+
+
+# =======================
+# 查詢向量動態批次：將同時到達的多個查詢合併為一次模型 forward
+# =======================
+class EmbeddingBatcher:
+    def __init__(self, embedding_model: Any, executor: BlockingExecutor, max_batch_size: int, max_wait_ms: float, encode_method: str = "embed_documents") -> None:
+        """
+        初始化批次器：單批上限 max_batch_size 筆，第一筆請求最多等候 max_wait_ms 毫秒
+        encode_method 為模型的批次方法名稱（embed_documents 回傳 dense；embed_hybrid 回傳 (dense, sparse)）
+        """
+        self.embedding = embedding_model
+        self.encode = getattr(embedding_model, encode_method)
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._pending = []  # (text, future, 進入佇列時間)
+        self._wakeup = None
+        self._slots = None
+        self._dispatcher = None
+        # 統計
+        self.batch_sizes = Counter()
+        self.queue_wait_counts = [0] * (len(QUEUE_WAIT_BUCKETS_MS) + 1)
+        self.queue_wait_sum_ms = 0.0
+        self.queue_wait_max_ms = 0.0
+
+    def _ensure_started(self) -> None:
+        """於第一次呼叫時在目前的 event loop 上啟動派送工作"""
+        if self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            # 同時送出的批次數不超過執行器的工作執行緒數；執行器忙碌時新請求會累積成更大的批次
+            self._slots = asyncio.Semaphore(self.executor.max_workers)
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def embed(self, text: str) -> List[float]:
+        """將單一查詢加入批次佇列，並等待該查詢的向量"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self._wakeup.set()
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """多筆文字一起加入佇列（會與其他請求的查詢合併批次）"""
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    async def _dispatch_loop(self) -> None:
+        """持續收集佇列中的請求，達到批次上限或等候時間到即送出"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            loop.create_task(self._run_batch(batch))
+
+    def _record(self, batch: List[Any]) -> None:
+        """記錄批次大小與佇列等候時間"""
+        now = time.perf_counter()
+        self.batch_sizes[len(batch)] += 1
+        for _, _, enqueued_at in batch:
+            wait_ms = (now - enqueued_at) * 1000
+            self.queue_wait_counts[bisect.bisect_left(QUEUE_WAIT_BUCKETS_MS, wait_ms)] += 1
+            self.queue_wait_sum_ms += wait_ms
+            self.queue_wait_max_ms = max(self.queue_wait_max_ms, wait_ms)
+
+    async def _run_batch(self, batch: List[Any]) -> None:
+        """執行一次批次向量化，並把結果分送給各請求的 future"""
+        try:
+            self._record(batch)
+            # 同一批次內相同的文字只計算一次
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            vectors = await self.executor.run(self.encode, texts)
+            vector_by_text = dict(zip(texts, vectors))
+            for text, future, _ in batch:
+                if not future.done():
+                    future.set_result(vector_by_text[text])
+        except Exception as e:
+            print(f"❌ 批次向量化時發生錯誤: {str(e)}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """回傳批次大小分布與佇列等候時間統計"""
+        total = sum(self.queue_wait_counts)
+        bucket_labels = [f"<={b}ms" for b in QUEUE_WAIT_BUCKETS_MS] + [f">{QUEUE_WAIT_BUCKETS_MS[-1]}ms"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": len(self._pending),
+            "batches": sum(self.batch_sizes.values()),
+            "batch_size_distribution": dict(sorted(self.batch_sizes.items())),
+            "queue_wait_ms": {
+                "count": total,
+                "avg": round(self.queue_wait_sum_ms / total, 3) if total else 0.0,
+                "max": round(self.queue_wait_max_ms, 3),
+                "histogram": dict(zip(bucket_labels, self.queue_wait_counts))
+            }
+        }
+
+    async def close(self) -> None:
+        """停止派送工作"""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
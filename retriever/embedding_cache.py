@@ -0,0 +1,134 @@
+import re
+import sqlite3
+import hashlib
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Dict
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+from utils.sqlite_store import SQLiteStore
+
+
+def normalize_query(text: str) -> str:
+    """正規化查詢文字：全半形統一、去除頭尾與重複空白、英文字母轉小寫"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+# =======================
+# 查詢向量快取：記憶體 LRU + 選用的 SQLite 持久層
+# =======================
+class QueryEmbeddingCache:
+    def __init__(self, model_id: str, max_entries: int, disk_path: Optional[str] = None, disk_max_entries: int = 0) -> None:
+        """初始化快取；disk_path 為 None 時只使用記憶體"""
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk = None
+        if disk_path:
+            try:
+                self._disk = SQLiteStore(
+                    disk_path,
+                    schema=[
+                        "CREATE TABLE IF NOT EXISTS query_embedding ("
+                        "key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed_at REAL NOT NULL)",
+                        "CREATE INDEX IF NOT EXISTS query_embedding_accessed_at ON query_embedding (accessed_at)"
+                    ],
+                    name="embedding-cache",
+                    prune=self._prune,
+                    prune_interval=config.EMBEDDING_CACHE_PRUNE_INTERVAL
+                )
+                print(f"✅ 查詢向量快取持久層已開啟：{disk_path}")
+            except Exception as e:
+                print(f"⚠️ 查詢向量快取持久層開啟失敗，僅使用記憶體: {str(e)}")
+                self._disk = None
+
+    def _key(self, text: str) -> str:
+        """以模型識別 + 正規化查詢產生快取鍵"""
+        return hashlib.sha1(f"{self.model_id}\x00{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        """寫入記憶體 LRU，超過上限時淘汰最久未使用的項目（呼叫端需持有鎖）"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        """持久層超過上限時，刪除最久未使用的項目（背景執行緒定期執行，以 accessed_at 索引找出界線）"""
+        if self.disk_max_entries > 0:
+            conn.execute(
+                "DELETE FROM query_embedding WHERE accessed_at <= ("
+                "SELECT accessed_at FROM query_embedding ORDER BY accessed_at DESC LIMIT 1 OFFSET ?)",
+                (self.disk_max_entries,)
+            )
+
+    async def get(self, text: str) -> Optional[List[float]]:
+        """查詢快取，命中時回傳向量副本，未命中回傳 None；持久層於背景執行緒讀取"""
+        if self.max_entries <= 0:
+            return None
+        key = self._key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return list(vector)
+        if self._disk is not None:
+            row = await self._disk.fetchone("SELECT vector FROM query_embedding WHERE key = ?", (key,))
+            if row is not None:
+                vector = array("f", row[0]).tolist()
+                self._disk.write(("UPDATE query_embedding SET accessed_at = ? WHERE key = ?", (time.time(), key)))
+                with self._lock:
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return list(vector)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, vector: List[float]) -> None:
+        """寫入快取：記憶體立即生效，持久層排入背景執行緒寫入"""
+        if self.max_entries <= 0 or not vector:
+            return
+        key = self._key(text)
+        vector = list(vector)
+        with self._lock:
+            self._remember(key, vector)
+        if self._disk is not None:
+            self._disk.write((
+                "INSERT OR REPLACE INTO query_embedding (key, vector, accessed_at) VALUES (?, ?, ?)",
+                (key, array("f", vector).tobytes(), time.time())
+            ))
+
+    def close(self) -> None:
+        """等待持久層寫入完成並關閉"""
+        if self._disk is not None:
+            self._disk.close()
+
+    def stats(self) -> Dict[str, int]:
+        """回傳快取統計資訊"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
@@ -0,0 +1,53 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+# =======================
+# 阻塞工作執行器：把模型推論 / 本地 Qdrant 等同步呼叫移出 event loop
+# =======================
+class BlockingExecutor:
+    def __init__(self, max_workers: int, name: str) -> None:
+        """初始化執行器，max_workers 即為同時執行的上限，超過的工作會排隊等候"""
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+
+    def _wrap(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """在工作執行緒中執行，並更新執行中/排隊中的計數"""
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """在執行器中執行同步函式，並以 await 等待結果（不阻塞 event loop）"""
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._wrap, func, *args, **kwargs))
+
+    def stats(self) -> Dict[str, int]:
+        """回傳執行器狀態"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": self.running,
+                "queued": self.queued,
+                "completed": self.completed
+            }
+
+    def shutdown(self) -> None:
+        """關閉執行器"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
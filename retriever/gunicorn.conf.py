@@ -0,0 +1,52 @@
+"""
+retriever pre-fork 設定：gunicorn -c gunicorn.conf.py api:app
+- master 預先載入 embedding 模型（preload_app），worker fork 後以 copy-on-write 共用權重，N 個 worker 不需 N 份模型記憶體
+- 向量索引統一由 Qdrant 服務持有（config.QDRANT_MODE = "server"），worker 只持有連線，不各自開啟本地檔案；
+  或使用 mmap 唯讀引擎（config.VECTOR_ENGINE = "mmap"），各 worker 映射同一組檔案，共用 page cache
+- 每個 worker 各自建立模型執行器、批次器與快取（lifespan 於 fork 後執行）
+"""
+import gc
+import os
+import shutil
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = config.RETRIEVER_WORKERS
+if workers > 1 and config.VECTOR_ENGINE != "mmap" and config.QDRANT_MODE != "server":
+    print("⚠️ 本地模式 Qdrant 不允許多個 process 同時開啟，workers 改為 1（請設定 QDRANT_MODE = \"server\" 或 VECTOR_ENGINE = \"mmap\"）")
+    workers = 1
+preload_app = True
+timeout = 300  # ONNX 後端由 worker 載入模型，需較長的啟動時間
+graceful_timeout = 30
+
+# 多 worker 時各 worker 的 Prometheus 指標寫入共用目錄，/metrics 彙整全部 worker（需在匯入 prometheus_client 前設定）
+if workers > 1:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", config.METRICS_MULTIPROC_DIR)
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# 在 master 載入模型：preload_app 匯入 api 時沿用同一個模組
+import api
+api.preload_embedding_model()
+
+
+def pre_fork(server, worker):
+    """fork 前凍結既有物件，避免 worker 的 GC 寫入模型物件而觸發 copy-on-write"""
+    gc.freeze()
+
+def post_fork(server, worker):
+    """依 worker 數分配 PyTorch 執行緒，避免多個 worker 搶同一批 vCPU"""
+    if config.EMBEDDING_BACKEND == "torch":
+        import torch
+        torch.set_num_threads(config.RETRIEVER_TORCH_THREADS or max(1, (os.cpu_count() or 1) // workers))
+    server.log.info(f"worker {worker.pid} 啟動")
+
+def child_exit(server, worker):
+    """worker 結束時清除其 live gauge 檔（多 worker 指標）"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
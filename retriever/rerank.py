@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import numpy as np
 import datetime
 datetime = datetime.datetime
@@ -8,29 +8,45 @@ import time
 # 重排序方法：僅在 summary search 使用
 # =======================
 class Rerank:
-    def __init__(self, embedding_model):
-        """初始化重排序類別"""
+    def __init__(self, embedding_model, embedding_batcher=None):
+        """初始化重排序類別；embedding_batcher 用於在 event loop 之外批次補算向量"""
         self.embedding = embedding_model
+        self.embedding_batcher = embedding_batcher
     
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """計算兩個向量的cos sim"""
-        vec1 = np.array(vec1)
-        vec2 = np.array(vec2)
-        if np.linalg.norm(vec1) == 0 or np.linalg.norm(vec2) == 0:
-            return 0.0
-        return float(np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2)))
+    def _cosine_similarity(self, query_vector: List[float], matrix: np.ndarray) -> np.ndarray:
+        """一次計算 query 向量與矩陣中每一列向量的 cos sim"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        return np.divide(matrix @ query, norms, out=np.zeros(len(matrix), dtype=np.float32), where=norms > 0)
+
+    async def _embed_titles(self, titles: List[str]) -> List[List[float]]:
+        """批次向量化 title（有批次器時與其他請求合併，並在 event loop 之外執行）"""
+        if self.embedding_batcher is None:
+            return self.embedding.embed_documents(titles)
+        return await self.embedding_batcher.embed_many(titles)
+
+    async def _title_matrix(self, results: List[Dict[str, Any]], title_vectors: Optional[List[Optional[List[float]]]]) -> np.ndarray:
+        """組成 title 向量矩陣；缺少預先計算向量的舊資料，以單一批次補算"""
+        title_vectors = list(title_vectors) if title_vectors else [None] * len(results)
+        missing = [i for i, vector in enumerate(title_vectors) if vector is None]
+        if missing:
+            print(f"⚠️ {len(missing)} 筆結果缺少 title 向量，改為批次向量化")
+            for i, vector in zip(missing, await self._embed_titles([results[i]["title"] for i in missing])):
+                title_vectors[i] = vector
+        return np.asarray(title_vectors, dtype=np.float32)
         
-    async def rerank_by_title(self, query_vector: List[float], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def rerank_by_title(self, query_vector: List[float], results: List[Dict[str, Any]], title_vectors: Optional[List[Optional[List[float]]]] = None) -> List[Dict[str, Any]]:
         """根據文件 title 與 query 相關性進行重排序"""
         print(f"🔄 開始 rerank_by_title，總文件數：{len(results)} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        if not results:
+            return []
         rerank_start = time.time()
-        reranked = []
-        for res in results:
-            # 計算 title 與 query 的相似度
-            title_vector = self.embedding.embed_query(res["title"])
-            res["title_similarity"] = self._cosine_similarity(query_vector, title_vector)
+        # 計算 title 與 query 的相似度（矩陣運算一次完成）
+        similarities = self._cosine_similarity(query_vector, await self._title_matrix(results, title_vectors))
+        for res, similarity in zip(results, similarities):
+            res["title_similarity"] = float(similarity)
         reranked = sorted(results, key=lambda x: x["title_similarity"], reverse=True)
         reranked_elapsed = round(time.time() - rerank_start, 4)
         print(f"✅ rerank_by_title 完成 | 耗時：{reranked_elapsed} 秒 | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"📊 Rerank 後，相似度分數範圍: {min(r['title_similarity'] for r in reranked):.4f} - {max(r['title_similarity'] for r in reranked):.4f}")
-        return reranked
\ No newline at end of file
+        return reranked
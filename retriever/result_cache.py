@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from embedding_cache import normalize_query
+
+
+# =======================
+# 檢索結果快取：以 collection 索引版本號控制失效
+# =======================
+class ResultCache:
+    def __init__(self, index_versions: Any, max_entries: int) -> None:
+        """初始化結果快取，index_versions 提供各 collection 目前的版本號"""
+        self.index_versions = index_versions
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (collection 版本號, 檢索結果)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def make_key(self, query: str, collection: str, search_type: str, top_k: int, threshold_score: float, **options: Any) -> Tuple:
+        """以檢索參數組成快取鍵，options 為其他會影響結果的參數"""
+        return (normalize_query(query), collection, search_type, top_k, threshold_score, tuple(sorted((k, repr(v)) for k, v in options.items())))
+
+    def get(self, key: Tuple, collection_name: str) -> Optional[Dict[str, Any]]:
+        """查詢快取；版本號與目前索引不同的項目視為過期並移除"""
+        if self.max_entries <= 0:
+            return None
+        version = self.index_versions.get(collection_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            cached_version, result = entry
+            if cached_version != version:
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return {"results": list(result["results"]), "total_count": result["total_count"]}
+
+    def put(self, key: Tuple, collection_name: str, result: Dict[str, Any], version: Optional[int] = None) -> None:
+        """寫入快取；version 應為檢索開始前讀到的版本號，避免檢索期間索引更新造成誤用"""
+        if self.max_entries <= 0:
+            return
+        if version is None:
+            version = self.index_versions.get(collection_name)
+        with self._lock:
+            self._entries[key] = (version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """回傳快取統計資訊"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
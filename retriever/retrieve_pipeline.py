@@ -1,5 +1,5 @@
 from typing import List, Dict, Union, Any
-from langchain_community.embeddings import HuggingFaceEmbeddings
+import asyncio
 import datetime
 datetime = datetime.datetime
 from search import VectorSearch
@@ -8,64 +8,142 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config as config
+from utils.embedding_backend import load_embedding_model
+from utils.collection_utils import resolve_collection
+from utils.metrics import stage_timer
+
+# 各輸出欄位對應的 payload 欄位（similarity_score 來自搜尋分數，不需 payload）
+PAYLOAD_FIELDS = {
+    'filename': 'filename',
+    'page': 'page',
+    'content_preview': 'content',
+    'full_content': 'content',
+    'title': 'title',
+    'file_type': 'file_type',
+    'metadata': 'metadata',
+    'intent': 'intent',
+    'summary': 'summary'
+}
+# 各輸出欄位的取值方式
+RESULT_FIELD_GETTERS = {
+    'similarity_score': lambda point: point.score,
+    'filename': lambda point: point.payload.get('filename', ''),
+    'page': lambda point: point.payload.get('page', ''),
+    'content_preview': lambda point: point.payload.get('content', '')[:200] + "..." if len(point.payload.get('content', '')) > 200 else point.payload.get('content', ''),
+    'full_content': lambda point: point.payload.get('content', ''),
+    'title': lambda point: point.payload.get('title', ''),
+    'file_type': lambda point: point.payload.get('file_type'),
+    'metadata': lambda point: point.payload.get('metadata', []),
+    'intent': lambda point: point.payload.get('intent', []),
+    'summary': lambda point: point.payload.get('summary', '')
+}
 
 # =======================
 # 檢索器
 # =======================
 class Retriever:
-    def __init__(self, search_tool, rerank_tool):
-        """初始化檢索器，注入依賴的工具實例"""
+    def __init__(self, search_tool, rerank_tool, result_cache=None):
+        """初始化檢索器，注入依賴的工具實例（result_cache 可選）"""
         self.searcher = search_tool
         self.reranker = rerank_tool
+        self.result_cache = result_cache
+
+    def _resolve_fields(self, search_type: str, fields: List[str] = None) -> List[str]:
+        """決定輸出欄位：未指定時使用 config.RESULT_FIELDS 預設值；summary 一律保留 title 供 rerank 使用"""
+        fields = [field for field in (fields or config.RESULT_FIELDS[search_type]) if field in RESULT_FIELD_GETTERS]
+        if search_type == "summary" and 'title' not in fields:
+            fields.append('title')
+        return fields
     
-    def _process_search_results(self, search_type: str, search_result: List[Any]) -> List[Dict[str, Any]]:
-        """處理搜尋結果，分成chunk與summary兩種格式"""
-        results = []
-        if search_type == "chunk":
-            for point in search_result:
-                result = {
-                    'similarity_score': point.score,
-                    'filename': point.payload.get('filename', ''),
-                    'page': point.payload.get('page', ''),
-                    'content_preview': point.payload.get('content', '')[:200] + "..." if len(point.payload.get('content', '')) > 200 else point.payload.get('content', ''),
-                    'full_content': point.payload.get('content', '')
-                }
-                results.append(result)
-        else:  # summary
-            for point in search_result:
-                result = {
-                    'similarity_score': point.score,
-                    'filename': point.payload.get('filename', ''),
-                    'title': point.payload.get('title', ''),
-                    'file_type': point.payload.get('file_type'),
-                    'metadata': point.payload.get('metadata', []),
-                    'summary': point.payload.get('summary', '')
-                }
-                results.append(result)        
-        return results  
+    def _process_search_results(self, search_type: str, search_result: List[Any], fields: List[str] = None) -> List[Dict[str, Any]]:
+        """處理搜尋結果，只輸出指定的欄位（chunk 與 summary 預設欄位不同）"""
+        fields = self._resolve_fields(search_type, fields)
+        getters = [(field, RESULT_FIELD_GETTERS[field]) for field in fields]
+        return [{field: getter(point) for field, getter in getters} for point in search_result]
+
+    def _normalize_filters(self, filters: Dict[str, Any] = None) -> Dict[str, List[Any]]:
+        """過濾條件統一為 {欄位: 排序後的值列表}，相同條件產生相同的快取鍵"""
+        if not filters:
+            return None
+        return {
+            field: sorted(values if isinstance(values, list) else [values], key=str)
+            for field, values in sorted(filters.items())
+        }
+
+    def _extract_title_vectors(self, search_result: List[Any]) -> List[Any]:
+        """取出搜尋結果中預先計算的 title 向量（舊版 collection 沒有則為 None）"""
+        return [
+            point.vector.get(config.TITLE_VECTOR_NAME) if isinstance(point.vector, dict) else None
+            for point in search_result
+        ]
     
-    async def retrieve(self, query: str, threshold_score: float, top_k: int, collection: str, search_type: str, categories: List[str] = None) -> Dict[str, Union[List[Any], int]]:
-        """主要檢索流程"""
-        # 執行向量搜尋
-        query_vector, search_result = await self.searcher.search(query, top_k, search_type, collection, categories)
+    async def retrieve(self, query: str, threshold_score: float, top_k: int, collection: str, search_type: str, filters: Dict[str, Any] = None, hybrid: bool = None, fields: List[str] = None, mode: str = None) -> Dict[str, Union[List[Any], int]]:
+        """
+        主要檢索流程；fields 指定輸出欄位（例如只取 full_content 而不取 content_preview），mode 為查詢模式（fast / accurate）
+        filters 為結構化過濾條件（欄位 -> 值或值列表），由 Qdrant 以 payload 索引過濾
+        """
+        filters = self._normalize_filters(filters)
+        # 查詢結果快取（以 collection 索引版本號控制失效）
+        collection_name, _ = resolve_collection(search_type, collection)
+        if self.result_cache is not None:
+            cache_key = self.result_cache.make_key(query, collection, search_type, top_k, threshold_score, filters=filters, hybrid=hybrid, fields=fields, mode=mode or config.DEFAULT_SEARCH_MODE)
+            cached_output = self.result_cache.get(cache_key, collection_name)
+            if cached_output is not None:
+                print(f"⚡ 結果快取命中 | query={query} | collection={collection_name}")
+                return cached_output
+            index_version = self.result_cache.index_versions.get(collection_name)
+        # 執行向量搜尋：只取回輸出需要的 payload 欄位；chunk 的閾值直接交給 Qdrant 過濾
+        # （summary 以 rerank 後的 title 相似度過濾，不能在搜尋階段截斷）
+        fields = self._resolve_fields(search_type, fields)
+        payload_fields = sorted({PAYLOAD_FIELDS[field] for field in fields if field in PAYLOAD_FIELDS})
+        score_threshold = threshold_score if search_type == "chunk" else None
+        query_vector, search_result = await self.searcher.search(
+            query, top_k, search_type, collection, filters, hybrid,
+            payload_fields=payload_fields, score_threshold=score_threshold, mode=mode
+        )
         # 處理搜尋結果
-        results = self._process_search_results(search_type, search_result)
-        print(f"📊 Search 後，相似度分數範圍: {min(r['similarity_score'] for r in results):.4f} - {max(r['similarity_score'] for r in results):.4f}")
+        with stage_timer("payload_processing", collection, search_type):
+            results = self._process_search_results(search_type, search_result, fields)
+        if results and 'similarity_score' in results[0]:
+            print(f"📊 Search 後，相似度分數範圍: {min(r['similarity_score'] for r in results):.4f} - {max(r['similarity_score'] for r in results):.4f}")
         # 根據搜尋類型進行後處理
         # summary -> 重排序
         if search_type == "summary":
-            reranked_output = await self.reranker.rerank_by_title(query_vector, results)
+            title_vectors = self._extract_title_vectors(search_result)
+            with stage_timer("rerank", collection, search_type):
+                reranked_output = await self.reranker.rerank_by_title(query_vector, results, title_vectors)
             filtered_reranked = [res for res in reranked_output if res['title_similarity'] >= threshold_score]
-            return {
+            final_output = {
                 "results": filtered_reranked,
                 "total_count": len(filtered_reranked)   
             } 
-        else: # chunk -> 直接過濾
-            filtered_results = [res for res in results if res['similarity_score'] >= threshold_score]
-            return {
-                "results": filtered_results, 
-                "total_count": len(filtered_results)
+        else: # chunk -> Qdrant / mmap 已依閾值過濾；混合檢索只有 dense prefetch 受閾值限制，sparse 命中的關鍵字結果（料號、代碼）不以 dense 相似度剔除
+            final_output = {
+                "results": results, 
+                "total_count": len(results)
             }
+        if self.result_cache is not None and len(query_vector):  # 向量化或搜尋失敗（空向量）時不快取空結果
+            self.result_cache.put(cache_key, collection_name, final_output, index_version)
+        return final_output
+
+    async def retrieve_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Union[List[Any], int]]]:
+        """
+        批次檢索：多組 (query, collection, search_type) 同時執行
+        相同的 query 在查詢向量批次器中只計算一次，且所有 query 合併為同一次模型 forward
+        """
+        outputs = await asyncio.gather(*(self.retrieve(**item) for item in items), return_exceptions=True)
+        batch_results = []
+        for item, output in zip(items, outputs):
+            if isinstance(output, Exception):
+                print(f"❌ 批次檢索項目發生錯誤: {item} | {str(output)}")
+                output = {"results": [], "total_count": 0, "error": str(output)}
+            batch_results.append({
+                "query": item["query"],
+                "collection": item["collection"],
+                "search_type": item["search_type"],
+                **output
+            })
+        return batch_results
 
 
 # =======================
@@ -74,15 +152,12 @@ class Retriever:
 if __name__ == "__main__":
     # 模型載入
     print("🔄 開始載入 BGE-M3 模型...")
-    EMBEDDING_MODEL = HuggingFaceEmbeddings(
-                model_name=config.MODEL_NAME,
-                model_kwargs=config.MODEL_KWARGS
-            )
+    EMBEDDING_MODEL = load_embedding_model()
     print("✅ BGE-M3 模型載入完成！")
     
     # 實例化 searcher & reranker
     search_tool = VectorSearch(embedding_model=EMBEDDING_MODEL)
-    rerank_tool = Rerank(embedding_model=EMBEDDING_MODEL)
+    rerank_tool = Rerank(embedding_model=EMBEDDING_MODEL, embedding_batcher=search_tool.embedding_batcher)
     retriever = Retriever(search_tool=search_tool, rerank_tool=rerank_tool)
     
     # 執行檢索測試
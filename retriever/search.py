@@ -1,85 +1,270 @@
-from typing import List, Any, Tuple
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchAny
+from typing import List, Any, Tuple, Dict
+import asyncio
+import numpy as np
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchAny, Prefetch, FusionQuery, Fusion, QueryResponse
 import datetime
 datetime = datetime.datetime
-import time
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config as config
+from embedding_cache import QueryEmbeddingCache
+from executor import BlockingExecutor
+from batcher import EmbeddingBatcher
+from utils.embedding_backend import to_sparse_vector
+from utils.collection_utils import build_search_params, resolve_collection
+from utils.mmap_index import MmapIndex, MmapIndexNotExported
+from utils.metrics import stage_timer
+
+
+def pack_sparse(weights: Dict[int, float]) -> List[float]:
+    """將 sparse 權重攤平成 [token_id, weight, ...]，以便存入查詢向量快取"""
+    return [value for token_id, weight in weights.items() for value in (float(token_id), weight)]
+
+def unpack_sparse(packed: List[float]) -> Dict[int, float]:
+    """還原 pack_sparse 攤平的 sparse 權重"""
+    return {int(packed[i]): packed[i + 1] for i in range(0, len(packed), 2)}
 
 # =======================
 # 向量搜尋
 # =======================
 class VectorSearch:
-    def __init__(self, embedding_model: Any) -> None:
+    def __init__(self, embedding_model: Any, model_executor: BlockingExecutor = None, embedding_batcher: EmbeddingBatcher = None) -> None:
         """初始化模型＋向量資料庫連線"""
         self.embedding = embedding_model
+        # 模型推論在專用執行器執行，避免阻塞 event loop；同時到達的查詢合併為一次批次推論
+        self.model_executor = model_executor or BlockingExecutor(config.MODEL_MAX_CONCURRENCY, "model")
+        self.embedding_batcher = embedding_batcher or EmbeddingBatcher(
+            embedding_model=embedding_model,
+            executor=self.model_executor,
+            max_batch_size=config.EMBEDDING_BATCH_MAX_SIZE,
+            max_wait_ms=config.EMBEDDING_BATCH_MAX_WAIT_MS
+        )
+        # 模型支援 sparse 時，混合檢索的查詢以另一個批次器一次算出 dense + sparse
+        self.hybrid_batcher = None
+        if hasattr(embedding_model, "embed_hybrid"):
+            self.hybrid_batcher = EmbeddingBatcher(
+                embedding_model=embedding_model,
+                executor=self.model_executor,
+                max_batch_size=config.EMBEDDING_BATCH_MAX_SIZE,
+                max_wait_ms=config.EMBEDDING_BATCH_MAX_WAIT_MS,
+                encode_method="embed_hybrid"
+            )
+        self.qdrant_executor = None
+        self.mmap_index = None
         try:
-            # 雲端用
-            # self.client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
-            # 本機端測試用
-            self.client = QdrantClient(path=config.PERSIST_DIRECTORY)
+            if config.VECTOR_ENGINE == "mmap":
+                # 唯讀 mmap 引擎：不開啟 Qdrant，內積計算於專用執行緒執行
+                self.client = None
+                self.mmap_index = MmapIndex(config.MMAP_INDEX_DIRECTORY)
+                self.qdrant_executor = BlockingExecutor(config.MMAP_SEARCH_CONCURRENCY, "mmap-search")
+            elif config.QDRANT_MODE == "server":
+                # 雲端用：原生非同步 client
+                self.client = AsyncQdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
+            else:
+                # 本機端測試用：同步 client，於專用執行緒存取
+                self.client = QdrantClient(path=config.PERSIST_DIRECTORY)
+                self.qdrant_executor = BlockingExecutor(config.QDRANT_LOCAL_MAX_CONCURRENCY, "qdrant-local")
             print("✅ 向量資料庫連線成功！")
         except Exception as e:
             print(f"向量資料庫連線發生錯誤: {str(e)}")
             self.client = None
+        self._vector_names = {}  # collection -> (具名 dense 向量名稱, sparse 向量名稱)；舊版單一向量 collection 為空集合
+        model_id = getattr(embedding_model, "model_id", f"{config.MODEL_NAME}:{type(embedding_model).__name__}")
+        self.embedding_cache = QueryEmbeddingCache(
+            model_id=model_id,
+            max_entries=config.EMBEDDING_CACHE_SIZE,
+            disk_path=config.EMBEDDING_CACHE_PATH,
+            disk_max_entries=config.EMBEDDING_CACHE_DISK_SIZE
+        )
+        self.sparse_cache = QueryEmbeddingCache(
+            model_id=f"{model_id}:sparse",
+            max_entries=config.EMBEDDING_CACHE_SIZE,
+            disk_path=config.EMBEDDING_CACHE_PATH,
+            disk_max_entries=config.EMBEDDING_CACHE_DISK_SIZE
+        )
 
-    def embed_query(self, text: str) -> List[float]:
-        """將User query轉換為 embedding"""
+    async def _qdrant(self, method: str, **kwargs: Any) -> Any:
+        """呼叫 Qdrant：server 模式直接 await，本地模式交給專用執行緒"""
+        if self.qdrant_executor is None:
+            return await getattr(self.client, method)(**kwargs)
+        return await self.qdrant_executor.run(getattr(self.client, method), **kwargs)
+
+    async def embed_query(self, text: str) -> List[float]:
+        """將User query轉換為 embedding，快取命中時不呼叫模型"""
+        cached = await self.embedding_cache.get(text)
+        if cached is not None:
+            return cached
         try:
-            return self.embedding.embed_query(text)
+            vector = await self.embedding_batcher.embed(text)
+            self.embedding_cache.put(text, vector)
+            return vector
         except Exception as e:
             print(f"❌ 向量化查詢時發生錯誤: {str(e)}")
             return []
+
+    async def embed_query_hybrid(self, text: str) -> Tuple[List[float], Dict[int, float]]:
+        """將User query同時轉換為 dense 與 sparse 向量，兩者皆命中快取時不呼叫模型"""
+        cached_dense, cached_sparse = await asyncio.gather(self.embedding_cache.get(text), self.sparse_cache.get(text))
+        if cached_dense is not None and cached_sparse is not None:
+            return cached_dense, unpack_sparse(cached_sparse)
+        try:
+            dense, sparse = await self.hybrid_batcher.embed(text)
+            self.embedding_cache.put(text, dense)
+            self.sparse_cache.put(text, pack_sparse(sparse))
+            return dense, sparse
+        except Exception as e:
+            print(f"❌ 向量化查詢時發生錯誤: {str(e)}")
+            return [], {}
         
-    def _build_category_filter(self, categories: List[str] = None) -> Filter:
-        """建立metadata類別過濾條件（目前無使用）"""
-        if not categories:
+    def _build_filter(self, filters: Dict[str, List[str]] = None) -> Filter:
+        """建立結構化過濾條件：每個欄位符合任一值（MatchAny），欄位之間為 AND；欄位需有 payload 索引"""
+        if not filters:
             return None
-        matching_sources = []
-        for pdf_name, pdf_categories in config.PDF_METADATA.items():
-            if any(category in pdf_categories for category in categories):
-                matching_sources.append(pdf_name)
-        if matching_sources:
-            return Filter(
-                must=[
-                    FieldCondition(
-                        key="source",
-                        match=MatchAny(any=matching_sources)
-                    )
-                ]
-            )
-        return None
+        return Filter(
+            must=[
+                FieldCondition(key=field, match=MatchAny(any=values))
+                for field, values in filters.items()
+            ]
+        )
     
-    async def search(self, query: str, top_k: int, search_type: str, collection: str, categories: List[str] = None) -> Tuple[List[float], List[Any]]:
-        """執行向量相似度搜尋"""
-        # 建立過濾條件
-        query_filter = self._build_category_filter(categories)
-        if categories and not query_filter:
-            return {"results": [], "total_count": 0}
+    async def _get_vector_names(self, collection_name: str) -> Tuple[set, set]:
+        """取得 collection 的具名 dense / sparse 向量名稱，結果會快取以避免每次查詢都讀取 collection 設定"""
+        if self.mmap_index is not None:
+            # mmap 引擎只有 dense 向量；重新匯出後向量名稱可能改變，不做快取
+            vector_names = self.mmap_index.get(collection_name).meta["vectors"]
+            return {name for name in vector_names if name}, set()
+        if collection_name not in self._vector_names:
+            collection_info = await self._qdrant("get_collection", collection_name=collection_name)
+            vectors_config = collection_info.config.params.vectors
+            sparse_config = collection_info.config.params.sparse_vectors or {}
+            self._vector_names[collection_name] = (
+                set(vectors_config.keys()) if isinstance(vectors_config, dict) else set(),
+                set(sparse_config.keys())
+            )
+        return self._vector_names[collection_name]
+
+    def _mmap_query(self, collection_name: str, query: List[float], using: str, query_filter: Filter, score_threshold: float,
+                    with_payload: Any, with_vectors: Any, limit: int) -> QueryResponse:
+        """mmap 引擎查詢，回傳與 Qdrant query_points 相同的 QueryResponse"""
+        points = self.mmap_index.get(collection_name).search(
+            query, limit, using=using, query_filter=query_filter, score_threshold=score_threshold,
+            with_payload=with_payload, with_vectors=with_vectors
+        )
+        return QueryResponse(points=points)
+
+    def _with_dense_scores(self, points: List[Any], query_vector: List[float], using: str) -> List[Any]:
+        """混合檢索結果的 score 為 RRF 排名分數，改以 dense cosine 相似度回填供顯示（順序不變，不再以此過濾）"""
+        if not points:
+            return points
+        dense_matrix = np.asarray([point.vector[using or ""] for point in points], dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(dense_matrix, axis=1) * np.linalg.norm(query)
+        scores = np.divide(dense_matrix @ query, norms, out=np.zeros(len(points), dtype=np.float32), where=norms > 0)
+        return [point.model_copy(update={"score": float(score)}) for point, score in zip(points, scores)]
+
+    async def search(self, query: str, top_k: int, search_type: str, collection: str, filters: Dict[str, List[str]] = None, hybrid: bool = None, payload_fields: List[str] = None, score_threshold: float = None, mode: str = None) -> Tuple[List[float], List[Any]]:
+        """
+        執行向量相似度搜尋；hybrid 為 None 時依 config.HYBRID_SEARCH 決定是否使用混合檢索
+        payload_fields 指定只取回的 payload 欄位（None 表示全部），score_threshold 交由 Qdrant 過濾低分結果
+        mode 為查詢模式（config.SEARCH_MODES，例如 fast / accurate），None 表示 config.DEFAULT_SEARCH_MODE
+        filters 為結構化過濾條件，例如 {"intent": ["理賠規範"], "file_type": ["條款"]}
+        collection 為資料夾名稱，single 配置下可用 all 搜尋所有資料夾
+        """
+        # 建立過濾條件（single 配置下指定的資料夾以 folder 欄位過濾）
+        collection_name, folder = resolve_collection(search_type, collection)
+        if folder is not None:
+            filters = {**(filters or {}), config.FOLDER_FIELD: [folder]}
+        query_filter = self._build_filter(filters)
         # 開始搜尋
         try:
+            dense_names, sparse_names = await self._get_vector_names(collection_name)
+            # collection 有 sparse 向量且模型支援時才使用混合檢索，否則退回 dense 檢索
+            use_hybrid = (config.HYBRID_SEARCH if hybrid is None else hybrid) \
+                and self.hybrid_batcher is not None and config.SPARSE_VECTOR_NAME in sparse_names
             # === 1. 查詢向量化 ===
-            print(f"🔍 查詢向量化 | query={query} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            embedding_start = time.time()
-            query_vector = self.embed_query(query)
-            embedding_elapsed = round(time.time() - embedding_start, 4)
+            print(f"🔍 查詢向量化 | query={query} | hybrid={use_hybrid} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            with stage_timer("query_embedding", collection, search_type) as embedding_timer:
+                if use_hybrid:
+                    query_vector, query_sparse = await self.embed_query_hybrid(query)
+                else:
+                    query_vector = await self.embed_query(query)
+            embedding_elapsed = round(embedding_timer.elapsed, 4)
             print(f"✅ 查詢向量化完成 | 耗時：{embedding_elapsed} 秒")
             # === 2. 執行搜尋 ===
             print(f"🔍 向量搜尋 | query={query} | top_k={top_k}")
-            search_start = time.time()
-            search_result = self.client.query_points(
-                    collection_name=f"{search_type}_{collection}",
-                    query=query_vector,
-                    query_filter=query_filter,
-                    with_payload=True,
-                    limit=top_k
-                ).points
-            search_elapsed = round(time.time() - search_start, 4)
+            with stage_timer("ann_search", collection, search_type) as search_timer:
+                # summary collection 若有具名 title 向量，搜尋時一併取回供 rerank 使用
+                using, with_vectors = None, False
+                search_params = build_search_params(search_type, mode)  # hnsw_ef / exact；量化 collection：oversampling + rescore
+                with_payload = payload_fields if payload_fields is not None else True
+                if search_type == "summary" and config.TITLE_VECTOR_NAME in dense_names:
+                    using, with_vectors = config.SUMMARY_VECTOR_NAME, [config.TITLE_VECTOR_NAME]
+                if use_hybrid:
+                    # dense 與 sparse 各自 prefetch 候選，在同一次 query_points 中以 RRF 融合
+                    # 閾值皆在 prefetch 內套用（dense：score_threshold；sparse：HYBRID_SPARSE_SCORE_THRESHOLD），融合結果不再後過濾，不會佔用 top_k 名額後被剔除
+                    prefetch_limit = top_k * config.HYBRID_PREFETCH_MULTIPLIER
+                    search_response = await self._qdrant(
+                            "query_points",
+                            collection_name=collection_name,
+                            prefetch=[
+                                Prefetch(query=query_vector, using=using, filter=query_filter, params=search_params, score_threshold=score_threshold, limit=prefetch_limit),
+                                Prefetch(query=to_sparse_vector(query_sparse), using=config.SPARSE_VECTOR_NAME, filter=query_filter, score_threshold=config.HYBRID_SPARSE_SCORE_THRESHOLD, limit=prefetch_limit)
+                            ],
+                            query=FusionQuery(fusion=Fusion.RRF),
+                            with_payload=with_payload,
+                            with_vectors=[using, config.TITLE_VECTOR_NAME] if using else True,  # 取回 dense 向量以回填相似度
+                            limit=top_k
+                        )
+                    search_response.points = self._with_dense_scores(search_response.points, query_vector, using)
+                elif self.mmap_index is not None:
+                    search_response = await self.qdrant_executor.run(
+                            self._mmap_query,
+                            collection_name=collection_name,
+                            query=query_vector,
+                            using=using,
+                            query_filter=query_filter,
+                            score_threshold=score_threshold,
+                            with_payload=with_payload,
+                            with_vectors=with_vectors,
+                            limit=top_k
+                        )
+                else:
+                    search_response = await self._qdrant(
+                            "query_points",
+                            collection_name=collection_name,
+                            query=query_vector,
+                            using=using,
+                            query_filter=query_filter,
+                            search_params=search_params,
+                            score_threshold=score_threshold,
+                            with_payload=with_payload,
+                            with_vectors=with_vectors,
+                            limit=top_k
+                        )
+            search_result = search_response.points
+            search_elapsed = round(search_timer.elapsed, 4)
             print(f"✅ 向量搜尋完成 | 耗時：{search_elapsed} 秒 | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             return query_vector, search_result
+        except MmapIndexNotExported:
+            # mmap 引擎不開啟 Qdrant，無法退回查詢；交由 API 回應 503
+            raise
         except Exception as e:
             print(f"❌ 搜尋時發生錯誤: {str(e)}")
-            return []
\ No newline at end of file
+            return [], []
+
+    async def close(self) -> None:
+        """關閉向量資料庫連線與執行器"""
+        await self.embedding_batcher.close()
+        if self.hybrid_batcher is not None:
+            await self.hybrid_batcher.close()
+        if self.client is not None:
+            if self.qdrant_executor is None:
+                await self.client.close()
+            else:
+                self.client.close()
+        if self.qdrant_executor is not None:
+            self.qdrant_executor.shutdown()
+        self.embedding_cache.close()
+        self.sparse_cache.close()
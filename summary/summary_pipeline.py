@@ -5,13 +5,14 @@ import config as config
 import time
 import json
 from typing import Dict, Optional
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
 from utils.get_file_utils import get_folder_paths, process_all_folders
 from utils.log_utils import get_processed_files, create_time_log_entry, log_to_file
+from utils.mmap_index import publish_collection
 from summary import summarize_document_from_json
 from utils.embedding_utils import EmbeddingProcessor
+from utils.embedding_backend import load_embedding_model
+from utils.collection_utils import create_collection
 
 
 class Summary:
@@ -48,13 +49,7 @@ class Summary:
             chunk_info = self.client.get_collection(summary_collection)
             print(f"{summary_collection} 集合連接成功，包含 {chunk_info.points_count} 條記錄")
         except Exception: # 若不存在則建立新集合
-            self.client.create_collection(
-                collection_name=summary_collection,
-                vectors_config=VectorParams(
-                    size=1024,
-                    distance=Distance.COSINE
-                )
-            )
+            create_collection(self.client, summary_collection, "summary")
             print(f"已創建向量集合: {summary_collection} ")
         
         # 確保 JSON 資料夾存在，不存在即建立
@@ -110,7 +105,7 @@ class Summary:
                 with open(summary_json, "r", encoding="utf-8") as f:
                     data = json.load(f)
                 # 呼叫 summary_embedding_upsert 進行 embedding + upsert
-                embed_success = self.embedding_processor.summary_embedding_upsert(data, summary_collection, summary_embed_log_directory)
+                embed_success = self.embedding_processor.summary_embedding_upsert(data, summary_collection, summary_embed_log_directory, folder=folder_name)
                 if embed_success:
                     embed_sucess_count += 1
                     print(f"✅ 成功向量化並儲存: {data.get('filename', json_file)}")
@@ -120,6 +115,9 @@ class Summary:
             except Exception as e:
                 embed_failed_count += 1
                 print(f" ❌ 讀取或向量化時發生錯誤: {data.get('filename', json_file)}, Error: {str(e)}")
+        # 有執行 upsert（含部分失敗）時發佈更新：mmap 引擎先重新匯出唯讀矩陣，再更新索引版本號讓檢索端快取失效
+        if embed_sucess_count + embed_failed_count > 0:
+            publish_collection(self.client, summary_collection)
         # === 最終統計 ===
         print("\n📊 處理結果總結:")
         print(f" 階段 I (Summary) 成功/失敗: {summary_success_count}/{summary_failed_count}")
@@ -140,10 +138,7 @@ def main():
     # qdrant_client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT) # 使用網路存取模式
     print("✅ Qdrant 連接成功！")
     print("🔄 BGE-M3 模型載入...")
-    embedding_model = HuggingFaceEmbeddings(
-                model_name=config.MODEL_NAME,
-                model_kwargs=config.MODEL_KWARGS
-            )
+    embedding_model = load_embedding_model()
     print("✅ BGE-M3 模型載入完成！")
     embedding_processor = EmbeddingProcessor(embedding_model=embedding_model, client=qdrant_client)
     summary = Summary(embedding_processor=embedding_processor, client=qdrant_client)
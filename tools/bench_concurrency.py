@@ -0,0 +1,83 @@
+"""
+tools/bench_concurrency.py - 檢索服務並行壓測
+- 以不同的同時進行中（in-flight）重請求數量壓測 /retrieve（每次使用不同 query，強制經過模型與 Qdrant）
+- 同時持續探測輕量請求（/health 與結果快取命中的 /retrieve），觀察其 p99 是否隨重請求數量線性成長
+
+使用方式（需先啟動 retriever：uvicorn api:app --port 8000）：
+    python tools/bench_concurrency.py --url http://localhost:8000 --levels 1 2 4 8 16 --collection other
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+import httpx
+from tools.bench_utils import percentile
+
+
+def summarize(latencies: List[float]) -> str:
+    """格式化延遲統計（毫秒）"""
+    return f"n={len(latencies):4d} p50={percentile(latencies, 50) * 1000:8.1f}ms p99={percentile(latencies, 99) * 1000:8.1f}ms"
+
+
+async def heavy_worker(client: httpx.AsyncClient, args: argparse.Namespace, worker_id: int, stop: asyncio.Event, latencies: List[float]) -> None:
+    """持續送出不會命中快取的 /retrieve 請求"""
+    i = 0
+    while not stop.is_set():
+        payload = {
+            "query": f"{args.query} {worker_id}-{i}-{time.time_ns()}",
+            "collection": args.collection,
+            "search_type": args.search_type
+        }
+        start = time.perf_counter()
+        await client.post(f"{args.url}/retrieve", json=payload)
+        latencies.append(time.perf_counter() - start)
+        i += 1
+
+async def probe(client: httpx.AsyncClient, args: argparse.Namespace, stop: asyncio.Event, latencies: Dict[str, List[float]]) -> None:
+    """定期探測輕量請求：/health 與結果快取命中的 /retrieve"""
+    cached_payload = {"query": args.query, "collection": args.collection, "search_type": args.search_type}
+    await client.post(f"{args.url}/retrieve", json=cached_payload)  # 先暖機，讓後續請求命中快取
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get(f"{args.url}/health")
+        latencies["health"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await client.post(f"{args.url}/retrieve", json=cached_payload)
+        latencies["cached_retrieve"].append(time.perf_counter() - start)
+        await asyncio.sleep(args.probe_interval)
+
+async def run_level(args: argparse.Namespace, level: int) -> None:
+    """以指定的重請求並行數壓測一段時間並輸出統計"""
+    stop = asyncio.Event()
+    heavy_latencies = []
+    probe_latencies = {"health": [], "cached_retrieve": []}
+    async with httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=level + 4)) as client:
+        tasks = [asyncio.create_task(heavy_worker(client, args, i, stop, heavy_latencies)) for i in range(level)]
+        tasks.append(asyncio.create_task(probe(client, args, stop, probe_latencies)))
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+    print(f"in-flight={level:3d} | heavy /retrieve  {summarize(heavy_latencies)}")
+    print(f"              | /health          {summarize(probe_latencies['health'])}")
+    print(f"              | cached /retrieve {summarize(probe_latencies['cached_retrieve'])}")
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="檢索服務並行壓測")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=15.0, help="每個並行等級的壓測秒數")
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--query", default="長照保險理賠流程")
+    parser.add_argument("--collection", default="other")
+    parser.add_argument("--search-type", default="chunk")
+    args = parser.parse_args()
+    for level in args.levels:
+        asyncio.run(run_level(args, level))
+
+if __name__ == "__main__":
+    main()
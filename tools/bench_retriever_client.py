@@ -0,0 +1,171 @@
+"""
+tools/bench_retriever_client.py - agent retriever client 的連線重用 / 延遲 / 重試檢查
+- 於本機啟動假的 /retrieve 服務（HTTP/1.1 keep-alive，固定延遲，記錄建立的 TCP 連線數），不需啟動 retriever 與模型
+- 檢查項目：
+    1. 依序呼叫：RetrieverClient 只建立 1 條連線；對照組 requests.post（每次新連線）
+    2. 多執行緒 / asyncio 並行呼叫：連線數不超過 RETRIEVER_POOL_SIZE（超過時排隊等候連線）
+    3. 重試：前幾次回傳 503 時以退避重試後成功
+    4. 截止時間：服務延遲超過 agent 剩餘時間時，在剩餘時間內以 RetrieverError 結束
+- 任一檢查失敗時以非 0 結束
+
+使用方式：
+    python tools/bench_retriever_client.py --requests 200 --delay-ms 5
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+import requests
+from agent.retriever_client import RetrieverClient, RetrieverError, deadline_scope
+from tools.bench_utils import percentile
+
+PAYLOAD = {"query": "長照理賠流程", "collection": "other", "search_type": "chunk"}
+
+
+class StubRetrieverServer(ThreadingHTTPServer):
+    """假的 retriever：記錄連線數，依 delay / fail_next 控制回應"""
+    daemon_threads = True
+
+    def __init__(self, delay: float) -> None:
+        super().__init__(("127.0.0.1", 0), StubRetrieverHandler)
+        self.delay = delay
+        self.fail_next = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset(self, delay: float = None, fail_next: int = 0) -> None:
+        with self.lock:
+            self.connections = 0
+            self.fail_next = fail_next
+            if delay is not None:
+                self.delay = delay
+
+class StubRetrieverHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # 與 uvicorn 相同，避免標頭與內容分開送出時的 Nagle 延遲
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            fail = self.server.fail_next > 0
+            self.server.fail_next -= 1 if fail else 0
+        time.sleep(self.server.delay)
+        status, body = (503, b'{"detail": "busy"}') if fail else (200, json.dumps({"results": [], "total_count": 0}).encode("utf-8"))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def timed_calls(func, count: int) -> List[float]:
+    """依序呼叫 count 次，回傳每次延遲"""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def summarize(latencies: List[float]) -> str:
+    """格式化延遲統計（毫秒）"""
+    return f"p50={percentile(latencies, 50) * 1000:6.2f}ms p95={percentile(latencies, 95) * 1000:6.2f}ms"
+
+def check(results: List[bool], ok: bool, message: str) -> None:
+    """輸出檢查結果"""
+    results.append(ok)
+    print(f"{'✅' if ok else '❌'} {message}")
+
+async def async_calls(client: RetrieverClient, count: int, concurrency: int) -> None:
+    """以 concurrency 個 asyncio task 並行呼叫 count 次"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            await client.aretrieve(PAYLOAD)
+    await asyncio.gather(*(one() for _ in range(count)))
+    await client.aclose()
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="agent retriever client 連線重用 / 延遲 / 重試檢查")
+    parser.add_argument("--requests", type=int, default=200, help="每項測試的請求數")
+    parser.add_argument("--delay-ms", type=float, default=5.0, help="假服務的回應延遲（毫秒）")
+    parser.add_argument("--concurrency", type=int, default=config.RETRIEVER_POOL_SIZE * 2, help="並行測試的同時請求數（預設為連線池的 2 倍）")
+    args = parser.parse_args()
+
+    server = StubRetrieverServer(args.delay_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = RetrieverClient(base_url=server.url, backoff=0.05)
+    results = []
+
+    # 1. 依序呼叫：連線重用 vs 每次新連線
+    latencies = timed_calls(lambda: client.retrieve(PAYLOAD), args.requests)
+    check(results, server.connections == 1, f"RetrieverClient 依序 {args.requests} 次：{server.connections} 條連線 | {summarize(latencies)}")
+    server.reset()
+    latencies = timed_calls(lambda: requests.post(f"{server.url}/retrieve", json=PAYLOAD).json(), args.requests)
+    print(f"   對照 requests.post（無 session）：{server.connections} 條連線 | {summarize(latencies)}")
+
+    # 2. 並行呼叫：連線數受連線池大小限制
+    server.reset()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda _: client.retrieve(PAYLOAD), range(args.requests)))
+    check(results, server.connections <= client.pool_size, f"多執行緒並行 {args.concurrency}：{server.connections} 條連線（上限 {client.pool_size}）")
+    server.reset()
+    asyncio.run(async_calls(client, args.requests, args.concurrency))
+    check(results, server.connections <= client.pool_size, f"asyncio 並行 {args.concurrency}：{server.connections} 條連線（上限 {client.pool_size}）")
+
+    # 3. 重試：前 max_retries 次回傳 503
+    server.reset(fail_next=client.max_retries)
+    try:
+        client.retrieve(PAYLOAD)
+        check(results, True, f"前 {client.max_retries} 次 503 後重試成功")
+    except RetrieverError as e:
+        check(results, False, f"重試失敗: {e}")
+    server.reset(fail_next=client.max_retries + 1)
+    try:
+        client.retrieve(PAYLOAD)
+        check(results, False, "超過重試次數仍回傳成功")
+    except RetrieverError as e:
+        check(results, True, f"超過重試次數時回報錯誤: {e}")
+
+    # 4. 截止時間：服務延遲 2 秒，agent 剩餘 0.5 秒
+    server.reset(delay=2.0)
+    start = time.perf_counter()
+    try:
+        with deadline_scope(0.5):
+            client.retrieve(PAYLOAD)
+        check(results, False, "服務延遲超過剩餘時間仍回傳成功")
+    except RetrieverError:
+        elapsed = time.perf_counter() - start
+        check(results, elapsed < 1.0, f"剩餘 0.5 秒時於 {elapsed:.2f} 秒結束（RetrieverError）")
+
+    client.close()
+    server.shutdown()
+    if not all(results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+tools/bench_search_profiles.py - HNSW 設定檔 / 查詢模式壓測
+- 對指定 collection 以 config.SEARCH_MODES 的每個查詢模式（fast / accurate / exact ...）搜尋，
+  以 exact 結果為 ground truth 計算 recall@k，並輸出 p50 / p95 延遲
+- 指定 --hnsw-profile 時，另以 config.HNSW_PROFILES 的設定建立暫存副本（{collection}__bench_{profile}），
+  比較不同索引設定的建置時間、recall 與延遲，完成後刪除副本
+
+使用方式（需連線 Qdrant 服務；本地模式為暴力搜尋，HNSW 設定無效）：
+    python tools/bench_search_profiles.py --collection summary_other --sample 200
+    python tools/bench_search_profiles.py --collection chunk_other --hnsw-profile default high_recall low_memory --output profile_report.json
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+from qdrant_client import QdrantClient
+from qdrant_client.models import CollectionStatus, PointStruct
+from utils.embedding_backend import load_embedding_model
+from utils.collection_utils import build_search_params, build_hnsw_config, collection_search_type
+from tools.migrate_collections import scroll_all_points, SCROLL_BATCH_SIZE
+from tools.query_sets import load_queries
+from tools.bench_utils import percentile
+
+
+def dense_vector_name(client: QdrantClient, collection: str) -> Any:
+    """summary collection 以具名 summary 向量搜尋，其餘為未具名向量"""
+    vectors_config = client.get_collection(collection).config.params.vectors
+    return config.SUMMARY_VECTOR_NAME if isinstance(vectors_config, dict) and config.SUMMARY_VECTOR_NAME in vectors_config else None
+
+def evaluate_modes(client: QdrantClient, collection: str, search_type: str, query_vectors: List[List[float]], top_k: int) -> Dict[str, Any]:
+    """以每個查詢模式搜尋，計算相對於 exact 的 recall@k 與延遲"""
+    using = dense_vector_name(client, collection)
+    ground_truth = [
+        {point.id for point in client.query_points(
+            collection_name=collection, query=query_vector, using=using,
+            search_params=build_search_params(search_type, "exact"), with_payload=False, limit=top_k
+        ).points}
+        for query_vector in query_vectors
+    ]
+    report = {}
+    for mode in config.SEARCH_MODES:
+        search_params = build_search_params(search_type, mode)
+        latencies, recalls = [], []
+        for query_vector, truth in zip(query_vectors, ground_truth):
+            start = time.perf_counter()
+            points = client.query_points(
+                collection_name=collection, query=query_vector, using=using,
+                search_params=search_params, with_payload=False, limit=top_k
+            ).points
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len({point.id for point in points} & truth) / len(truth) if truth else 1.0)
+        report[mode] = {
+            "recall_at_k": round(sum(recalls) / len(recalls), 4) if recalls else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2)
+        }
+    return report
+
+def build_profile_copy(client: QdrantClient, collection: str, profile: str, points: List[Any]) -> Dict[str, Any]:
+    """以指定 HNSW 設定檔建立暫存副本，等待索引建置完成，回傳副本名稱與建置時間"""
+    source_config = client.get_collection(collection).config
+    bench_collection = f"{collection}__bench_{profile}"
+    if client.collection_exists(bench_collection):
+        client.delete_collection(bench_collection)
+    build_start = time.time()
+    client.create_collection(
+        collection_name=bench_collection,
+        vectors_config=source_config.params.vectors,
+        sparse_vectors_config=source_config.params.sparse_vectors,
+        quantization_config=source_config.quantization_config,
+        hnsw_config=build_hnsw_config(profile)
+    )
+    for i in range(0, len(points), SCROLL_BATCH_SIZE):
+        client.upsert(
+            collection_name=bench_collection,
+            points=[PointStruct(id=point.id, vector=point.vector, payload=point.payload) for point in points[i:i+SCROLL_BATCH_SIZE]]
+        )
+    while client.get_collection(bench_collection).status != CollectionStatus.GREEN:
+        time.sleep(1)
+    return {"collection": bench_collection, "build_seconds": round(time.time() - build_start, 2)}
+
+def print_report(report: Dict[str, Any], top_k: int) -> None:
+    """以表格輸出報告"""
+    for target, target_report in report.items():
+        build = f" | 建置 {target_report['build_seconds']} 秒" if "build_seconds" in target_report else ""
+        print(f"\n📊 {target}{build}")
+        print(f"   {'mode':<10} {'recall@' + str(top_k):>10} {'p50(ms)':>10} {'p95(ms)':>10}")
+        for mode, values in target_report["modes"].items():
+            print(f"   {mode:<10} {values['recall_at_k']:>10.4f} {values['p50_ms']:>10.2f} {values['p95_ms']:>10.2f}")
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="HNSW 設定檔 / 查詢模式壓測")
+    parser.add_argument("--collection", nargs="+", required=True, help="壓測的 collection")
+    parser.add_argument("--hnsw-profile", nargs="*", choices=list(config.HNSW_PROFILES), help="另以這些 HNSW 設定檔建立暫存副本比較")
+    parser.add_argument("--top-k", type=int, default=config.TOP_K)
+    parser.add_argument("--sample", type=int, default=200, help="查詢集抽樣筆數")
+    parser.add_argument("--keep", action="store_true", help="保留暫存副本")
+    parser.add_argument("--output", help="報告 JSON 輸出路徑")
+    args = parser.parse_args()
+
+    client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
+    queries = [item["query"] for item in load_queries(sample_size=args.sample)]
+    print(f"🔄 載入模型並向量化 {len(queries)} 筆查詢...")
+    query_vectors = load_embedding_model().embed_documents(queries)
+
+    report = {}
+    for collection in args.collection:
+        search_type = collection_search_type(collection)
+        print(f"🔄 {collection}：以目前索引設定測試查詢模式...")
+        report[collection] = {"modes": evaluate_modes(client, collection, search_type, query_vectors, args.top_k)}
+        if not args.hnsw_profile:
+            continue
+        points = scroll_all_points(client, collection)
+        for profile in args.hnsw_profile:
+            print(f"🔄 {collection}：建立 HNSW 設定檔 {profile} 的暫存副本（{len(points)} 筆）...")
+            copy_info = build_profile_copy(client, collection, profile, points)
+            report[f"{collection} [{profile}]"] = {
+                "hnsw": config.HNSW_PROFILES[profile],
+                "build_seconds": copy_info["build_seconds"],
+                "modes": evaluate_modes(client, copy_info["collection"], search_type, query_vectors, args.top_k)
+            }
+            if not args.keep:
+                client.delete_collection(copy_info["collection"])
+    print_report(report, args.top_k)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 報告已儲存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
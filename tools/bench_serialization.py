@@ -0,0 +1,152 @@
+"""
+tools/bench_serialization.py - 回應序列化 / 壓縮壓測
+- 以典型的 30 筆 chunk /retrieve 回應，比較各編碼方式的編碼時間與傳輸大小：
+    - fastapi-json：jsonable_encoder + json.dumps（FastAPI 預設 JSONResponse 的作法）
+    - orjson：utils/api_response.py 的 ORJSONResponse
+    - msgpack：Accept: application/msgpack 時的 MessagePack 回應
+  每種編碼另計算 gzip / brotli 壓縮後的位元組數與壓縮時間（壓縮等級同 config）
+- 欄位組合：全部欄位（含 content_preview 與 full_content 重複內容）與 config.RESULT_FIELDS 預設欄位
+- 預設以合成資料（與 indexer 切塊大小相近的中文 chunk），指定 --url 時改用 retriever 的實際回應
+
+使用方式：
+    python tools/bench_serialization.py --repeat 500
+    python tools/bench_serialization.py --url http://localhost:8000 --query 長照保險理賠流程 --collection other --output serialization_report.json
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import argparse
+import gzip
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List
+from tools.bench_utils import percentile, synthetic_text
+
+ALL_CHUNK_FIELDS = ["similarity_score", "filename", "page", "content_preview", "full_content"]
+
+
+def synthetic_response(top_k: int, fields: List[str], chunk_chars: int = 900) -> Dict[str, Any]:
+    """合成 /retrieve chunk 回應：每筆約 chunk_chars 字的中文內容"""
+    rng = random.Random(0)
+    results = []
+    for i in range(top_k):
+        content = synthetic_text(rng, chunk_chars)
+        result = {
+            "similarity_score": round(0.9 - i * 0.01 - rng.random() * 0.001, 6),
+            "filename": f"保單條款_{i % 7}.pdf",
+            "page": rng.randint(1, 40),
+            "content_preview": content[:200] + "...",
+            "full_content": content
+        }
+        results.append({field: result[field] for field in fields})
+    return {"results": results, "total_count": len(results)}
+
+def live_response(url: str, query: str, collection: str, top_k: int, fields: List[str]) -> Dict[str, Any]:
+    """向 retriever 取得實際回應（JSON）"""
+    import httpx
+    response = httpx.post(f"{url}/retrieve", json={
+        "query": query, "top_k": top_k, "threshold_score": 0.0,
+        "collection": collection, "search_type": "chunk", "fields": fields
+    }, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+def available_encoders() -> Dict[str, Callable[[Any], bytes]]:
+    """可用的編碼方式，未安裝的套件略過"""
+    encoders = {}
+    try:
+        from fastapi.encoders import jsonable_encoder
+        encoders["fastapi-json"] = lambda content: json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+    except ImportError:
+        print("⚠️ 未安裝 fastapi，改以 json.dumps 代表預設 JSON 編碼")
+        encoders["json"] = lambda content: json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    try:
+        import orjson
+        encoders["orjson"] = lambda content: orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    except ImportError:
+        print("⚠️ 未安裝 orjson，略過")
+    try:
+        import msgpack
+        encoders["msgpack"] = lambda content: msgpack.packb(content, use_bin_type=True)
+    except ImportError:
+        print("⚠️ 未安裝 msgpack，略過")
+    return encoders
+
+def available_compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    """可用的壓縮方式（等級同 config），未安裝 brotli 時略過"""
+    compressors = {"identity": lambda body: body, "gzip": lambda body: gzip.compress(body, compresslevel=config.RESPONSE_GZIP_LEVEL)}
+    try:
+        import brotli
+        compressors["br"] = lambda body: brotli.compress(body, quality=config.RESPONSE_BROTLI_QUALITY)
+    except ImportError:
+        print("⚠️ 未安裝 brotli，略過")
+    return compressors
+
+def time_call(func: Callable[[Any], Any], value: Any, repeat: int) -> List[float]:
+    """重複執行並記錄每次耗時"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(value)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def bench_payload(content: Dict[str, Any], encoders: Dict[str, Callable], compressors: Dict[str, Callable], repeat: int) -> Dict[str, Any]:
+    """對單一回應計算各編碼 × 壓縮組合的時間與大小"""
+    report = {}
+    for encoder_name, encoder in encoders.items():
+        encode_latencies = time_call(encoder, content, repeat)
+        body = encoder(content)
+        for compressor_name, compressor in compressors.items():
+            compress_latencies = time_call(compressor, body, repeat) if compressor_name != "identity" else [0.0]
+            report[f"{encoder_name}+{compressor_name}"] = {
+                "encode_p50_ms": round(percentile(encode_latencies, 50) * 1000, 3),
+                "compress_p50_ms": round(percentile(compress_latencies, 50) * 1000, 3),
+                "bytes": len(compressor(body))
+            }
+    return report
+
+def print_report(report: Dict[str, Any]) -> None:
+    """以表格輸出報告（bytes 比例以 fastapi-json+identity 為基準）"""
+    for payload_name, payload_report in report.items():
+        baseline = next(iter(payload_report.values()))["bytes"]
+        print(f"\n📊 {payload_name}")
+        print(f"   {'format':<22} {'encode(ms)':>11} {'compress(ms)':>13} {'bytes':>9} {'ratio':>7}")
+        for name, values in payload_report.items():
+            print(f"   {name:<22} {values['encode_p50_ms']:>11.3f} {values['compress_p50_ms']:>13.3f} {values['bytes']:>9d} {values['bytes'] / baseline:>7.2f}")
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="回應序列化 / 壓縮壓測")
+    parser.add_argument("--url", help="retriever 位址，未指定時使用合成資料")
+    parser.add_argument("--query", default="長照保險理賠流程")
+    parser.add_argument("--collection", default="other")
+    parser.add_argument("--top-k", type=int, default=config.TOP_K)
+    parser.add_argument("--repeat", type=int, default=200, help="每個組合重複次數")
+    parser.add_argument("--output", help="報告 JSON 輸出路徑")
+    args = parser.parse_args()
+
+    field_sets = {"all fields": ALL_CHUNK_FIELDS, "default fields": config.RESULT_FIELDS["chunk"]}
+    encoders, compressors = available_encoders(), available_compressors()
+    report = {}
+    for field_name, fields in field_sets.items():
+        if args.url:
+            content = live_response(args.url, args.query, args.collection, args.top_k, fields)
+        else:
+            content = synthetic_response(args.top_k, fields)
+        payload_name = f"{field_name} | {content['total_count']} 筆"
+        print(f"🔄 {payload_name}：重複 {args.repeat} 次...")
+        report[payload_name] = bench_payload(content, encoders, compressors, args.repeat)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 報告已儲存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+tools/bench_utils.py - 壓測 / 評估工具共用的統計函式與合成資料
+"""
+import random
+from typing import List
+
+SYNTHETIC_SUBJECTS = ["被保險人", "要保人", "受益人", "本公司", "法定代理人", "醫療機構", "保險業務員", "主契約"]
+SYNTHETIC_CLAUSES = [
+    "於契約有效期間內因疾病或傷害住院診療時", "應於事故發生後{n}日內通知本公司", "得檢具診斷證明書及醫療費用收據申請理賠",
+    "依第{n}條約定給付保險金", "未依約定期限繳交保險費者", "經醫師診斷需長期照顧達{n}個月以上", "應填寫理賠申請書並附身分證明文件",
+    "於等待期間{n}日後始生效力", "每次住院以{n}萬元為限", "因意外傷害事故致成失能程度", "契約終止時應退還未滿期保險費", "依主管機關規定辦理"
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """計算百分位數（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def synthetic_text(rng: random.Random, chars: int, keywords: List[str] = None) -> str:
+    """由條款片段（與可選的關鍵字）隨機組成約 chars 字的中文段落（避免重複文字讓壓縮率失真）"""
+    sentences = []
+    while sum(len(sentence) for sentence in sentences) < chars:
+        clauses = rng.sample(SYNTHETIC_CLAUSES, rng.randint(1, 3))
+        subject = rng.choice(keywords) if keywords and rng.random() < 0.5 else rng.choice(SYNTHETIC_SUBJECTS)
+        sentences.append(subject + "，".join(clause.format(n=rng.randint(1, 365)) for clause in clauses) + "。")
+    return "".join(sentences)[:chars]
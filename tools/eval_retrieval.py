@@ -0,0 +1,256 @@
+"""
+tools/eval_retrieval.py - 以使用者回饋評估檢索品質與延遲，掃描檢索設定組合
+- 相關性標註：回饋檔（config.FEEDBACK_PATH）中同一 (query, pdf_name) 以最後一次評價為準，helpful 視為相關文件；
+  沒有任何 helpful 文件的查詢不列入評估，unhelpful 文件另計入 unhelpful 命中數
+- 每筆查詢搜尋所有資料夾（與前端未命中分類時相同：per_folder 逐一搜尋後合併，single 以 all 搜尋），依分數排序並以檔名去重後取前 k 份文件
+- 掃描組合：top_k × 查詢模式（--mode / --ef）× 量化查詢方式 × hybrid × rerank；threshold 以同一次結果事後過濾，不重複查詢
+- 指標：recall@k、MRR、平均回傳文件數、unhelpful 命中數、p50 / p95 延遲、向量與 HNSW 圖的記憶體估算
+  （查詢向量於暖機時已快取，延遲為搜尋 + payload 處理 + rerank，即各設定間會改變的部分）
+- --min-recall / --min-mrr：列出符合品質目標的設定中 p95 最低者（同分取記憶體較低、top_k 較小）
+
+使用方式（與 retriever 相同的 config；於單一 process 直接呼叫 Retriever，不經過 API 與結果快取）：
+    python tools/eval_retrieval.py --search-type summary --top-k 10 20 30 --threshold 0.4 0.5 0.6 --ef 32 64 128 256
+    python tools/eval_retrieval.py --top-k 10 30 --hybrid on off --rerank on off --quantization rescore ignore --min-recall 0.8 --output eval_report.json
+"""
+import os
+import sys
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "retriever"))  # retriever 模組之間以 from search import ... 互相匯入
+import config as config
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import resource
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from search import VectorSearch
+from rerank import Rerank
+from retrieve_pipeline import Retriever
+from utils.embedding_backend import load_embedding_model
+from utils.collection_utils import resolve_collection
+from tools.query_sets import load_feedback
+from tools.quantization_report import memory_estimate, quantization_method
+from tools.bench_utils import percentile
+
+QUANTIZATION_QUERIES = ("rescore", "no_rescore", "ignore")
+
+
+class PassThroughRerank:
+    """rerank 關閉時使用：不計算 title 相似度，以搜尋分數作為 title_similarity（threshold 改為過濾搜尋分數）"""
+
+    async def rerank_by_title(self, query_vector: List[float], results: List[Dict[str, Any]], title_vectors: Optional[List] = None) -> List[Dict[str, Any]]:
+        for res in results:
+            res["title_similarity"] = res.get("similarity_score", 0.0)
+        return sorted(results, key=lambda x: x["title_similarity"], reverse=True)
+
+def load_judgments(feedback_path: str = config.FEEDBACK_PATH) -> Dict[str, Dict[str, Set[str]]]:
+    """
+    回饋轉為相關性標註：{query: {"relevant": {檔名}, "unhelpful": {檔名}}}
+    同一 (query, 文件) 有多次評價時以時間最晚者為準
+    """
+    latest = {}
+    for feedback in sorted(load_feedback(feedback_path), key=lambda item: item.get("timestamp", "")):
+        if feedback.get("query") and feedback.get("pdf_name"):
+            latest[(feedback["query"].strip(), feedback["pdf_name"])] = feedback.get("rating")
+    judgments = {}
+    for (query, pdf_name), rating in latest.items():
+        judgment = judgments.setdefault(query, {"relevant": set(), "unhelpful": set()})
+        judgment["relevant" if rating == "helpful" else "unhelpful"].add(pdf_name)
+    return {query: judgment for query, judgment in judgments.items() if judgment["relevant"]}
+
+def register_modes(modes: List[str], efs: List[int], quantization_queries: List[str]) -> List[str]:
+    """
+    組合查詢模式：--ef 的每個值加入暫時模式 ef{n}，指定 --quantization 時再依量化查詢方式展開（{mode}/{quantization}）
+    暫時模式只加入本 process 的 config.SEARCH_MODES，不影響服務設定
+    """
+    modes = list(modes or [])
+    for ef in efs or []:
+        config.SEARCH_MODES[f"ef{ef}"] = {"hnsw_ef": ef, "exact": False, "oversampling": None}
+        modes.append(f"ef{ef}")
+    modes = modes or [config.DEFAULT_SEARCH_MODE]
+    if not quantization_queries:
+        return modes
+    combined = []
+    for mode, quantization_query in itertools.product(modes, quantization_queries):
+        config.SEARCH_MODES[f"{mode}/{quantization_query}"] = {**config.SEARCH_MODES[mode], "quantization": quantization_query}
+        combined.append(f"{mode}/{quantization_query}")
+    return combined
+
+def rank_documents(outputs: List[Dict[str, Any]], search_type: str) -> List[Tuple[str, float]]:
+    """合併各資料夾的檢索結果，依分數排序並以檔名去重（chunk 取該文件最高分的片段）"""
+    score_field = "title_similarity" if search_type == "summary" else "similarity_score"
+    best = {}
+    for output in outputs:
+        for result in output.get("results", []):
+            filename, score = result.get("filename", ""), result.get(score_field, 0.0)
+            if filename not in best or score > best[filename]:
+                best[filename] = score
+    return sorted(best.items(), key=lambda item: item[1], reverse=True)
+
+async def run_config(retriever: Retriever, queries: List[str], folders: List[str], search_type: str, top_k: int, mode: str, hybrid: bool) -> Tuple[List[List[Tuple[str, float]]], List[float]]:
+    """依序執行每筆查詢（同一查詢的各資料夾同時搜尋），回傳 (各查詢的文件排序, 各查詢延遲)；threshold 設為 -1 以保留全部結果供事後過濾"""
+    rankings, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        outputs = await asyncio.gather(*(
+            retriever.retrieve(
+                query=query, threshold_score=-1.0, top_k=top_k, collection=folder,
+                search_type=search_type, hybrid=hybrid, mode=mode
+            )
+            for folder in folders
+        ))
+        latencies.append(time.perf_counter() - start)
+        rankings.append(rank_documents(outputs, search_type))
+    return rankings, latencies
+
+def score_rankings(rankings: List[List[Tuple[str, float]]], judgments: List[Dict[str, Set[str]]], top_k: int, threshold: float) -> Dict[str, float]:
+    """以 threshold 過濾並取前 top_k 份文件後計算 recall@k、MRR、平均回傳文件數與 unhelpful 命中數"""
+    recalls, reciprocal_ranks, returned, unhelpful_hits = [], [], [], []
+    for ranking, judgment in zip(rankings, judgments):
+        documents = [filename for filename, score in ranking if score >= threshold][:top_k]
+        recalls.append(len(judgment["relevant"] & set(documents)) / len(judgment["relevant"]))
+        reciprocal_ranks.append(next((1 / rank for rank, filename in enumerate(documents, 1) if filename in judgment["relevant"]), 0.0))
+        returned.append(len(documents))
+        unhelpful_hits.append(len(judgment["unhelpful"] & set(documents)))
+    count = len(rankings) or 1
+    return {
+        "recall_at_k": round(sum(recalls) / count, 4),
+        "mrr": round(sum(reciprocal_ranks) / count, 4),
+        "avg_returned": round(sum(returned) / count, 2),
+        "avg_unhelpful_hits": round(sum(unhelpful_hits) / count, 3)
+    }
+
+async def load_collection_infos(search_tool: VectorSearch, collections: List[str]) -> Dict[str, Any]:
+    """取得 collection 設定（估算記憶體用）；mmap 引擎沒有 Qdrant 連線時回傳空字典"""
+    infos = {}
+    if search_tool.client is None:
+        return infos
+    for collection in collections:
+        try:
+            info = search_tool.client.get_collection(collection)
+            infos[collection] = await info if inspect.isawaitable(info) else info
+        except Exception as e:
+            print(f"⚠️ 無法取得 {collection} 的設定: {e}")
+    return infos
+
+def index_memory_mb(infos: Dict[str, Any], mode: str) -> Optional[float]:
+    """
+    估算查詢需要常駐的向量與 HNSW 圖大小（MB）：量化 collection 為量化向量，忽略量化（ignore）時為 float32 原始向量；
+    HNSW 圖以第 0 層每點 2m 條 4 bytes 連結估算
+    """
+    if not infos:
+        return None
+    ignore_quantization = config.SEARCH_MODES[mode].get("quantization") == "ignore"
+    total_mb = 0.0
+    for info in infos.values():
+        vectors_config = info.config.params.vectors
+        vector_count = len(vectors_config) if isinstance(vectors_config, dict) else 1
+        points_count = info.points_count or 0
+        memory = memory_estimate(points_count, vector_count, quantization_method(info))
+        total_mb += memory["original_float32_mb"] if ignore_quantization else memory["resident_mb"]
+        total_mb += points_count * vector_count * info.config.hnsw_config.m * 2 * 4 / 1024 ** 2
+    return round(total_mb, 2)
+
+def pick_cheapest(rows: List[Dict[str, Any]], min_recall: float, min_mrr: float) -> Optional[Dict[str, Any]]:
+    """符合品質目標的設定中 p95 最低者（同分取記憶體較低、top_k 較小）"""
+    candidates = [row for row in rows if row["recall_at_k"] >= min_recall and row["mrr"] >= min_mrr]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda row: (row["p95_ms"], row["memory_mb"] or 0.0, row["top_k"]))
+
+def print_report(rows: List[Dict[str, Any]]) -> None:
+    """以表格輸出報告"""
+    print(f"\n   {'top_k':>5} {'mode':<22} {'hybrid':>6} {'rerank':>6} {'thresh':>6} {'recall@k':>8} {'MRR':>6} "
+          f"{'docs':>5} {'unhelp':>6} {'p50(ms)':>8} {'p95(ms)':>8} {'mem(MB)':>8}")
+    for row in rows:
+        memory = f"{row['memory_mb']:>8.1f}" if row["memory_mb"] is not None else f"{'-':>8}"
+        print(f"   {row['top_k']:>5} {row['mode']:<22} {str(row['hybrid']):>6} {str(row['rerank']):>6} {row['threshold']:>6.2f} "
+              f"{row['recall_at_k']:>8.4f} {row['mrr']:>6.3f} {row['avg_returned']:>5.1f} {row['avg_unhelpful_hits']:>6.2f} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {memory}")
+
+
+async def evaluate(args: argparse.Namespace) -> Tuple[List[Dict[str, Any]], int]:
+    """載入模型與標註，逐一執行設定組合，回傳 (每個 (設定, threshold) 的指標, 評估查詢數)"""
+    judgments = load_judgments(args.feedback)
+    if args.sample:
+        judgments = dict(list(judgments.items())[:args.sample])
+    if not judgments:
+        raise SystemExit("❌ 回饋檔中沒有 helpful 評價，無法建立相關性標註")
+    queries = list(judgments)
+    print(f"📋 {len(queries)} 筆查詢、{sum(len(j['relevant']) for j in judgments.values())} 份相關文件")
+
+    print("🔄 BGE-M3 模型載入...")
+    embedding_model = load_embedding_model()
+    search_tool = VectorSearch(embedding_model=embedding_model)
+    retrievers = {
+        True: Retriever(search_tool=search_tool, rerank_tool=Rerank(embedding_model=embedding_model, embedding_batcher=search_tool.embedding_batcher)),
+        False: Retriever(search_tool=search_tool, rerank_tool=PassThroughRerank())
+    }
+    folders = [config.ALL_FOLDERS] if config.COLLECTION_LAYOUT == "single" else config.ALL_COLLECTIONS
+    collections = sorted({resolve_collection(args.search_type, folder)[0] for folder in folders})
+    infos = await load_collection_infos(search_tool, collections)
+    modes = register_modes(args.mode, args.ef, args.quantization)
+    hybrids = [value == "on" for value in args.hybrid] if args.hybrid else [config.HYBRID_SEARCH]
+    reranks = [value == "on" for value in args.rerank] if args.rerank and args.search_type == "summary" else [True]
+
+    # 暖機：計算並快取所有查詢向量，之後的延遲不含模型推論
+    print("🔄 暖機：計算查詢向量...")
+    await run_config(retrievers[True], queries, folders, args.search_type, max(args.top_k), config.DEFAULT_SEARCH_MODE, hybrids[0])
+
+    rows = []
+    query_judgments = [judgments[query] for query in queries]
+    for top_k, mode, hybrid, rerank in itertools.product(args.top_k, modes, hybrids, reranks):
+        print(f"🔄 top_k={top_k} mode={mode} hybrid={hybrid} rerank={rerank}")
+        rankings, latencies = await run_config(retrievers[rerank], queries, folders, args.search_type, top_k, mode, hybrid)
+        for threshold in args.threshold:
+            rows.append({
+                "top_k": top_k,
+                "mode": mode,
+                "hybrid": hybrid,
+                "rerank": rerank,
+                "threshold": threshold,
+                **score_rankings(rankings, query_judgments, top_k, threshold),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "memory_mb": index_memory_mb(infos, mode)
+            })
+    return rows, len(queries)
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="以使用者回饋評估檢索品質與延遲")
+    parser.add_argument("--feedback", default=config.FEEDBACK_PATH, help="回饋檔路徑")
+    parser.add_argument("--search-type", choices=["summary", "chunk"], default="summary", help="前端文件搜尋（回饋來源）為 summary")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[config.TOP_K])
+    parser.add_argument("--threshold", type=float, nargs="+", default=[config.THRESHOLD_SCORE])
+    parser.add_argument("--mode", nargs="*", choices=list(config.SEARCH_MODES), help="查詢模式，預設 config.DEFAULT_SEARCH_MODE")
+    parser.add_argument("--ef", type=int, nargs="*", help="另以這些 hnsw_ef 建立暫時查詢模式")
+    parser.add_argument("--quantization", nargs="*", choices=QUANTIZATION_QUERIES, help="量化查詢方式，預設依 config.QUANTIZATION_RESCORE")
+    parser.add_argument("--hybrid", nargs="*", choices=["on", "off"], help="預設依 config.HYBRID_SEARCH")
+    parser.add_argument("--rerank", nargs="*", choices=["on", "off"], help="summary 的 title rerank，預設 on")
+    parser.add_argument("--sample", type=int, help="只評估前 N 筆查詢")
+    parser.add_argument("--min-recall", type=float, default=0.0, help="品質目標：recall@k 下限")
+    parser.add_argument("--min-mrr", type=float, default=0.0, help="品質目標：MRR 下限")
+    parser.add_argument("--output", help="報告 JSON 輸出路徑")
+    args = parser.parse_args()
+
+    rows, query_count = asyncio.run(evaluate(args))
+    print_report(rows)
+    print(f"💾 評估 process 峰值記憶體：{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB（含模型）")
+    best = pick_cheapest(rows, args.min_recall, args.min_mrr)
+    if best:
+        print(f"✅ 符合目標（recall@k ≥ {args.min_recall}、MRR ≥ {args.min_mrr}）且 p95 最低：top_k={best['top_k']} mode={best['mode']} "
+              f"hybrid={best['hybrid']} rerank={best['rerank']} threshold={best['threshold']} | recall@k={best['recall_at_k']} MRR={best['mrr']} p95={best['p95_ms']}ms")
+    else:
+        print(f"⚠️ 沒有設定達到 recall@k ≥ {args.min_recall}、MRR ≥ {args.min_mrr}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"queries": query_count, "results": rows, "recommended": best}, f, ensure_ascii=False, indent=2)
+        print(f"💾 報告已儲存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+tools/export_mmap_index.py - 將 Qdrant collection 匯出為 mmap 唯讀索引
+- 每個 dense 向量匯出為 float16 / int8 矩陣（.npy），payload 匯出為欄式檔案，供 config.VECTOR_ENGINE = "mmap" 的檢索端使用
+- indexer / summary 在 VECTOR_ENGINE = "mmap" 時會於 upsert 後自動匯出；此工具用於首次匯出或切換格式
+
+使用方式：
+    python tools/export_mmap_index.py                       # 全部 chunk / summary collection
+    python tools/export_mmap_index.py --collection chunk_other --dtype int8
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import argparse
+from qdrant_client import QdrantClient
+from utils.index_version import read_index_versions
+from utils.mmap_index import export_collection
+from utils.collection_utils import list_search_collections
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="Qdrant collection 匯出 mmap 唯讀索引")
+    parser.add_argument("--collection", nargs="*", help="指定 collection，預設為全部 chunk / summary collection（兩種配置皆包含）")
+    parser.add_argument("--dtype", default=config.MMAP_INDEX_DTYPE, choices=["float16", "int8"])
+    parser.add_argument("--output", default=config.MMAP_INDEX_DIRECTORY, help="輸出目錄")
+    args = parser.parse_args()
+
+    if config.QDRANT_MODE == "server":
+        client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
+    else:
+        client = QdrantClient(path=config.PERSIST_DIRECTORY)
+    collections = args.collection or list_search_collections(client)
+    versions = read_index_versions()
+    for collection in collections:
+        export_collection(client, collection, output_dir=args.output, dtype=args.dtype, index_version=versions.get(collection, 0))
+    print(f"✅ 匯出完成，共 {len(collections)} 個 collection")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+tools/export_onnx.py - 匯出 / 驗證 ONNX Runtime 嵌入模型
+- export  ：將 config.MODEL_NAME 的 BGE-M3 匯出為 ONNX（CLS 正規化 dense 向量，若有 sparse_linear.pt 一併輸出 sparse 權重），
+            再以 ONNX Runtime dynamic int8 量化；權重超過 protobuf 2GB 上限，一律以外部資料格式（*.onnx.data）存放；
+            tokenizer 與 export_info.json 一併存放於輸出目錄
+- validate：以查詢集（與可選的 chunk 內容）比較 ONNX fp32 / int8 與 PyTorch fp32 的 cosine 一致性與推論速度
+
+使用方式：
+    python tools/export_onnx.py export --output ../model_onnx
+    python tools/export_onnx.py validate --model-dir ../model_onnx --sample 200 --docs-collection chunk_other --output onnx_report.json
+匯出後將 config.EMBEDDING_BACKEND 設為 "onnx" 即可由 retriever / indexer / summary 使用
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+from utils.embedding_backend import ONNX_MODEL_FILES, ONNX_EXPORT_INFO, load_embedding_model, load_onnx_model
+from tools.query_sets import load_queries
+from tools.bench_utils import percentile
+
+ONNX_OPSET = 17
+
+
+def export_model(model_name: str, output_dir: str) -> Dict[str, Any]:
+    """匯出 fp32 ONNX 模型並產生 dynamic int8 量化版本，回傳 export_info"""
+    import tempfile
+    import onnx
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    class BGEM3OnnxWrapper(torch.nn.Module):
+        """輸出與 BGEM3FlagModel 相同的 dense（CLS + L2 正規化）與 sparse（relu(sparse_linear)）結果"""
+        def __init__(self, model: Any, sparse_linear: Any = None):
+            super().__init__()
+            self.model = model
+            self.sparse_linear = sparse_linear
+
+        def forward(self, input_ids: Any, attention_mask: Any) -> Any:
+            hidden_state = self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+            dense_vecs = torch.nn.functional.normalize(hidden_state[:, 0], dim=-1)
+            if self.sparse_linear is None:
+                return dense_vecs
+            return dense_vecs, torch.relu(self.sparse_linear(hidden_state)).squeeze(-1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sparse_linear = None
+    sparse_linear_path = os.path.join(model_name, "sparse_linear.pt")
+    if os.path.exists(sparse_linear_path):
+        sparse_linear = torch.nn.Linear(model.config.hidden_size, 1)
+        sparse_linear.load_state_dict(torch.load(sparse_linear_path, map_location="cpu"))
+        sparse_linear.eval()
+    else:
+        print(f"⚠️ 找不到 {sparse_linear_path}，僅匯出 dense 輸出")
+    wrapper = BGEM3OnnxWrapper(model, sparse_linear)
+
+    output_names = ["dense_vecs", "sparse_weights"] if sparse_linear is not None else ["dense_vecs"]
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "attention_mask": {0: "batch", 1: "sequence"},
+        "dense_vecs": {0: "batch"}
+    }
+    if sparse_linear is not None:
+        dynamic_axes["sparse_weights"] = {0: "batch", 1: "sequence"}
+    dummy = tokenizer(["匯出用範例文字", "ONNX export sample"], padding=True, return_tensors="pt")
+    fp32_path = os.path.join(output_dir, ONNX_MODEL_FILES[False])
+    int8_path = os.path.join(output_dir, ONNX_MODEL_FILES[True])
+
+    print(f"🔄 匯出 fp32 ONNX 模型: {fp32_path}")
+    # BGE-M3 fp32 權重超過 protobuf 2GB 上限：先匯出到暫存目錄，再將權重集中存成單一外部資料檔（model.onnx.data）
+    with tempfile.TemporaryDirectory(dir=output_dir) as export_dir:
+        export_path = os.path.join(export_dir, ONNX_MODEL_FILES[False])
+        with torch.no_grad():
+            torch.onnx.export(
+                wrapper,
+                (dummy["input_ids"], dummy["attention_mask"]),
+                export_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=output_names,
+                dynamic_axes=dynamic_axes,
+                opset_version=ONNX_OPSET,
+                do_constant_folding=True
+            )
+        onnx.save_model(
+            onnx.load(export_path),
+            fp32_path,
+            save_as_external_data=True,
+            all_tensors_to_one_file=True,
+            location=f"{ONNX_MODEL_FILES[False]}.data"
+        )
+    print(f"🔄 dynamic int8 量化: {int8_path}")
+    # 量化過程同樣需以外部資料格式讀寫，否則序列化超過 2GB 的圖會失敗或寫出不完整的模型
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+    tokenizer.save_pretrained(output_dir)
+
+    export_info = {
+        "source_model": model_name,
+        "sparse": sparse_linear is not None,
+        "opset": ONNX_OPSET,
+        "files": {"fp32": ONNX_MODEL_FILES[False], "int8": ONNX_MODEL_FILES[True]},
+        "external_data": True
+    }
+    with open(os.path.join(output_dir, ONNX_EXPORT_INFO), "w", encoding="utf-8") as f:
+        json.dump(export_info, f, ensure_ascii=False, indent=2)
+    print(f"✅ 匯出完成: {output_dir}")
+    return export_info
+
+def load_doc_texts(collection: str, sample_size: int) -> List[str]:
+    """從 Qdrant collection 取出 chunk 內容 / summary 作為文件端驗證文字"""
+    from qdrant_client import QdrantClient
+    if config.QDRANT_MODE == "server":
+        client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
+    else:
+        client = QdrantClient(path=config.PERSIST_DIRECTORY)
+    points, _ = client.scroll(collection_name=collection, limit=sample_size, with_payload=["content", "summary"], with_vectors=False)
+    return [point.payload.get("content") or point.payload.get("summary", "") for point in points if point.payload]
+
+def time_encode(embedding_model: Any, texts: List[str], batch_size: int) -> Dict[str, Any]:
+    """單筆（線上查詢）與批次（索引）兩種情境的推論時間，回傳向量與延遲統計"""
+    single_latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        embedding_model.embed_query(text)
+        single_latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(embedding_model.embed_documents(texts[i:i+batch_size]))
+    batch_seconds = time.perf_counter() - start
+    return {
+        "vectors": np.asarray(vectors, dtype=np.float32),
+        "single_p50_ms": percentile(single_latencies, 50) * 1000,
+        "single_p95_ms": percentile(single_latencies, 95) * 1000,
+        "batch_texts_per_sec": len(texts) / batch_seconds if batch_seconds else 0.0
+    }
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """逐筆計算兩組向量的 cosine similarity"""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {"mean": float(cosines.mean()), "min": float(cosines.min()), "p05": float(np.percentile(cosines, 5))}
+
+def top1_agreement(reference: np.ndarray, candidate: np.ndarray, queries: int) -> Optional[float]:
+    """查詢對文件的最近鄰是否與 PyTorch fp32 相同（需同時有查詢與文件）"""
+    if queries == 0 or queries == len(reference):
+        return None
+    reference_top1 = np.argmax(reference[:queries] @ reference[queries:].T, axis=1)
+    candidate_top1 = np.argmax(candidate[:queries] @ candidate[queries:].T, axis=1)
+    return float(np.mean(reference_top1 == candidate_top1))
+
+def validate(model_dir: str, sample_size: int, docs_collection: str, doc_sample: int, batch_size: int) -> Dict[str, Any]:
+    """比較 PyTorch fp32 與 ONNX fp32 / int8 的向量一致性與速度"""
+    queries = [item["query"] for item in load_queries(sample_size=sample_size)]
+    docs = load_doc_texts(docs_collection, doc_sample) if docs_collection else []
+    texts = queries + docs
+    print(f"🔄 驗證文字：查詢 {len(queries)} 筆、文件 {len(docs)} 筆")
+
+    print("🔄 PyTorch fp32 推論...")
+    reference = time_encode(load_embedding_model("torch"), texts, batch_size)
+    report = {"texts": {"queries": len(queries), "docs": len(docs)}, "backends": {}}
+    report["backends"]["torch-fp32"] = {key: round(value, 2) for key, value in reference.items() if key != "vectors"}
+    for variant, quantized in (("onnx-fp32", False), ("onnx-int8", True)):
+        if not os.path.exists(os.path.join(model_dir, ONNX_MODEL_FILES[quantized])):
+            print(f"⚠️ 找不到 {variant} 模型，略過")
+            continue
+        print(f"🔄 {variant} 推論...")
+        result = time_encode(load_onnx_model(model_dir, quantized=quantized, hybrid=False), texts, batch_size)
+        report["backends"][variant] = {
+            **{key: round(value, 2) for key, value in result.items() if key != "vectors"},
+            "cosine_vs_torch": {key: round(value, 5) for key, value in cosine_agreement(reference["vectors"], result["vectors"]).items()},
+            "top1_agreement": top1_agreement(reference["vectors"], result["vectors"], len(queries)),
+            "single_speedup": round(reference["single_p50_ms"] / result["single_p50_ms"], 2) if result["single_p50_ms"] else None,
+            "batch_speedup": round(result["batch_texts_per_sec"] / reference["batch_texts_per_sec"], 2) if reference["batch_texts_per_sec"] else None
+        }
+    return report
+
+def print_report(report: Dict[str, Any]) -> None:
+    """以表格輸出報告"""
+    print(f"\n📊 查詢 {report['texts']['queries']} 筆 / 文件 {report['texts']['docs']} 筆")
+    print(f"   {'backend':<11} {'p50(ms)':>9} {'p95(ms)':>9} {'batch/s':>9} {'speedup':>8} {'cos mean':>9} {'cos min':>9} {'top1':>6}")
+    for backend, values in report["backends"].items():
+        cosine = values.get("cosine_vs_torch", {})
+        top1 = values.get("top1_agreement")
+        print(f"   {backend:<11} {values['single_p50_ms']:>9.2f} {values['single_p95_ms']:>9.2f} {values['batch_texts_per_sec']:>9.2f} "
+              f"{values.get('single_speedup') or 1.0:>8.2f} {cosine.get('mean', 1.0):>9.5f} {cosine.get('min', 1.0):>9.5f} "
+              f"{'-' if top1 is None else f'{top1:.3f}':>6}")
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="ONNX Runtime 嵌入模型匯出 / 驗證工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="匯出 ONNX 模型並產生 int8 量化版本")
+    export_parser.add_argument("--model", default=config.MODEL_NAME, help="來源模型目錄")
+    export_parser.add_argument("--output", default=config.ONNX_MODEL_PATH, help="輸出目錄")
+    validate_parser = subparsers.add_parser("validate", help="比較 ONNX 與 PyTorch fp32 的 cosine 一致性與速度")
+    validate_parser.add_argument("--model-dir", default=config.ONNX_MODEL_PATH)
+    validate_parser.add_argument("--sample", type=int, default=200, help="查詢集抽樣筆數")
+    validate_parser.add_argument("--docs-collection", help="額外取 chunk / summary 內容驗證文件端向量，例如 chunk_other")
+    validate_parser.add_argument("--doc-sample", type=int, default=100)
+    validate_parser.add_argument("--batch-size", type=int, default=config.chunk_batch_size)
+    validate_parser.add_argument("--output", help="報告 JSON 輸出路徑")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_model(args.model, args.output)
+        return
+    report = validate(args.model_dir, args.sample, args.docs_collection, args.doc_sample, args.batch_size)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 報告已儲存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+tools/load_test.py - retriever / agent 端到端壓測（open-loop）
+- 依 --rate 的 Poisson 到達率送出請求，不等待前一個請求完成（open-loop），延遲自「預定送出時間」起算，
+  服務變慢時排隊時間會反映在延遲上，不會因壓測端等待而低估（coordinated omission）
+- 查詢集：tools/query_sets.py（kw_mapping.json 關鍵字 + 回饋檔查詢），依 --mix 比例打 /retrieve（chunk / summary）與 /agent
+- 報告：每個 (endpoint, collection, search_type) 的吞吐量、錯誤數與 p50 / p95 / p99，可與基準報告比較
+- 超過 --max-in-flight 而未送出的請求計入錯誤（另列 dropped），過載時錯誤率不會比正常情況更好看
+
+本地執行（合成語料 + stub LLM，不需 Bedrock）：
+    python tools/synthetic_corpus.py --path ../qdrant_loadtest --embedding random --reset
+    # config：PERSIST_DIRECTORY 指向 ../qdrant_loadtest、LLM_BACKEND = "stub"，啟動 retriever（:8000）與 agent（:8001）
+    python tools/load_test.py --rate 5 --duration 60 --mix chunk=0.4 summary=0.4 agent=0.2 --output load_baseline.json
+    python tools/load_test.py --rate 5 --duration 60 --baseline load_baseline.json --max-regression 0.2
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Tuple
+import httpx
+from tools.query_sets import load_queries
+from tools.bench_utils import percentile
+
+TARGETS = ("chunk", "summary", "agent")
+
+
+def parse_mix(mix: List[str]) -> Dict[str, float]:
+    """解析 --mix（例如 chunk=0.4 summary=0.4 agent=0.2），回傳正規化後的比例"""
+    weights = {}
+    for item in mix:
+        target, _, weight = item.partition("=")
+        if target not in TARGETS:
+            raise SystemExit(f"❌ 不支援的壓測目標: {target}，可用目標: {list(TARGETS)}")
+        weights[target] = float(weight or 1)
+    total = sum(weights.values())
+    return {target: weight / total for target, weight in weights.items() if weight > 0}
+
+def build_request(target: str, item: Dict[str, str], args: argparse.Namespace, rng: random.Random) -> Tuple[str, Dict[str, Any], Tuple[str, str, str]]:
+    """組成請求：回傳 (url, json, 報告分組鍵)"""
+    if target == "agent":
+        return f"{args.agent_url}/agent", {"query": item["query"], "fields": ["final_result"]}, ("/agent", "", "")
+    collection = item["collection"] or (config.ALL_FOLDERS if config.COLLECTION_LAYOUT == "single" else rng.choice(config.ALL_COLLECTIONS))
+    payload = {
+        "query": item["query"],
+        "top_k": args.top_k,
+        "threshold_score": args.threshold,
+        "collection": collection,
+        "search_type": target
+    }
+    if args.mode:
+        payload["mode"] = args.mode
+    return f"{args.retriever_url}/retrieve", payload, ("/retrieve", collection, target)
+
+async def send(client: httpx.AsyncClient, url: str, payload: Dict[str, Any], key: Tuple[str, str, str], scheduled: float, records: List[Dict[str, Any]]) -> None:
+    """送出單一請求，記錄自預定送出時間起算的延遲與服務時間"""
+    sent = time.perf_counter()
+    try:
+        response = await client.post(url, json=payload)
+        ok = response.status_code == 200 and "error" not in response.json()
+    except Exception:
+        ok = False
+    finished = time.perf_counter()
+    records.append({"key": key, "ok": ok, "dropped": False, "latency": finished - scheduled, "service": finished - sent, "scheduled": scheduled})
+
+async def run_load(args: argparse.Namespace) -> Tuple[List[Dict[str, Any]], int, float]:
+    """依 Poisson 到達率送出請求直到 duration 結束，回傳 (記錄, 因 in-flight 上限而丟棄的請求數, 起始時間)"""
+    rng = random.Random(args.seed)
+    queries = load_queries(sample_size=args.sample, seed=args.seed)
+    mix = parse_mix(args.mix)
+    targets, weights = list(mix), list(mix.values())
+    records, tasks, dropped = [], set(), 0
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        next_arrival = start
+        while next_arrival - start < args.duration:
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            target = rng.choices(targets, weights)[0]
+            url, payload, key = build_request(target, rng.choice(queries), args, rng)
+            if len(tasks) >= args.max_in_flight:
+                # 壓測端已飽和：記為失敗的請求，計入錯誤率
+                dropped += 1
+                records.append({"key": key, "ok": False, "dropped": True, "latency": 0.0, "service": 0.0, "scheduled": next_arrival})
+            else:
+                task = asyncio.create_task(send(client, url, payload, key, next_arrival, records))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            next_arrival += rng.expovariate(args.rate)
+        if tasks:
+            await asyncio.gather(*tasks)
+    return records, dropped, start
+
+def summarize(records: List[Dict[str, Any]], measured_seconds: float) -> Dict[str, Any]:
+    """依 (endpoint, collection, search_type) 分組統計，另加每個 endpoint 的總計"""
+    groups = {}
+    for record in records:
+        endpoint, collection, search_type = record["key"]
+        if collection or search_type:
+            groups.setdefault(f"{endpoint} {collection} {search_type}", []).append(record)
+        groups.setdefault(f"{endpoint} (all)", []).append(record)
+    report = {}
+    for name, group in sorted(groups.items()):
+        latencies = [record["latency"] for record in group if record["ok"]]
+        report[name] = {
+            "requests": len(group),
+            "errors": sum(1 for record in group if not record["ok"]),  # 含 dropped
+            "dropped": sum(1 for record in group if record["dropped"]),
+            "throughput_rps": round(len(latencies) / measured_seconds, 3) if measured_seconds else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "service_p50_ms": round(percentile([record["service"] for record in group if record["ok"]], 50) * 1000, 1)
+        }
+    return report
+
+def compare_baseline(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """與基準報告比較 p95 與錯誤率（含因 in-flight 上限丟棄的請求），回傳退化項目"""
+    regressions = []
+    for name, values in report.items():
+        base = baseline.get(name)
+        if not base or not base["p95_ms"]:
+            continue
+        if values["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms → {values['p95_ms']}ms")
+        base_error_rate = base["errors"] / base["requests"] if base["requests"] else 0.0
+        error_rate = values["errors"] / values["requests"] if values["requests"] else 0.0
+        if error_rate > base_error_rate + 0.01:
+            regressions.append(f"{name}: 錯誤率 {base_error_rate:.2%} → {error_rate:.2%}")
+    return regressions
+
+def print_report(report: Dict[str, Any], dropped: int) -> None:
+    """以表格輸出報告"""
+    print(f"\n📊 壓測結果（因 in-flight 上限丟棄 {dropped} 個請求）")
+    print(f"   {'endpoint / collection / search_type':<48} {'req':>6} {'err':>5} {'drop':>5} {'rps':>7} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}")
+    for name, values in report.items():
+        print(f"   {name:<48} {values['requests']:>6} {values['errors']:>5} {values['dropped']:>5} {values['throughput_rps']:>7.2f} "
+              f"{values['p50_ms']:>9.1f} {values['p95_ms']:>9.1f} {values['p99_ms']:>9.1f}")
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="retriever / agent 端到端壓測（open-loop）")
+    parser.add_argument("--retriever-url", default="http://localhost:8000")
+    parser.add_argument("--agent-url", default="http://localhost:8001")
+    parser.add_argument("--rate", type=float, default=5.0, help="平均到達率（請求 / 秒）")
+    parser.add_argument("--duration", type=float, default=60.0, help="送出請求的秒數")
+    parser.add_argument("--warmup", type=float, default=5.0, help="前幾秒的請求不列入統計")
+    parser.add_argument("--mix", nargs="+", default=["chunk=0.4", "summary=0.4", "agent=0.2"], help="各目標比例（chunk / summary / agent）")
+    parser.add_argument("--sample", type=int, help="查詢集抽樣筆數，預設全部")
+    parser.add_argument("--top-k", type=int, default=config.TOP_K)
+    parser.add_argument("--threshold", type=float, default=config.THRESHOLD_SCORE, help="相似度閾值（random 合成語料請設為 0）")
+    parser.add_argument("--mode", choices=list(config.SEARCH_MODES), help="查詢模式，預設依 config.DEFAULT_SEARCH_MODE")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="同時進行中的請求上限，超過時丟棄並計為錯誤")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="報告 JSON 輸出路徑")
+    parser.add_argument("--baseline", help="基準報告 JSON，p95 或錯誤率退化時以非 0 結束")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允許的 p95 退化比例")
+    args = parser.parse_args()
+
+    print(f"🚀 open-loop 壓測：{args.rate} req/s × {args.duration} 秒 | mix={parse_mix(args.mix)}")
+    records, dropped, start = asyncio.run(run_load(args))
+    measured = [record for record in records if record["scheduled"] - start >= args.warmup]
+    report = summarize(measured, max(args.duration - args.warmup, 0.0))
+    print_report(report, dropped)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 報告已儲存到 {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_baseline(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ 與基準報告相比無明顯退化")
+
+if __name__ == "__main__":
+    main()
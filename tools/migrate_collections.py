@@ -0,0 +1,384 @@
+"""
+tools/migrate_collections.py - 既有 Qdrant collection 遷移工具
+- title-vectors：為舊版 summary collection 補上具名 title 向量（rerank 直接取用，不需即時向量化）
+- sparse-vectors：為 chunk / summary collection 補上 BGE-M3 sparse 向量（混合檢索用），dense 向量沿用原值
+- quantize：依 config.QUANTIZATION 為 chunk / summary collection 設定量化（原始向量移至磁碟），不需重建
+- hnsw：依 config.HNSW_PROFILE 更新 chunk / summary collection 的 HNSW 索引設定（Qdrant 於背景重建索引）
+- payload-index：依 config.PAYLOAD_INDEX_FIELDS 建立 payload 索引，並由 summary JSON 回填 summary collection 的 intent 欄位
+- consolidate：將 chunk_{folder} / summary_{folder} 合併為單一 chunk / summary collection（config.COLLECTION_LAYOUT = "single"），
+               向量與 payload 直接複製並補上 folder 欄位，不需重新向量化；來源 collection 保留，確認無誤後再手動刪除
+- 未指定 --collection 時包含兩種配置的 collection（chunk_{folder} / summary_{folder} 與單一 chunk / summary），不含暫存 collection
+
+使用方式：
+    python tools/migrate_collections.py title-vectors            # 遷移全部 summary collection
+    python tools/migrate_collections.py title-vectors --collection summary_other
+    python tools/migrate_collections.py sparse-vectors           # 遷移全部 chunk / summary collection
+    python tools/migrate_collections.py quantize                 # 遷移全部 chunk / summary collection
+    python tools/migrate_collections.py hnsw --profile high_recall
+    python tools/migrate_collections.py payload-index
+    python tools/migrate_collections.py consolidate              # 合併 chunk_* → chunk、summary_* → summary
+    python tools/migrate_collections.py consolidate --search-type summary
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import argparse
+import json
+import time
+from typing import List, Any, Dict
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, SparseVectorParams, VectorParamsDiff, Filter, FieldCondition, MatchValue
+from utils.embedding_backend import load_embedding_model, to_sparse_vector, BGEM3HybridEmbeddings
+from utils.collection_utils import (
+    build_vectors_config, build_quantization_config, build_hnsw_config,
+    create_payload_indexes, create_collection, create_folder_index, partition_point_id,
+    collection_search_type, list_search_collections
+)
+from utils.get_file_utils import get_folder_paths, get_pdf_folders
+from utils.mmap_index import publish_collection
+
+SCROLL_BATCH_SIZE = 256
+STAGING_SUFFIX = "__new"  # recreate_collection 的暫存 collection 後綴
+
+
+# =======================
+# 共用工具
+# =======================
+def scroll_all_points(client: QdrantClient, collection: str) -> List[Any]:
+    """逐頁讀出 collection 內所有資料點（含向量與 payload）"""
+    points = []
+    offset = None
+    while True:
+        batch, offset = client.scroll(
+            collection_name=collection,
+            limit=SCROLL_BATCH_SIZE,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        points.extend(batch)
+        if offset is None:
+            return points
+
+def list_collections(client: QdrantClient, prefix: str) -> List[str]:
+    """列出指定前綴的 collection 名稱（不含遷移中的暫存 collection）"""
+    return [c.name for c in client.get_collections().collections if c.name.startswith(prefix) and not c.name.endswith(STAGING_SUFFIX)]
+
+def upsert_points(client: QdrantClient, collection: str, points: List[PointStruct]) -> None:
+    """分批寫入資料點"""
+    for i in range(0, len(points), SCROLL_BATCH_SIZE):
+        client.upsert(collection_name=collection, points=points[i:i+SCROLL_BATCH_SIZE])
+
+def copy_payload_indexes(client: QdrantClient, source: str, target: str) -> None:
+    """將來源 collection 既有的 payload 索引（含 folder tenant 索引）建立於目標 collection"""
+    for field, info in (client.get_collection(source).payload_schema or {}).items():
+        client.create_payload_index(collection_name=target, field_name=field, field_schema=info.params or info.data_type)
+
+def verify_point_count(client: QdrantClient, collection: str, expected: int) -> None:
+    """確認 collection 的資料點數量與預期相同，不符時拋出例外（中止遷移，不刪除任何 collection）"""
+    count = client.count(collection_name=collection, exact=True).count
+    if count != expected:
+        raise RuntimeError(f"{collection} 資料點數量 {count} 與預期 {expected} 不符，中止遷移")
+
+def recreate_collection(client: QdrantClient, collection: str, points: List[PointStruct], **collection_config: Any) -> None:
+    """
+    以新的設定重建 collection，並分批寫回資料點（資料點需已讀入記憶體）
+    先完整寫入暫存 collection {collection}__new 並確認筆數，才刪除並重建原 collection；
+    任何一步失敗時資料仍完整保留在原 collection 或暫存 collection，完成後發佈更新（mmap 匯出 + 索引版本號）
+    """
+    staging = f"{collection}{STAGING_SUFFIX}"
+    if client.collection_exists(staging):
+        client.delete_collection(staging)  # 上次中斷的暫存 collection（原 collection 仍存在才會走到這裡）
+    client.create_collection(collection_name=staging, **collection_config)
+    copy_payload_indexes(client, collection, staging)
+    upsert_points(client, staging, points)
+    verify_point_count(client, staging, len(points))
+    try:
+        client.delete_collection(collection)
+        client.create_collection(collection_name=collection, **collection_config)
+        copy_payload_indexes(client, staging, collection)
+        upsert_points(client, collection, points)
+        verify_point_count(client, collection, len(points))
+    except Exception:
+        print(f"❌ {collection} 重建失敗，完整資料保留於 {staging}，請確認後以該 collection 還原")
+        raise
+    client.delete_collection(staging)
+    publish_collection(client, collection)
+
+
+# =======================
+# title-vectors：summary collection 補上 title 向量
+# =======================
+def migrate_title_vectors(client: QdrantClient, embedding_model: Any, collection: str) -> bool:
+    """
+    將單一向量的 summary collection 轉為具名向量（summary + title）
+    summary 向量沿用原值，只對 title 重新向量化；資料點先讀入記憶體再重建 collection
+    """
+    vectors_config = client.get_collection(collection).config.params.vectors
+    if isinstance(vectors_config, dict) and config.TITLE_VECTOR_NAME in vectors_config:
+        print(f"⏭️ {collection} 已包含 title 向量，略過")
+        return False
+    migrate_start = time.time()
+    points = scroll_all_points(client, collection)
+    print(f"🔄 {collection}：讀取 {len(points)} 筆資料點，開始向量化 title...")
+    titles = [point.payload.get("title", "") for point in points]
+    title_vectors = []
+    for i in range(0, len(titles), config.chunk_batch_size):
+        title_vectors.extend(embedding_model.embed_documents(titles[i:i+config.chunk_batch_size]))
+    # 重建 collection 為具名向量格式
+    collection_params = client.get_collection(collection).config.params
+    new_points = [
+        PointStruct(
+            id=point.id,
+            vector={config.SUMMARY_VECTOR_NAME: point.vector, config.TITLE_VECTOR_NAME: title_vector},
+            payload=point.payload
+        )
+        for point, title_vector in zip(points, title_vectors)
+    ]
+    recreate_collection(
+        client,
+        collection,
+        new_points,
+        vectors_config=build_vectors_config("summary"),
+        sparse_vectors_config=collection_params.sparse_vectors,
+        quantization_config=collection_params.quantization_config,
+        hnsw_config=build_hnsw_config()
+    )
+    print(f"✅ {collection} 遷移完成 | {len(new_points)} 筆 | 耗時：{round(time.time() - migrate_start, 4)} 秒")
+    return True
+
+
+# =======================
+# sparse-vectors：補上 BGE-M3 sparse 向量
+# =======================
+def sparse_source_text(collection: str, payload: Dict[str, Any]) -> str:
+    """取得計算 sparse 向量的原文：chunk 為內容，summary 為 title + 摘要（與索引時一致）"""
+    if collection_search_type(collection) == "summary":
+        return f"{payload.get('title', '')} {payload.get('summary', '')}"
+    return payload.get("content", "")
+
+def migrate_sparse_vectors(client: QdrantClient, embedding_model: BGEM3HybridEmbeddings, collection: str) -> bool:
+    """
+    為 collection 加上具名 sparse 向量：dense 向量（含 summary 的具名向量）沿用原值，只重新計算 sparse
+    """
+    collection_params = client.get_collection(collection).config.params
+    if config.SPARSE_VECTOR_NAME in (collection_params.sparse_vectors or {}):
+        print(f"⏭️ {collection} 已包含 sparse 向量，略過")
+        return False
+    migrate_start = time.time()
+    points = scroll_all_points(client, collection)
+    print(f"🔄 {collection}：讀取 {len(points)} 筆資料點，開始計算 sparse 向量...")
+    texts = [sparse_source_text(collection, point.payload) for point in points]
+    sparse_weights = []
+    for i in range(0, len(texts), config.chunk_batch_size):
+        sparse_weights.extend(sparse for _, sparse in embedding_model.embed_hybrid(texts[i:i+config.chunk_batch_size]))
+    new_points = []
+    for point, weights in zip(points, sparse_weights):
+        # 未命名的 dense 向量以 "" 為名稱，與 sparse 向量並存
+        dense_vectors = point.vector if isinstance(point.vector, dict) else {"": point.vector}
+        new_points.append(PointStruct(
+            id=point.id,
+            vector={**dense_vectors, config.SPARSE_VECTOR_NAME: to_sparse_vector(weights)},
+            payload=point.payload
+        ))
+    recreate_collection(
+        client,
+        collection,
+        new_points,
+        vectors_config=collection_params.vectors,
+        sparse_vectors_config={config.SPARSE_VECTOR_NAME: SparseVectorParams()},
+        quantization_config=collection_params.quantization_config,
+        hnsw_config=build_hnsw_config()
+    )
+    print(f"✅ {collection} 遷移完成 | {len(new_points)} 筆 | 耗時：{round(time.time() - migrate_start, 4)} 秒")
+    return True
+
+
+# =======================
+# quantize：設定向量量化
+# =======================
+def migrate_quantization(client: QdrantClient, collection: str) -> bool:
+    """
+    依 config.QUANTIZATION 更新 collection 的量化設定，並將原始向量移至磁碟（Qdrant 於背景重建，不需重新向量化）
+    """
+    search_type = collection_search_type(collection)
+    quantization_config = build_quantization_config(search_type)
+    if quantization_config is None:
+        print(f"⏭️ {collection}：config.QUANTIZATION 未啟用 {search_type} 量化，略過")
+        return False
+    vectors_config = client.get_collection(collection).config.params.vectors
+    vector_names = list(vectors_config.keys()) if isinstance(vectors_config, dict) else [""]
+    client.update_collection(
+        collection_name=collection,
+        vectors_config={name: VectorParamsDiff(on_disk=config.VECTORS_ON_DISK) for name in vector_names},
+        quantization_config=quantization_config
+    )
+    print(f"✅ {collection} 已設定 {config.QUANTIZATION[search_type]} 量化")
+    return True
+
+
+# =======================
+# hnsw：更新 HNSW 索引設定
+# =======================
+def migrate_hnsw(client: QdrantClient, collection: str, profile: str) -> bool:
+    """
+    依 config.HNSW_PROFILES 更新 collection 的 HNSW 設定（m、ef_construct、full_scan_threshold、on_disk），不需重新向量化
+    """
+    client.update_collection(collection_name=collection, hnsw_config=build_hnsw_config(profile))
+    print(f"✅ {collection} 已套用 HNSW 設定檔 {profile}：{config.HNSW_PROFILES[profile]}")
+    return True
+
+
+# =======================
+# payload-index：建立 payload 索引並回填 intent
+# =======================
+def backfill_summary_intent(client: QdrantClient, collection: str) -> int:
+    """
+    由資料夾中的 summary JSON 回填 intent 欄位（舊版 summary 未寫入），以 filename 對應資料點
+    單一 summary collection 逐一資料夾回填，另以 folder 欄位限定範圍
+    """
+    folders = get_pdf_folders(config.PDF_BASE_DIRECTORY) if collection == "summary" else [collection[len("summary_"):]]
+    updated = 0
+    for folder in folders:
+        summary_json_directory = get_folder_paths(folder)["summary_json_directory"]
+        if not os.path.exists(summary_json_directory):
+            print(f"⚠️ 找不到 summary JSON 資料夾: {summary_json_directory}，略過回填")
+            continue
+        folder_conditions = [FieldCondition(key=config.FOLDER_FIELD, match=MatchValue(value=folder))] if collection == "summary" else []
+        for json_file in sorted(f for f in os.listdir(summary_json_directory) if f.lower().endswith(".json")):
+            with open(os.path.join(summary_json_directory, json_file), "r", encoding="utf-8") as f:
+                summary_data = json.load(f)
+            if "error" in summary_data or "filename" not in summary_data:
+                continue
+            client.set_payload(
+                collection_name=collection,
+                payload={"intent": summary_data.get("intent", [])},
+                points=Filter(must=[FieldCondition(key="filename", match=MatchValue(value=summary_data["filename"]))] + folder_conditions)
+            )
+            updated += 1
+    return updated
+
+def migrate_payload_index(client: QdrantClient, collection: str) -> bool:
+    """
+    依 config.PAYLOAD_INDEX_FIELDS 建立 keyword payload 索引；summary collection 另回填 intent
+    """
+    search_type = collection_search_type(collection)
+    create_payload_indexes(client, collection, search_type)
+    print(f"✅ {collection} 已建立 payload 索引：{config.PAYLOAD_INDEX_FIELDS.get(search_type, [])}")
+    if search_type == "summary":
+        updated = backfill_summary_intent(client, collection)
+        print(f"✅ {collection} 已回填 {updated} 份文件的 intent")
+        if updated:
+            # payload 已改變：mmap 引擎重新匯出並更新索引版本號，回填前快取的過濾結果隨之失效
+            publish_collection(client, collection)
+    return True
+
+
+# =======================
+# consolidate：合併為單一 collection
+# =======================
+def consolidate_collections(client: QdrantClient, search_type: str) -> bool:
+    """
+    將 {search_type}_{folder} collection 的資料點複製到單一 {search_type} collection：
+    payload 補上 folder 欄位，資料點 ID 以 partition_point_id 轉換（與 single 配置下 indexer / summary 產生的 ID 相同）
+    """
+    target = search_type
+    sources = [name for name in list_collections(client, f"{search_type}_") if "__bench_" not in name]
+    if not sources:
+        print(f"⏭️ 沒有 {search_type}_* collection，略過")
+        return False
+    if not client.collection_exists(target):
+        create_collection(client, target, search_type)
+        print(f"已創建向量集合: {target}")
+    if config.COLLECTION_LAYOUT != "single":
+        create_folder_index(client, target)  # 尚未切換配置時 create_collection 不會建立 folder 索引
+    target_params = client.get_collection(target).config.params
+    target_vectors = target_params.vectors
+    target_names = set(target_vectors.keys()) if isinstance(target_vectors, dict) else {""}
+    target_names |= set((target_params.sparse_vectors or {}).keys())
+    for source in sources:
+        folder = source[len(f"{search_type}_"):]
+        source_vectors = client.get_collection(source).config.params.vectors
+        source_names = set(source_vectors.keys()) if isinstance(source_vectors, dict) else {""}
+        if not (source_names & target_names) or (isinstance(target_vectors, dict) != isinstance(source_vectors, dict)):
+            print(f"⚠️ {source}：向量格式與 {target} 不一致（請先執行 title-vectors 遷移），略過")
+            continue
+        copied, offset = 0, None
+        while True:
+            batch, offset = client.scroll(collection_name=source, limit=SCROLL_BATCH_SIZE, offset=offset, with_payload=True, with_vectors=True)
+            points = [
+                PointStruct(
+                    id=partition_point_id(folder, str(point.id)),
+                    vector={name: value for name, value in point.vector.items() if name in target_names} if isinstance(point.vector, dict) else point.vector,
+                    payload={**(point.payload or {}), config.FOLDER_FIELD: folder}
+                )
+                for point in batch
+            ]
+            if points:
+                client.upsert(collection_name=target, points=points)
+            copied += len(points)
+            if offset is None:
+                break
+        print(f"✅ {source} → {target}（folder={folder}）已複製 {copied} 筆")
+    publish_collection(client, target)
+    print(f"✅ {target} 合併完成，共 {client.count(target).count} 筆；確認檢索結果後將 config.COLLECTION_LAYOUT 設為 \"single\"")
+    return True
+
+
+def main():
+    """主程式入口：解析指令並執行對應的遷移"""
+    parser = argparse.ArgumentParser(description="Qdrant collection 遷移工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    title_parser = subparsers.add_parser("title-vectors", help="為 summary collection 補上 title 向量")
+    title_parser.add_argument("--collection", help="指定 collection 名稱，預設為全部 summary collection（兩種配置皆包含）")
+    sparse_parser = subparsers.add_parser("sparse-vectors", help="為 chunk / summary collection 補上 sparse 向量")
+    sparse_parser.add_argument("--collection", help="指定 collection 名稱，預設為全部 chunk / summary collection（兩種配置皆包含）")
+    quantize_parser = subparsers.add_parser("quantize", help="依 config.QUANTIZATION 設定 collection 量化")
+    quantize_parser.add_argument("--collection", help="指定 collection 名稱，預設為全部 chunk / summary collection（兩種配置皆包含）")
+    hnsw_parser = subparsers.add_parser("hnsw", help="依 config.HNSW_PROFILES 更新 collection 的 HNSW 設定")
+    hnsw_parser.add_argument("--collection", help="指定 collection 名稱，預設為全部 chunk / summary collection（兩種配置皆包含）")
+    hnsw_parser.add_argument("--profile", default=config.HNSW_PROFILE, choices=list(config.HNSW_PROFILES))
+    payload_parser = subparsers.add_parser("payload-index", help="建立 payload 索引並回填 summary 的 intent")
+    payload_parser.add_argument("--collection", help="指定 collection 名稱，預設為全部 chunk / summary collection（兩種配置皆包含）")
+    consolidate_parser = subparsers.add_parser("consolidate", help="將各資料夾的 collection 合併為單一 chunk / summary collection")
+    consolidate_parser.add_argument("--search-type", nargs="+", default=["chunk", "summary"], choices=["chunk", "summary"])
+    args = parser.parse_args()
+
+    print("🔄 連接 Qdrant 向量資料庫...")
+    qdrant_client = QdrantClient(path=config.PERSIST_DIRECTORY) # 使用本地檔案存取模式
+    # qdrant_client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT) # 使用網路存取模式
+    print("✅ Qdrant 連接成功！")
+
+    if args.command == "title-vectors":
+        print("🔄 BGE-M3 模型載入...")
+        embedding_model = load_embedding_model()
+        print("✅ BGE-M3 模型載入完成！")
+        collections = [args.collection] if args.collection else list_search_collections(qdrant_client, ("summary",))
+        for collection in collections:
+            migrate_title_vectors(qdrant_client, embedding_model, collection)
+    elif args.command == "sparse-vectors":
+        print("🔄 BGE-M3 模型載入（dense + sparse）...")
+        embedding_model = BGEM3HybridEmbeddings(model_name=config.MODEL_NAME, device=config.device)
+        print("✅ BGE-M3 模型載入完成！")
+        collections = [args.collection] if args.collection else list_search_collections(qdrant_client)
+        for collection in collections:
+            migrate_sparse_vectors(qdrant_client, embedding_model, collection)
+    elif args.command == "quantize":
+        collections = [args.collection] if args.collection else list_search_collections(qdrant_client)
+        for collection in collections:
+            migrate_quantization(qdrant_client, collection)
+    elif args.command == "hnsw":
+        collections = [args.collection] if args.collection else list_search_collections(qdrant_client)
+        for collection in collections:
+            migrate_hnsw(qdrant_client, collection, args.profile)
+    elif args.command == "payload-index":
+        collections = [args.collection] if args.collection else list_search_collections(qdrant_client)
+        for collection in collections:
+            migrate_payload_index(qdrant_client, collection)
+    elif args.command == "consolidate":
+        for search_type in args.search_type:
+            consolidate_collections(qdrant_client, search_type)
+
+if __name__ == "__main__":
+    main()
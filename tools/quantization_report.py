@@ -0,0 +1,125 @@
+"""
+tools/quantization_report.py - 量化 recall / latency 報告
+- 以我們自己的查詢集（kw_mapping 關鍵字 + 回饋查詢）比較同一 collection 的四種查詢方式：
+    exact      ：原始向量暴力搜尋（作為 ground truth）
+    original   ：原始向量 HNSW（忽略量化）
+    quantized  ：量化向量 HNSW，不 rescore
+    rescored   ：量化向量 HNSW + oversampling + 原始向量 rescore（線上設定）
+- 輸出各方式的 recall@k、p50 / p95 延遲，以及向量常駐記憶體估算
+
+使用方式（需連線 Qdrant 服務；本地模式不支援量化）：
+    python tools/quantization_report.py --top-k 30 --sample 200 --output quantization_report.json
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+from qdrant_client import QdrantClient
+from qdrant_client.models import SearchParams, QuantizationSearchParams
+from utils.embedding_backend import load_embedding_model
+from utils.collection_utils import list_search_collections
+from tools.query_sets import load_queries
+from tools.bench_utils import percentile
+
+SEARCH_MODES = {
+    "exact": SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True)),
+    "original": SearchParams(quantization=QuantizationSearchParams(ignore=True)),
+    "quantized": SearchParams(quantization=QuantizationSearchParams(ignore=False, rescore=False)),
+    "rescored": SearchParams(quantization=QuantizationSearchParams(
+        ignore=False, rescore=True, oversampling=config.QUANTIZATION_OVERSAMPLING
+    ))
+}
+BYTES_PER_DIM = {None: 4, "scalar": 1, "binary": 1 / 8}
+
+
+def quantization_method(info: Any) -> Optional[str]:
+    """collection 的量化方式：scalar / binary / None"""
+    quantization_config = info.config.quantization_config
+    if not quantization_config:
+        return None
+    return "scalar" if getattr(quantization_config, "scalar", None) else "binary"
+
+def memory_estimate(points_count: int, vector_count: int, method: Any) -> Dict[str, float]:
+    """估算常駐記憶體的向量大小（MB）：float32 原始向量 vs 量化向量"""
+    original_mb = points_count * vector_count * config.EMBEDDING_DIM * 4 / 1024 ** 2
+    resident_mb = points_count * vector_count * config.EMBEDDING_DIM * BYTES_PER_DIM.get(method, 4) / 1024 ** 2
+    return {"original_float32_mb": round(original_mb, 2), "resident_mb": round(resident_mb, 2)}
+
+def evaluate_collection(client: QdrantClient, collection: str, query_vectors: List[List[float]], top_k: int) -> Dict[str, Any]:
+    """對單一 collection 執行四種查詢方式，計算 recall@k 與延遲"""
+    info = client.get_collection(collection)
+    vectors_config = info.config.params.vectors
+    vector_names = list(vectors_config.keys()) if isinstance(vectors_config, dict) else [""]
+    using = config.SUMMARY_VECTOR_NAME if config.SUMMARY_VECTOR_NAME in vector_names else None
+    method = quantization_method(info)
+    results = {mode: {"ids": [], "latencies": []} for mode in SEARCH_MODES}
+    for query_vector in query_vectors:
+        for mode, search_params in SEARCH_MODES.items():
+            start = time.perf_counter()
+            points = client.query_points(
+                collection_name=collection,
+                query=query_vector,
+                using=using,
+                search_params=search_params,
+                with_payload=False,
+                limit=top_k
+            ).points
+            results[mode]["latencies"].append(time.perf_counter() - start)
+            results[mode]["ids"].append({point.id for point in points})
+    report = {
+        "points_count": info.points_count,
+        "quantization": method,
+        "memory": memory_estimate(info.points_count or 0, len(vector_names), method),
+        "modes": {}
+    }
+    for mode, values in results.items():
+        recalls = [
+            len(ids & truth) / len(truth) if truth else 1.0
+            for ids, truth in zip(values["ids"], results["exact"]["ids"])
+        ]
+        report["modes"][mode] = {
+            "recall_at_k": round(sum(recalls) / len(recalls), 4) if recalls else 0.0,
+            "p50_ms": round(percentile(values["latencies"], 50) * 1000, 2),
+            "p95_ms": round(percentile(values["latencies"], 95) * 1000, 2)
+        }
+    return report
+
+def print_report(report: Dict[str, Any], top_k: int) -> None:
+    """以表格輸出報告"""
+    for collection, collection_report in report.items():
+        memory = collection_report["memory"]
+        print(f"\n📊 {collection} | points={collection_report['points_count']} | quantization={collection_report['quantization']} "
+              f"| 常駐向量 {memory['resident_mb']} MB（float32 {memory['original_float32_mb']} MB）")
+        print(f"   {'mode':<10} {'recall@' + str(top_k):>10} {'p50(ms)':>10} {'p95(ms)':>10}")
+        for mode, values in collection_report["modes"].items():
+            print(f"   {mode:<10} {values['recall_at_k']:>10.4f} {values['p50_ms']:>10.2f} {values['p95_ms']:>10.2f}")
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="量化 recall / latency 報告")
+    parser.add_argument("--collection", nargs="*", help="指定 collection，預設為全部 chunk / summary collection（兩種配置皆包含）")
+    parser.add_argument("--top-k", type=int, default=config.TOP_K)
+    parser.add_argument("--sample", type=int, default=200, help="查詢集抽樣筆數")
+    parser.add_argument("--output", help="報告 JSON 輸出路徑")
+    args = parser.parse_args()
+
+    client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
+    collections = args.collection or list_search_collections(client)
+    queries = [item["query"] for item in load_queries(sample_size=args.sample)]
+    print(f"🔄 載入模型並向量化 {len(queries)} 筆查詢...")
+    embedding_model = load_embedding_model()
+    query_vectors = embedding_model.embed_documents(queries)
+    report = {collection: evaluate_collection(client, collection, query_vectors, args.top_k) for collection in collections}
+    print_report(report, args.top_k)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 報告已儲存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
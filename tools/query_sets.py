@@ -0,0 +1,61 @@
+"""
+tools/query_sets.py - 壓測 / 評估用的查詢集
+- 來源一：frontend/kw_mapping.json 的關鍵字（與前端 intent 擴充後的查詢），依 intent 對應 collection
+- 來源二：回饋檔（config.FEEDBACK_PATH）中使用者實際輸入的查詢
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import json
+import re
+import random
+from typing import List, Dict, Optional
+
+KW_MAPPING_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "kw_mapping.json")
+
+
+def load_keyword_queries(kw_mapping_path: str = KW_MAPPING_PATH, expanded: bool = True) -> List[Dict[str, str]]:
+    """
+    讀取 kw_mapping.json，回傳 [{"query", "collection"}]；expanded=True 時另外加入與前端相同的擴充查詢
+    """
+    with open(kw_mapping_path, "r", encoding="utf-8") as f:
+        mapping_data = json.load(f)
+    queries = []
+    for item in mapping_data:
+        collection = config.INTENT_COLLECTION_MAP.get(str(item["intent"]))
+        if not collection:
+            continue
+        queries.append({"query": item["keyword"], "collection": collection})
+        if expanded and item.get("related_words"):  # 部分關鍵字沒有 related_words
+            cleaned_related_words = re.sub(r'[、,，]', ' ', item["related_words"]).strip()
+            queries.append({"query": f"{item['keyword']} {cleaned_related_words}", "collection": collection})
+    return queries
+
+def load_feedback(feedback_path: str = config.FEEDBACK_PATH) -> List[Dict[str, str]]:
+    """
+    讀取回饋檔，檔案不存在或格式錯誤時回傳空列表
+    """
+    if not os.path.exists(feedback_path):
+        print(f"⚠️ 回饋檔案不存在: {feedback_path}")
+        return []
+    try:
+        with open(feedback_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ 讀取回饋檔案失敗: {e}")
+        return []
+
+def load_queries(sample_size: Optional[int] = None, feedback_path: str = config.FEEDBACK_PATH, seed: int = 0) -> List[Dict[str, str]]:
+    """
+    合併關鍵字查詢與回饋查詢（回饋查詢未指定 collection 時為 None），可隨機抽樣 sample_size 筆
+    """
+    queries = load_keyword_queries()
+    seen = set()
+    for feedback in load_feedback(feedback_path):
+        if feedback.get("query") and feedback["query"] not in seen:
+            seen.add(feedback["query"])
+            queries.append({"query": feedback["query"], "collection": None})
+    if sample_size and sample_size < len(queries):
+        queries = random.Random(seed).sample(queries, sample_size)
+    return queries
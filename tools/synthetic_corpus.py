@@ -0,0 +1,142 @@
+"""
+tools/synthetic_corpus.py - 建立壓測用的合成 Qdrant 語料
+- 依 config.ALL_COLLECTIONS 為每個資料夾建立 chunk / summary collection（依 config.COLLECTION_LAYOUT 決定名稱），
+  以 EmbeddingProcessor 寫入，向量、payload、資料點 ID 與 indexer / summary 產生的格式相同
+- 文字由條款片段組成，並混入 kw_mapping.json 中對應資料夾的關鍵字，讓查詢集能命中相關文件
+- --embedding model：以 config 的嵌入模型向量化（與正式環境相同的分數分布，較慢）
+  --embedding random：以文字雜湊產生固定的隨機單位向量（建置快，搜尋延遲與正式環境相近，但分數無意義，壓測時閾值請設為 0）
+- 目標 collection 已有資料時拒絕寫入（避免覆蓋正式資料），需加 --reset 先刪除
+
+使用方式（建議指向獨立的 Qdrant 服務或本地目錄）：
+    python tools/synthetic_corpus.py --path ../qdrant_loadtest --docs 50 --chunks 20 --embedding random --reset
+    python tools/synthetic_corpus.py --host localhost --docs 200 --chunks 30 --embedding model
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import argparse
+import hashlib
+import random
+import tempfile
+from typing import Dict, List
+import numpy as np
+from qdrant_client import QdrantClient
+from utils.collection_utils import create_collection, resolve_collection
+from utils.embedding_utils import EmbeddingProcessor
+from utils.mmap_index import publish_collection
+from tools.query_sets import load_keyword_queries
+from tools.bench_utils import synthetic_text
+
+FILE_TYPES = ["條款", "表單", "商品說明", "作業規範", "公告"]
+INTENT_LABELS = {
+    "product-overview": ["商品資訊"],
+    "application-and-medical": ["投保規範", "核保規範"],
+    "customer-policy-service": ["理賠規範", "契約變更"],
+    "other": ["表單下載"]
+}
+
+
+class RandomEmbeddings:
+    """以文字雜湊為種子產生的隨機單位向量：相同文字得到相同向量"""
+    model_id = "random"
+
+    def _embed(self, text: str) -> List[float]:
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(config.EMBEDDING_DIM).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+def folder_keywords() -> Dict[str, List[str]]:
+    """kw_mapping.json 中各資料夾的關鍵字"""
+    keywords = {}
+    for item in load_keyword_queries(expanded=False):
+        keywords.setdefault(item["collection"], []).append(item["query"])
+    return keywords
+
+def prepare_collection(client: QdrantClient, collection: str, search_type: str, reset: bool) -> None:
+    """建立目標 collection；已有資料時需 --reset 才會刪除重建"""
+    if client.collection_exists(collection):
+        if not reset and client.count(collection).count > 0:
+            raise SystemExit(f"❌ {collection} 已有資料，請確認指向壓測用的 Qdrant，或加上 --reset 刪除重建")
+        client.delete_collection(collection)
+    create_collection(client, collection, search_type)
+    print(f"已創建向量集合: {collection}")
+
+def build_folder(processor: EmbeddingProcessor, folder: str, keywords: List[str], docs: int, chunks: int, chunk_chars: int, log_dir: str, seed: int) -> None:
+    """為單一資料夾寫入 docs 份文件的 chunk 與 summary"""
+    rng = random.Random(f"{seed}-{folder}")
+    chunk_collection, _ = resolve_collection("chunk", folder)
+    summary_collection, _ = resolve_collection("summary", folder)
+    for doc in range(docs):
+        filename = f"{folder}_{doc:04d}.pdf"
+        title = f"{rng.choice(keywords) if keywords else folder}{rng.choice(FILE_TYPES)}（第{doc}版）"
+        chunk_dicts = [
+            {"filename": filename, "page": page // 2 + 1, "content": synthetic_text(rng, chunk_chars, keywords)}
+            for page in range(chunks)
+        ]
+        processor.chunk_embedding_upsert(chunk_dicts, filename, chunk_collection, log_dir, folder=folder)
+        processor.summary_embedding_upsert({
+            "filename": filename,
+            "title": title,
+            "file_type": rng.choice(FILE_TYPES),
+            "metadata": rng.sample(keywords, min(3, len(keywords))) if keywords else [],
+            "intent": INTENT_LABELS.get(folder, []),
+            "summary": synthetic_text(rng, 300, keywords)
+        }, summary_collection, log_dir, folder=folder)
+    print(f"✅ {folder}：{docs} 份文件、{docs * chunks} 個 chunk")
+
+
+def main():
+    """主程式入口"""
+    parser = argparse.ArgumentParser(description="建立壓測用的合成 Qdrant 語料")
+    parser.add_argument("--path", help="本地 Qdrant 目錄（與 --host 擇一），預設依 config.QDRANT_MODE")
+    parser.add_argument("--host", help="Qdrant 服務位址")
+    parser.add_argument("--port", type=int, default=config.QDRANT_PORT)
+    parser.add_argument("--folders", nargs="+", default=config.ALL_COLLECTIONS)
+    parser.add_argument("--docs", type=int, default=50, help="每個資料夾的文件數")
+    parser.add_argument("--chunks", type=int, default=20, help="每份文件的 chunk 數")
+    parser.add_argument("--chunk-chars", type=int, default=900, help="每個 chunk 的字數（indexer 切塊上限為 1000）")
+    parser.add_argument("--embedding", choices=["model", "random"], default="random")
+    parser.add_argument("--reset", action="store_true", help="刪除並重建已有資料的目標 collection")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.host:
+        client = QdrantClient(host=args.host, port=args.port)
+    elif args.path:
+        client = QdrantClient(path=args.path)
+    elif config.QDRANT_MODE == "server":
+        client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
+    else:
+        client = QdrantClient(path=config.PERSIST_DIRECTORY)
+    if args.embedding == "model":
+        from utils.embedding_backend import load_embedding_model
+        print("🔄 BGE-M3 模型載入...")
+        embedding_model = load_embedding_model()
+    else:
+        embedding_model = RandomEmbeddings()
+
+    collections = {}
+    for folder in args.folders:
+        for search_type in ("chunk", "summary"):
+            collections[resolve_collection(search_type, folder)[0]] = search_type
+    for collection, search_type in collections.items():
+        prepare_collection(client, collection, search_type, args.reset)
+
+    processor = EmbeddingProcessor(embedding_model=embedding_model, client=client)
+    keywords = folder_keywords()
+    with tempfile.TemporaryDirectory() as log_dir:
+        for folder in args.folders:
+            build_folder(processor, folder, keywords.get(folder, []), args.docs, args.chunks, args.chunk_chars, log_dir, args.seed)
+    for collection in collections:
+        publish_collection(client, collection)
+        print(f"📊 {collection}：{client.count(collection).count} 筆")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+API 回應序列化：retriever / agent 共用
+- JSON 以 orjson 編碼（FastAPI ORJSONResponse），不經過 jsonable_encoder 與回應模型驗證
+- 請求帶 Accept: application/msgpack（或 application/x-msgpack）且已安裝 msgpack 時改回 MessagePack
+- 依 Accept-Encoding 以 brotli（需 brotli-asgi）或 gzip 壓縮較大的回應；串流回應（RESPONSE_COMPRESSION_EXCLUDED_PATHS）不壓縮
+"""
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse, Response
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import msgpack
+except ImportError:  # MessagePack 為選用格式，未安裝時一律回傳 JSON
+    msgpack = None
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # 未安裝 brotli-asgi 時只提供 gzip
+    BrotliMiddleware = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+class PathExcludedGZipMiddleware(GZipMiddleware):
+    """略過指定路徑的 GZipMiddleware：gzip 會緩衝串流回應的內容，SSE 事件無法即時送達"""
+    def __init__(self, app: ASGIApp, excluded_paths: List[str] = (), **kwargs: Any) -> None:
+        super().__init__(app, **kwargs)
+        self.excluded_paths = [re.compile(path) for path in excluded_paths]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and any(path.search(scope.get("path", "")) for path in self.excluded_paths):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+def _msgpack_default(value: Any) -> Any:
+    """numpy 純量（例如 rerank 的相似度）轉為 Python 數值"""
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"無法以 MessagePack 編碼的型別: {type(value)}")
+
+class MsgPackResponse(Response):
+    """MessagePack 回應"""
+    media_type = MSGPACK_MEDIA_TYPES[0]
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, use_bin_type=True, default=_msgpack_default)
+
+def wants_msgpack(request: Request) -> bool:
+    """請求的 Accept 標頭是否要求 MessagePack（未安裝 msgpack 時一律為 False）"""
+    accept = request.headers.get("accept", "")
+    return msgpack is not None and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+def encode_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """依 Accept 標頭回傳 MessagePack 或 orjson JSON 回應"""
+    if wants_msgpack(request):
+        return MsgPackResponse(content, status_code=status_code)
+    return ORJSONResponse(content, status_code=status_code)
+
+def select_fields(content: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """只保留呼叫端指定的頂層欄位，None 表示全部"""
+    if fields is None:
+        return content
+    return {key: value for key, value in content.items() if key in fields}
+
+def add_compression(app: FastAPI) -> None:
+    """依 config 加上回應壓縮：brotli-asgi 同時處理 br 與 gzip（用戶端不支援 br 時退回 gzip）"""
+    if not config.RESPONSE_COMPRESSION:
+        return
+    if BrotliMiddleware is not None:
+        app.add_middleware(
+            BrotliMiddleware,
+            quality=config.RESPONSE_BROTLI_QUALITY,
+            minimum_size=config.RESPONSE_COMPRESSION_MIN_SIZE,
+            gzip_fallback=True,
+            excluded_handlers=config.RESPONSE_COMPRESSION_EXCLUDED_PATHS
+        )
+    else:
+        app.add_middleware(
+            PathExcludedGZipMiddleware,
+            excluded_paths=config.RESPONSE_COMPRESSION_EXCLUDED_PATHS,
+            minimum_size=config.RESPONSE_COMPRESSION_MIN_SIZE,
+            compresslevel=config.RESPONSE_GZIP_LEVEL
+        )
@@ -0,0 +1,139 @@
+import os
+import sys
+import uuid
+import hashlib
+from typing import Any, Dict, Optional, Union, Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+from qdrant_client.models import (
+    Distance, VectorParams, SparseVectorParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig,
+    SearchParams, QuantizationSearchParams, HnswConfigDiff, PayloadSchemaType, KeywordIndexParams
+)
+
+
+def build_vectors_config(search_type: str) -> Union[VectorParams, Dict[str, VectorParams]]:
+    """
+    依搜尋類型建立 dense 向量設定：chunk 為單一向量，summary 為具名的 summary + title 向量
+    """
+    params = VectorParams(
+        size=config.EMBEDDING_DIM,
+        distance=Distance.COSINE,
+        on_disk=config.VECTORS_ON_DISK if config.QUANTIZATION.get(search_type) else None  # 量化時原始向量放磁碟
+    )
+    if search_type == "summary":
+        return {
+            config.SUMMARY_VECTOR_NAME: params,
+            config.TITLE_VECTOR_NAME: params.model_copy()
+        }
+    return params
+
+def build_sparse_vectors_config() -> Optional[Dict[str, SparseVectorParams]]:
+    """
+    啟用混合檢索時建立 sparse 向量設定
+    """
+    return {config.SPARSE_VECTOR_NAME: SparseVectorParams()} if config.HYBRID_SEARCH else None
+
+def build_quantization_config(search_type: str) -> Optional[Any]:
+    """
+    依 config.QUANTIZATION 建立量化設定：scalar（int8）或 binary，量化向量常駐記憶體
+    """
+    method = config.QUANTIZATION.get(search_type)
+    if method == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=config.QUANTIZATION_ALWAYS_RAM)
+        )
+    if method == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=config.QUANTIZATION_ALWAYS_RAM))
+    return None
+
+def build_hnsw_config(profile: str = None) -> HnswConfigDiff:
+    """
+    依 config.HNSW_PROFILES 建立 HNSW 索引設定（m、ef_construct、full_scan_threshold、on_disk）
+    """
+    return HnswConfigDiff(**config.HNSW_PROFILES[profile or config.HNSW_PROFILE])
+
+def build_search_params(search_type: str, mode: str = None) -> SearchParams:
+    """
+    依查詢模式（config.SEARCH_MODES）建立查詢參數：hnsw_ef / exact；量化 collection 另以 oversampling 取候選，再以原始向量 rescore
+    查詢模式可選填 quantization：rescore / no_rescore / ignore（忽略量化向量，只用原始向量），未填時依 config.QUANTIZATION_RESCORE
+    """
+    search_mode = config.SEARCH_MODES[mode or config.DEFAULT_SEARCH_MODE]
+    quantization = None
+    if config.QUANTIZATION.get(search_type):
+        quantization_query = search_mode.get("quantization") or ("rescore" if config.QUANTIZATION_RESCORE else "no_rescore")
+        if quantization_query == "ignore":
+            quantization = QuantizationSearchParams(ignore=True)
+        else:
+            quantization = QuantizationSearchParams(
+                rescore=quantization_query == "rescore",
+                oversampling=search_mode["oversampling"] or config.QUANTIZATION_OVERSAMPLING
+            )
+    return SearchParams(hnsw_ef=search_mode["hnsw_ef"], exact=search_mode["exact"], quantization=quantization)
+
+def resolve_collection(search_type: str, folder: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    依 config.COLLECTION_LAYOUT 將 (搜尋類型, 資料夾) 對應為 (collection 名稱, folder 過濾值)
+    - per_folder：{search_type}_{folder}，不需過濾
+    - single：{search_type}，指定資料夾時以 folder 欄位過濾，all / 未指定則搜尋全部
+    """
+    if config.COLLECTION_LAYOUT == "single":
+        return search_type, None if folder in (None, config.ALL_FOLDERS) else folder
+    return f"{search_type}_{folder}", None
+
+def collection_search_type(collection: str) -> Optional[str]:
+    """
+    由 collection 名稱判斷搜尋類型：per_folder 的 {search_type}_{folder} 與 single 的 {search_type} 皆可，其他 collection 回傳 None
+    """
+    search_type = collection.split("_", 1)[0]
+    return search_type if search_type in ("chunk", "summary") else None
+
+def list_search_collections(client: Any, search_types: Tuple[str, ...] = ("chunk", "summary")) -> list:
+    """
+    列出指定搜尋類型的 collection（兩種配置皆包含），不含遷移 / 測試用的暫存 collection（名稱含 "__"）
+    """
+    return [
+        c.name for c in client.get_collections().collections
+        if collection_search_type(c.name) in search_types and "__" not in c.name
+    ]
+
+def partition_point_id(folder: str, point_id: str) -> str:
+    """
+    single 配置下的資料點 ID：不同資料夾的同名檔案在同一個 collection 中不會互相覆蓋
+    indexer / summary 與遷移工具使用相同的轉換，重新索引時會覆寫遷移過來的資料點
+    """
+    return str(uuid.UUID(hashlib.md5(f"{folder}/{point_id}".encode("utf-8")).hexdigest()))
+
+def create_payload_indexes(client: Any, collection: str, search_type: str) -> None:
+    """
+    依 config.PAYLOAD_INDEX_FIELDS 建立 keyword payload 索引，過濾查詢只掃描符合的資料點
+    single 配置另以 folder 欄位建立 tenant 索引，同一資料夾的資料點在儲存上集中存放
+    """
+    for field in config.PAYLOAD_INDEX_FIELDS.get(search_type, []):
+        client.create_payload_index(collection_name=collection, field_name=field, field_schema=PayloadSchemaType.KEYWORD)
+    if config.COLLECTION_LAYOUT == "single":
+        create_folder_index(client, collection)
+
+def create_folder_index(client: Any, collection: str) -> None:
+    """
+    建立 folder 欄位的 tenant keyword 索引（單一 collection 以資料夾為分區）
+    """
+    client.create_payload_index(
+        collection_name=collection,
+        field_name=config.FOLDER_FIELD,
+        field_schema=KeywordIndexParams(type="keyword", is_tenant=True)
+    )
+
+def create_collection(client: Any, collection: str, search_type: str) -> None:
+    """
+    依 config 建立 chunk / summary collection（dense、sparse、量化、HNSW 設定、payload 索引）
+    """
+    client.create_collection(
+        collection_name=collection,
+        vectors_config=build_vectors_config(search_type),
+        sparse_vectors_config=build_sparse_vectors_config(),
+        quantization_config=build_quantization_config(search_type),
+        hnsw_config=build_hnsw_config()
+    )
+    create_payload_indexes(client, collection, search_type)
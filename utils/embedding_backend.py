@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+from typing import List, Dict, Tuple, Any, Iterator
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import numpy as np
+from qdrant_client.models import SparseVector
+
+# tools/export_onnx.py 匯出的檔案名稱
+ONNX_MODEL_FILES = {False: "model.onnx", True: "model_int8.onnx"}
+ONNX_EXPORT_INFO = "export_info.json"
+
+
+class BGEM3HybridEmbeddings:
+    def __init__(self, model_name: str, device: str, batch_size: int = config.chunk_batch_size):
+        """
+        以 FlagEmbedding 的 BGEM3FlagModel 載入 BGE-M3，一次 forward 同時產生 dense 與 sparse（lexical weights）向量
+        介面與 HuggingFaceEmbeddings 相容（embed_documents / embed_query）
+        """
+        from FlagEmbedding import BGEM3FlagModel
+        self.model = BGEM3FlagModel(model_name, use_fp16=(device == "cuda"), devices=device)
+        self.batch_size = batch_size
+
+    def embed_hybrid(self, texts: List[str]) -> List[Tuple[List[float], Dict[int, float]]]:
+        """
+        回傳每段文字的 (dense 向量, sparse 權重 {token_id: weight})
+        """
+        output = self.model.encode(texts, batch_size=self.batch_size, return_dense=True, return_sparse=True, return_colbert_vecs=False)
+        return [
+            (dense.tolist(), {int(token_id): float(weight) for token_id, weight in lexical_weights.items()})
+            for dense, lexical_weights in zip(output["dense_vecs"], output["lexical_weights"])
+        ]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """只計算 dense 向量"""
+        output = self.model.encode(texts, batch_size=self.batch_size, return_dense=True, return_sparse=False, return_colbert_vecs=False)
+        return [dense.tolist() for dense in output["dense_vecs"]]
+
+    def embed_query(self, text: str) -> List[float]:
+        """只計算單一查詢的 dense 向量"""
+        return self.embed_documents([text])[0]
+
+
+class OnnxEmbeddings:
+    def __init__(self, model_dir: str, quantized: bool = config.ONNX_QUANTIZED, intra_op_threads: int = config.ONNX_INTRA_OP_THREADS,
+                 max_length: int = config.ONNX_MAX_LENGTH, batch_size: int = config.chunk_batch_size):
+        """
+        以 ONNX Runtime（CPU）執行 tools/export_onnx.py 匯出的 BGE-M3，輸出與 PyTorch 版相同的 CLS 正規化 dense 向量
+        介面與 HuggingFaceEmbeddings 相容（embed_documents / embed_query）
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_path = os.path.join(model_dir, ONNX_MODEL_FILES[quantized])
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.max_length = max_length
+        self.batch_size = batch_size
+        # 查詢向量快取以 model_id 區分，避免 fp32 / int8 向量混用
+        self.model_id = f"{config.MODEL_NAME}:onnx-{'int8' if quantized else 'fp32'}"
+
+    def _run(self, texts: List[str], output_names: List[str]) -> Iterator[Tuple[List[int], np.ndarray, List[np.ndarray]]]:
+        """
+        依長度排序後分批推論（減少 padding），逐批回傳 (原始索引, input_ids, 輸出)
+        """
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for i in range(0, len(order), self.batch_size):
+            batch_indices = order[i:i+self.batch_size]
+            encoded = self.tokenizer(
+                [texts[j] for j in batch_indices], padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            yield batch_indices, encoded["input_ids"], self.session.run(output_names, feeds)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """只計算 dense 向量"""
+        vectors = [None] * len(texts)
+        for batch_indices, _, (dense_vecs,) in self._run(texts, ["dense_vecs"]):
+            for index, dense in zip(batch_indices, dense_vecs):
+                vectors[index] = dense.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """只計算單一查詢的 dense 向量"""
+        return self.embed_documents([text])[0]
+
+
+class OnnxHybridEmbeddings(OnnxEmbeddings):
+    def __init__(self, model_dir: str, **kwargs: Any):
+        """
+        匯出時包含 BGE-M3 sparse_linear 的 ONNX 模型，一次推論同時產生 dense 與 sparse（lexical weights）向量
+        """
+        super().__init__(model_dir, **kwargs)
+        # 與 FlagEmbedding 相同：特殊 token 不計入 lexical weights
+        self.unused_token_ids = {
+            self.tokenizer.cls_token_id, self.tokenizer.eos_token_id, self.tokenizer.pad_token_id, self.tokenizer.unk_token_id
+        }
+
+    def embed_hybrid(self, texts: List[str]) -> List[Tuple[List[float], Dict[int, float]]]:
+        """
+        回傳每段文字的 (dense 向量, sparse 權重 {token_id: weight})；同一 token 出現多次時取最大權重
+        """
+        outputs = [None] * len(texts)
+        for batch_indices, input_ids, (dense_vecs, sparse_weights) in self._run(texts, ["dense_vecs", "sparse_weights"]):
+            for index, dense, token_ids, weights in zip(batch_indices, dense_vecs, input_ids, sparse_weights):
+                lexical_weights = {}
+                for token_id, weight in zip(token_ids.tolist(), weights.tolist()):
+                    if token_id in self.unused_token_ids or weight <= 0:
+                        continue
+                    if weight > lexical_weights.get(token_id, 0):
+                        lexical_weights[token_id] = weight
+                outputs[index] = (dense.tolist(), lexical_weights)
+        return outputs
+
+
+def load_onnx_model(model_dir: str = config.ONNX_MODEL_PATH, quantized: bool = config.ONNX_QUANTIZED, hybrid: bool = config.HYBRID_SEARCH) -> OnnxEmbeddings:
+    """
+    載入 ONNX 模型；hybrid=True 且匯出時包含 sparse 輸出才使用 OnnxHybridEmbeddings
+    """
+    info_path = os.path.join(model_dir, ONNX_EXPORT_INFO)
+    export_info = {}
+    if os.path.exists(info_path):
+        with open(info_path, "r", encoding="utf-8") as f:
+            export_info = json.load(f)
+    if hybrid and export_info.get("sparse"):
+        return OnnxHybridEmbeddings(model_dir, quantized=quantized)
+    if hybrid:
+        print(f"⚠️ ONNX 模型未包含 sparse 輸出（{model_dir}），僅使用 dense 向量")
+    return OnnxEmbeddings(model_dir, quantized=quantized)
+
+def load_embedding_model(backend: str = None) -> Any:
+    """
+    依 config 載入 embedding 模型
+    - backend="onnx"：ONNX Runtime（config.ONNX_QUANTIZED 決定 int8 / fp32）
+    - backend="torch"：啟用混合檢索時使用 BGEM3FlagModel（可產生 sparse 向量），否則使用 HuggingFaceEmbeddings
+    """
+    backend = backend or config.EMBEDDING_BACKEND
+    if backend == "onnx":
+        return load_onnx_model()
+    if config.HYBRID_SEARCH:
+        return BGEM3HybridEmbeddings(model_name=config.MODEL_NAME, device=config.device)
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=config.MODEL_NAME,
+        model_kwargs=config.MODEL_KWARGS
+    )
+
+def to_sparse_vector(weights: Dict[int, float]) -> SparseVector:
+    """
+    將 sparse 權重字典轉為 Qdrant SparseVector
+    """
+    return SparseVector(indices=list(weights.keys()), values=list(weights.values()))
@@ -2,12 +2,14 @@ import os
 import time
 import uuid
 import hashlib
-from typing import List, Dict
+from typing import List, Dict, Any
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config as config
 from qdrant_client.models import PointStruct
 from utils.log_utils import create_time_log_entry, log_to_file
+from utils.embedding_backend import to_sparse_vector
+from utils.collection_utils import partition_point_id
 
 
 class EmbeddingProcessor:
@@ -21,22 +23,39 @@ class EmbeddingProcessor:
         except Exception as e:
             print(f"向量資料庫連線發生錯誤: {str(e)}")
             self.client = None
+        self._sparse_collections = {}  # collection -> 是否設定 sparse 向量
     
-    def _generate_point_id(self, filename: str, page: int, index: int, search_type: str) -> str:
+    def _has_sparse(self, collection: str) -> bool:
         """
-        生成唯一的點ID
+        判斷是否寫入 sparse 向量：需啟用混合檢索、模型支援 sparse，且 collection 已設定 sparse 向量
+        """
+        if not config.HYBRID_SEARCH or not hasattr(self.embedding, "embed_hybrid"):
+            return False
+        if collection not in self._sparse_collections:
+            sparse_config = self.client.get_collection(collection).config.params.sparse_vectors or {}
+            self._sparse_collections[collection] = config.SPARSE_VECTOR_NAME in sparse_config
+            if not self._sparse_collections[collection]:
+                print(f"⚠️ {collection} 未設定 sparse 向量，僅寫入 dense 向量（可執行 tools/migrate_collections.py sparse-vectors）")
+        return self._sparse_collections[collection]
+    
+    def _generate_point_id(self, filename: str, page: int, index: int, search_type: str, folder: str = None) -> str:
+        """
+        生成唯一的點ID（single 配置下再以資料夾區分）
         """
         point_id_string = f"{filename}_{page}_{index}_{search_type}"
         point_id_hash = hashlib.md5(point_id_string.encode('utf-8')).hexdigest()
-        return str(uuid.UUID(point_id_hash))
+        point_id = str(uuid.UUID(point_id_hash))
+        if folder and config.COLLECTION_LAYOUT == "single":
+            return partition_point_id(folder, point_id)
+        return point_id
     
-    def _embed_text(self, texts: List[str], filename: str, desc: str, log_file_path: str) -> List[List[float]]:
+    def _embed_text(self, texts: List[str], filename: str, desc: str, log_file_path: str, hybrid: bool = False) -> List[Any]:
         """
-        對文本列表進行向量化，並記錄日誌
+        對文本列表進行向量化，並記錄日誌；hybrid=True 時回傳 (dense, sparse) 列表
         """
         try:
             embedding_start = time.time()
-            vectors = self.embedding.embed_documents(texts)
+            vectors = self.embedding.embed_hybrid(texts) if hybrid else self.embedding.embed_documents(texts)
             log_entry = create_time_log_entry(filename, f"{desc}｜狀態：成功", embedding_start)
             log_to_file(log_entry, log_file_path)
             return vectors
@@ -63,12 +82,13 @@ class EmbeddingProcessor:
             print(f"{filename}｜{desc} 發生錯誤: {str(e)}")
             raise e
     
-    def chunk_embedding_upsert(self, chunks: List[Dict], filename: str, collection: str, log_file_path: str, batch_size: int=config.chunk_batch_size) -> bool:
+    def chunk_embedding_upsert(self, chunks: List[Dict], filename: str, collection: str, log_file_path: str, batch_size: int=config.chunk_batch_size, folder: str = None) -> bool:
         """
-        對切塊文本進行向量化並上傳到 Qdrant
+        對切塊文本進行向量化並上傳到 Qdrant；folder 寫入 payload（single 配置以此區分資料夾）
         """
         success_flag = True
         indexer_embed_log_path = os.path.join(log_file_path, "indexer_embed.log")
+        with_sparse = self._has_sparse(collection)
         total_batches = (len(chunks) + batch_size - 1) // batch_size
         for i in range(0, len(chunks), batch_size):
             batch_num = i // batch_size + 1
@@ -80,19 +100,25 @@ class EmbeddingProcessor:
                     content,
                     filename,
                     f"Chunk embedding batch {batch_num}/{total_batches}",
-                    indexer_embed_log_path
+                    indexer_embed_log_path,
+                    hybrid=with_sparse
                 )
                 points = []
                 # === 2. 建立資料點 ===
                 for j, (chunk_dict, vector) in enumerate(zip(batch_chunks, batch_vectors)):
                     # 生成唯一的 point id
-                    point_id = self._generate_point_id(filename, chunk_dict.get('page', 1), i+j, "chunk")
+                    point_id = self._generate_point_id(filename, chunk_dict.get('page', 1), i+j, "chunk", folder)
                     # 建立 payload
                     payload = {
                         'filename': chunk_dict.get("filename", filename),  # 來源檔名
                         'page': chunk_dict.get("page", 1),  # 來源的頁數
                         'content': chunk_dict.get("content", ""),  # chunk 內容
                     }
+                    if folder:
+                        payload[config.FOLDER_FIELD] = folder  # 來源資料夾
+                    if with_sparse:  # 預設（未命名）dense 向量 + 具名 sparse 向量
+                        dense, sparse = vector
+                        vector = {"": dense, config.SPARSE_VECTOR_NAME: to_sparse_vector(sparse)}
                     point = PointStruct(
                         id=point_id,
                         vector=vector,
@@ -113,9 +139,9 @@ class EmbeddingProcessor:
                 continue
         return success_flag
 
-    def summary_embedding_upsert(self, summary_data: Dict, collection: str, log_file_path: str) -> bool:
+    def summary_embedding_upsert(self, summary_data: Dict, collection: str, log_file_path: str, folder: str = None) -> bool:
         """
-        讀取單一摘要 JSON，向量化後上傳到 Qdrant
+        讀取單一摘要 JSON，向量化後上傳到 Qdrant；folder 寫入 payload（single 配置以此區分資料夾）
         """
         success_flag = True
         summary_embed_log_path = os.path.join(log_file_path, "summary_embed.log")
@@ -123,27 +149,41 @@ class EmbeddingProcessor:
         if "error" in summary_data:
             return False
         fname = summary_data.get("filename", "unknown_file")
-        text = f"{summary_data.get('title', '')} {summary_data.get('summary', '')}"
+        title = summary_data.get("title", "")
+        text = f"{title} {summary_data.get('summary', '')}"
         try:
-            # === 1. 向量化 ===
-            vector = self._embed_text(
-                [text],
+            # === 1. 向量化：title+summary 與 title 同一批次計算 ===
+            with_sparse = self._has_sparse(collection)
+            summary_vector, title_vector = self._embed_text(
+                [text, title],
                 fname,
                 "Summary embedding",
-                summary_embed_log_path
-            )[0]
+                summary_embed_log_path,
+                hybrid=with_sparse
+            )
+            vectors = {}
+            if with_sparse:
+                (summary_vector, summary_sparse), (title_vector, _) = summary_vector, title_vector
+                vectors[config.SPARSE_VECTOR_NAME] = to_sparse_vector(summary_sparse)
             # === 2. 建立資料點 ===
-            point_id = self._generate_point_id(fname, 0, 0, "summary")
+            point_id = self._generate_point_id(fname, 0, 0, "summary", folder)
             payload = {
                 "filename": fname,
                 "title": summary_data.get("title", ""),
                 "file_type": summary_data.get("file_type", ""),
                 "metadata": summary_data.get("metadata", []),
+                "intent": summary_data.get("intent", []),  # 意圖列表（payload 索引，供結構化過濾）
                 "summary": summary_data.get("summary", "")
             }
+            if folder:
+                payload[config.FOLDER_FIELD] = folder  # 來源資料夾
             point = PointStruct(
                 id=point_id,
-                vector=vector,
+                vector={
+                    config.SUMMARY_VECTOR_NAME: summary_vector,
+                    config.TITLE_VECTOR_NAME: title_vector,  # 預先計算 title 向量，供 rerank 直接取用
+                    **vectors
+                },
                 payload=payload
             )
             # === 3. 上傳 ===
@@ -2,6 +2,7 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config as config
+from utils.collection_utils import resolve_collection
 
 
 def get_folder_paths(folder_name: str) -> dict:
@@ -17,8 +18,8 @@ def get_folder_paths(folder_name: str) -> dict:
     summary_log_dir = f"{pdf_dir}/logs/summary_logs"  # summary log檔案路徑
     indexer_embed_log_dir = f"{pdf_dir}/logs/embed_logs"  # indexer embedding log檔案路徑
     summary_embed_log_dir = f"{pdf_dir}/logs/embed_logs"  # summary embedding log檔案路徑
-    chunk_collection = f"chunk_{folder_name}"  # 子資料夾對應的 chunk collection name
-    summary_collection = f"summary_{folder_name}"  # 子資料夾對應的 summary collection name
+    chunk_collection, _ = resolve_collection("chunk", folder_name)  # 子資料夾對應的 chunk collection name（single 配置為 chunk）
+    summary_collection, _ = resolve_collection("summary", folder_name)  # 子資料夾對應的 summary collection name（single 配置為 summary）
     
     return {
         'pdf_directory': pdf_dir,
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import threading
+from typing import Dict
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+
+
+def load_index_versions(version_file_path: str = config.INDEX_VERSION_PATH) -> Dict[str, int]:
+    """
+    讀取各 collection 的索引版本號，檔案不存在時回傳空字典；內容無法解析時拋出例外（不可當成空版本）
+    """
+    try:
+        with open(version_file_path, "r", encoding="utf-8") as f:
+            versions = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if not isinstance(versions, dict):
+        raise ValueError(f"索引版本檔格式錯誤: {version_file_path}")
+    return versions
+
+def read_index_versions(version_file_path: str = config.INDEX_VERSION_PATH) -> Dict[str, int]:
+    """
+    讀取各 collection 的索引版本號，檔案不存在或讀取失敗時回傳空字典
+    """
+    try:
+        return load_index_versions(version_file_path)
+    except Exception as e:
+        print(f"讀取索引版本檔時發生錯誤: {e}")
+        return {}
+
+def bump_index_version(collection: str, version_file_path: str = config.INDEX_VERSION_PATH) -> int:
+    """
+    將指定 collection 的索引版本號加一，於 upsert 完成後呼叫，讓檢索端快取失效
+    """
+    versions = load_index_versions(version_file_path)  # 讀取失敗時中止，避免版本號歸零後與舊快取相符
+    versions[collection] = versions.get(collection, 0) + 1
+    os.makedirs(os.path.dirname(os.path.abspath(version_file_path)), exist_ok=True)
+    # 先寫入暫存檔再以 os.replace 取代，讀取端不會讀到刪除後的空檔或寫到一半的內容
+    temp_path = f"{version_file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(versions, f, ensure_ascii=False, indent=2)
+    try:
+        os.replace(temp_path, version_file_path)
+    except OSError:
+        # S3 掛載不支援 rename：與 log_to_file 相同，刪除舊檔後再寫入（讀取端解析失敗時沿用上次版本並於下次重試）
+        os.remove(temp_path)
+        if os.path.exists(version_file_path):
+            os.remove(version_file_path)
+        with open(version_file_path, "w", encoding="utf-8") as f:
+            json.dump(versions, f, ensure_ascii=False, indent=2)
+    print(f"🔖 {collection} 索引版本更新為 {versions[collection]}")
+    return versions[collection]
+
+
+class IndexVersions:
+    def __init__(self, version_file_path: str = config.INDEX_VERSION_PATH, check_interval: float = config.INDEX_VERSION_CHECK_INTERVAL):
+        """
+        檢索端的索引版本讀取器：每次檢查都比對版本檔內容（檔案很小），不依賴修改時間的精度
+        """
+        self.version_file_path = version_file_path
+        self.check_interval = check_interval
+        self._versions = {}
+        self._content = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        """檢查版本檔內容是否改變，必要時重新解析；讀取或解析失敗時保留上次的版本並於下次重試"""
+        now = time.time()
+        if now - self._checked_at < self.check_interval:
+            return
+        try:
+            with open(self.version_file_path, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            if self._content:
+                return  # 曾讀到版本後檔案消失：視為寫入中的空檔（S3 掛載刪除後重寫），下次重試
+            content = b""
+        except Exception as e:
+            print(f"讀取索引版本檔時發生錯誤: {e}")
+            return
+        if content != self._content:
+            try:
+                versions = json.loads(content) if content else {}
+                if not isinstance(versions, dict):
+                    raise ValueError("索引版本檔格式錯誤")
+            except Exception as e:
+                # 寫入中的檔案：不快取解析失敗的結果，也不更新檢查時間
+                print(f"解析索引版本檔時發生錯誤，沿用上次版本: {e}")
+                return
+            self._versions = versions
+            self._content = content
+        self._checked_at = now
+
+    def get(self, collection: str) -> int:
+        """取得 collection 目前的索引版本號（未建立過版本時為 0）"""
+        with self._lock:
+            self._refresh()
+            return self._versions.get(collection, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """取得所有 collection 的索引版本號"""
+        with self._lock:
+            self._refresh()
+            return dict(self._versions)
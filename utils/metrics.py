@@ -0,0 +1,144 @@
+"""
+utils/metrics.py - 階段延遲指標（Prometheus）：retriever / agent / frontend 共用
+- stage_timer / timed：量測階段耗時，寫入 rag_stage_duration_seconds 直方圖，例外另計入 rag_stage_errors_total
+- 標籤：service（set_service 設定）、stage、collection、search_type
+  collection / search_type 來自請求內容，不在 config.ALL_COLLECTIONS / chunk、summary 內的值一律記為 UNKNOWN_LABEL，避免時序數量無上限
+- 階段：query_embedding、ann_search、payload_processing、rerank（retriever）；llm_call、tool_call、agent、agent_first_event（agent）；
+        agent_api、agent_api_first_event、document_search_api（frontend）；*_first_event 為 /agent/stream 送出第一個步驟的時間
+- 佇列指標：rag_queue_wait_seconds（等候時間）、rag_queue_depth（state=queued / running）、rag_queue_rejected_total（佇列已滿拒絕）
+- agent Observation tokens：rag_agent_observation_tokens_total（kind=raw 打包前 / packed 打包後，估算值）
+- agent 推測式預取：rag_agent_prefetch_total（result=hit / miss / unused / error）
+- agent 回答快取：rag_agent_answer_cache_total（result=hit / miss / expired / invalidated）
+- FastAPI 服務以 add_metrics_route 提供 GET /metrics；Streamlit 以 start_metrics_server 另開 port
+- 設定 PROMETHEUS_MULTIPROC_DIR 時（gunicorn 多 worker）彙整所有 worker 的指標
+"""
+import os
+import sys
+import time
+import functools
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess, start_http_server
+)
+
+LABELS = ["service", "stage", "collection", "search_type"]
+UNKNOWN_LABEL = "_unknown"  # 不用 "other"：已是資料夾名稱
+SEARCH_TYPES = ("chunk", "summary")
+STAGE_DURATION = Histogram("rag_stage_duration_seconds", "各處理階段耗時（秒）", LABELS, buckets=config.METRICS_LATENCY_BUCKETS)
+STAGE_ERRORS = Counter("rag_stage_errors_total", "各處理階段發生例外的次數", LABELS)
+QUEUE_LABELS = ["service", "queue"]
+QUEUE_WAIT = Histogram("rag_queue_wait_seconds", "工作在佇列中等候執行的時間（秒）", QUEUE_LABELS, buckets=config.METRICS_LATENCY_BUCKETS)
+QUEUE_DEPTH = Gauge("rag_queue_depth", "佇列中等候 / 執行中的工作數", QUEUE_LABELS + ["state"], multiprocess_mode="livesum")
+QUEUE_REJECTED = Counter("rag_queue_rejected_total", "佇列已滿而拒絕的工作數", QUEUE_LABELS)
+OBSERVATION_TOKENS = Counter("rag_agent_observation_tokens_total", "agent 工具 Observation 的估算 tokens（打包前 / 後）", ["service", "kind"])
+ANSWER_CACHE = Counter("rag_agent_answer_cache_total", "agent 回答快取查詢結果（hit / miss / expired / invalidated）", ["service", "result"])
+PREFETCH = Counter("rag_agent_prefetch_total", "agent 推測式預取結果（hit / miss / unused / error）", ["service", "result"])
+
+_service_name = "unknown"
+_metrics_server_started = False
+
+
+def set_service(name: str) -> None:
+    """設定本 process 的 service 標籤（retriever / agent / frontend）"""
+    global _service_name
+    _service_name = name
+
+def stage_labels(stage: str, collection: str = None, search_type: str = None) -> Tuple[str, str, str, str]:
+    """組成階段指標的標籤；未知的 collection / search_type 歸為 UNKNOWN_LABEL"""
+    if collection and collection != config.ALL_FOLDERS and collection not in config.ALL_COLLECTIONS:
+        collection = UNKNOWN_LABEL
+    if search_type and search_type not in SEARCH_TYPES:
+        search_type = UNKNOWN_LABEL
+    return _service_name, stage, collection or "", search_type or ""
+
+def observe_stage(stage: str, elapsed: float, collection: str = None, search_type: str = None, error: bool = False) -> None:
+    """寫入一筆已量測的階段耗時（開始與結束分屬不同回呼、無法使用 with 區塊時）"""
+    labels = stage_labels(stage, collection, search_type)
+    if error:
+        STAGE_ERRORS.labels(*labels).inc()
+    STAGE_DURATION.labels(*labels).observe(elapsed)
+
+def observe_queue(queue: str, queued: int, running: int, wait: float = None, rejected: bool = False) -> None:
+    """更新佇列深度，並寫入一筆等候時間（工作開始執行時）或拒絕次數（佇列已滿時）"""
+    QUEUE_DEPTH.labels(_service_name, queue, "queued").set(queued)
+    QUEUE_DEPTH.labels(_service_name, queue, "running").set(running)
+    if wait is not None:
+        QUEUE_WAIT.labels(_service_name, queue).observe(wait)
+    if rejected:
+        QUEUE_REJECTED.labels(_service_name, queue).inc()
+
+def count_observation_tokens(raw: int, packed: int) -> None:
+    """累計 agent 工具 Observation 打包前後的估算 tokens"""
+    OBSERVATION_TOKENS.labels(_service_name, "raw").inc(raw)
+    OBSERVATION_TOKENS.labels(_service_name, "packed").inc(packed)
+
+def count_answer_cache(result: str) -> None:
+    """累計 agent 回答快取的查詢結果：hit、miss（無快取）、expired（超過 TTL）、invalidated（collection 索引版本已更新）"""
+    ANSWER_CACHE.labels(_service_name, result).inc()
+
+def count_prefetch(result: str) -> None:
+    """累計 agent 推測式預取的結果：hit（工具使用預取）、miss（查詢不同）、unused（整次執行未使用）、error（預取失敗）"""
+    PREFETCH.labels(_service_name, result).inc()
+
+class StageTimer:
+    """stage_timer 的量測結果，離開 with 區塊後 elapsed 為耗時（秒），供既有日誌沿用"""
+    elapsed: float = 0.0
+
+@contextmanager
+def stage_timer(stage: str, collection: str = None, search_type: str = None) -> Iterator[StageTimer]:
+    """量測 with 區塊耗時並寫入直方圖；區塊拋出例外時另計入錯誤次數"""
+    labels = stage_labels(stage, collection, search_type)
+    timer = StageTimer()
+    start = time.perf_counter()
+    try:
+        yield timer
+    except Exception:
+        STAGE_ERRORS.labels(*labels).inc()
+        raise
+    finally:
+        timer.elapsed = time.perf_counter() - start
+        STAGE_DURATION.labels(*labels).observe(timer.elapsed)
+
+def timed(stage: str, collection: str = None, search_type: str = None) -> Callable:
+    """以 stage_timer 量測整個函式（同步函式）"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage_timer(stage, collection, search_type):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """產生 Prometheus text format 內容；多 worker 時彙整 PROMETHEUS_MULTIPROC_DIR 中所有 worker 的指標"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+def add_metrics_route(app: Any) -> None:
+    """為 FastAPI 應用加上 GET /metrics"""
+    from fastapi.responses import Response
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics() -> Response:
+        body, content_type = metrics_payload()
+        return Response(content=body, media_type=content_type)
+
+def start_metrics_server(port: int) -> None:
+    """另開 HTTP port 提供 /metrics（Streamlit 每次互動重新執行腳本，只在第一次啟動）"""
+    global _metrics_server_started
+    if _metrics_server_started:
+        return
+    try:
+        start_http_server(port)
+        _metrics_server_started = True
+        print(f"📈 指標服務已啟動: http://0.0.0.0:{port}/metrics")
+    except OSError as e:
+        _metrics_server_started = True  # port 已被其他 session 佔用，表示已有指標服務
+        print(f"⚠️ 指標服務未啟動（port {port}）: {str(e)}")
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config as config
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny, ScoredPoint
+from utils.index_version import bump_index_version, read_index_versions
+
+# 匯出目錄結構：{MMAP_INDEX_DIRECTORY}/{collection}/CURRENT 指向目前版本，{collection}/{version}/ 內為唯讀檔案
+# 每次匯出寫入新的版本目錄，不覆寫正在被 mmap 的檔案
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+ID_COLUMN = "__id__"
+KEEP_VERSIONS = 2  # 保留的版本目錄數（含目前版本），舊版本刪除後已開啟的 mmap 仍可讀取至重新載入
+SCROLL_BATCH_SIZE = 256
+SEARCH_BLOCK_ROWS = 65536  # 分塊計算分數，避免 float16 / int8 整個矩陣一次轉成 float32
+
+
+def _vector_file(name: str) -> str:
+    """向量矩陣檔名（未具名向量為 default）"""
+    return f"vector_{name or 'default'}.npy"
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """逐列 L2 正規化，內積即為 cosine similarity"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+def _quantize(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """float16 直接轉型；int8 為每列對稱量化，回傳 (量化矩陣, 每列 scale)"""
+    matrix = _normalize_rows(matrix)
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=1) / 127 if len(matrix) else np.zeros(0, dtype=np.float32)
+    scales[scales == 0] = 1
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+def _write_column(directory: str, field: str, values: List[Any]) -> None:
+    """欄式 payload：每個欄位一個 JSON 串接檔 + offsets，查詢時只解碼命中的列"""
+    encoded = [json.dumps(value, ensure_ascii=False).encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    np.save(os.path.join(directory, f"column_{field}.offsets.npy"), offsets)
+    with open(os.path.join(directory, f"column_{field}.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+
+class MmapIndexNotExported(Exception):
+    """collection 尚未匯出 mmap 索引"""
+
+
+def _write_text(path: str, text: str) -> None:
+    """先寫入暫存檔再以 os.replace 取代，讀取端不會讀到空檔；S3 掛載不支援 rename 時改為刪除舊檔再寫入"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        os.remove(temp_path)
+        if os.path.exists(path):
+            os.remove(path)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+def export_collection(client: QdrantClient, collection: str, output_dir: str = config.MMAP_INDEX_DIRECTORY,
+                      dtype: str = config.MMAP_INDEX_DTYPE, index_version: int = None) -> str:
+    """
+    將 Qdrant collection 匯出為記憶體映射矩陣（每個 dense 向量一個 .npy）與欄式 payload，回傳版本目錄
+    sparse 向量不匯出（mmap 引擎只做 dense 檢索）
+    """
+    if dtype not in ("float16", "int8"):
+        raise ValueError(f"不支援的 mmap 向量格式: {dtype}")
+    points, offset = [], None
+    while True:
+        batch, offset = client.scroll(collection_name=collection, limit=SCROLL_BATCH_SIZE, offset=offset, with_payload=True, with_vectors=True)
+        points.extend(batch)
+        if offset is None:
+            break
+
+    collection_dir = os.path.join(output_dir, collection)
+    version = f"{time.time_ns()}-v{index_version or 0}"  # 時間戳保證每次匯出為新目錄且可依名稱排序
+    version_dir = os.path.join(collection_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    # dense 向量：具名向量取非 sparse 的部分，舊版單一向量 collection 為未具名向量
+    first_vector = points[0].vector if points else []
+    vector_names = [name for name, value in first_vector.items() if isinstance(value, list)] if isinstance(first_vector, dict) else [""]
+    for name in vector_names:
+        rows = [point.vector[name] if isinstance(point.vector, dict) else point.vector for point in points]
+        matrix, scales = _quantize(np.asarray(rows, dtype=np.float32).reshape(len(rows), -1), dtype)
+        np.save(os.path.join(version_dir, _vector_file(name)), matrix)
+        if scales is not None:
+            np.save(os.path.join(version_dir, _vector_file(name).replace(".npy", ".scale.npy")), scales)
+
+    fields = sorted({key for point in points for key in (point.payload or {})})
+    _write_column(version_dir, ID_COLUMN, [str(point.id) for point in points])
+    for field in fields:
+        _write_column(version_dir, field, [(point.payload or {}).get(field) for point in points])
+
+    meta = {
+        "collection": collection,
+        "count": len(points),
+        "dim": config.EMBEDDING_DIM,
+        "dtype": dtype,
+        "vectors": vector_names,
+        "fields": fields,
+        "index_version": index_version
+    }
+    with open(os.path.join(version_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    # 所有檔案寫完才切換 CURRENT，檢索端不會讀到寫到一半的版本
+    _write_text(os.path.join(collection_dir, CURRENT_FILE), version)
+    for old_version in sorted(name for name in os.listdir(collection_dir) if name != CURRENT_FILE and not name.endswith(".tmp"))[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(collection_dir, old_version), ignore_errors=True)
+    print(f"🗂️ {collection} 已匯出 mmap 索引 | {len(points)} 筆 | {dtype} | 版本 {version}")
+    return version_dir
+
+def publish_collection(client: QdrantClient, collection: str) -> int:
+    """
+    upsert 完成後發佈更新：mmap 引擎先匯出並切換 CURRENT，再更新索引版本號，回傳新版本號
+    順序不可顛倒，否則檢索端可能以新版本號快取舊快照的結果，直到下一次更新前都不會失效
+    """
+    if config.VECTOR_ENGINE == "mmap":
+        export_collection(client, collection, index_version=read_index_versions().get(collection, 0) + 1)
+    return bump_index_version(collection)
+
+
+class MmapColumn:
+    def __init__(self, directory: str, field: str):
+        """單一 payload 欄位：offsets 與資料皆以 mmap 開啟"""
+        self.offsets = np.load(os.path.join(directory, f"column_{field}.offsets.npy"), mmap_mode="r")
+        data_path = os.path.join(directory, f"column_{field}.bin")
+        # 長度為 0 的檔案無法 mmap
+        self.data = np.memmap(data_path, dtype=np.uint8, mode="r") if os.path.getsize(data_path) else np.zeros(0, dtype=np.uint8)
+        self._values = None
+
+    def get(self, row: int) -> Any:
+        """解碼單一列的值"""
+        return json.loads(self.data[self.offsets[row]:self.offsets[row + 1]].tobytes())
+
+    def values(self) -> List[Any]:
+        """解碼整個欄位（過濾條件使用，結果會保留）"""
+        if self._values is None:
+            self._values = [self.get(row) for row in range(len(self.offsets) - 1)]
+        return self._values
+
+
+class MmapCollection:
+    def __init__(self, directory: str):
+        """開啟單一版本目錄：向量矩陣以 mmap 唯讀開啟，啟動時不需讀入資料，多個 process 共用同一份 page cache"""
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.directory = directory
+        self.count = self.meta["count"]
+        self.vectors = {name: np.load(os.path.join(directory, _vector_file(name)), mmap_mode="r") for name in self.meta["vectors"]}
+        self.scales = {}
+        if self.meta["dtype"] == "int8":
+            self.scales = {
+                name: np.load(os.path.join(directory, _vector_file(name).replace(".npy", ".scale.npy")), mmap_mode="r")
+                for name in self.meta["vectors"]
+            }
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def _column(self, field: str) -> Optional[MmapColumn]:
+        """取得 payload 欄位（首次使用時開啟）"""
+        if field != ID_COLUMN and field not in self.meta["fields"]:
+            return None
+        with self._lock:
+            if field not in self._columns:
+                self._columns[field] = MmapColumn(self.directory, field)
+            return self._columns[field]
+
+    def _scores(self, name: str, query_vector: List[float]) -> np.ndarray:
+        """分塊計算所有列與查詢向量的 cosine similarity"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        matrix = self.vectors[name]
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        if name in self.scales:
+            scores *= self.scales[name]
+        return scores
+
+    def _filter_mask(self, query_filter: Filter) -> np.ndarray:
+        """
+        以 payload 欄位計算過濾遮罩，支援 must / must_not 中的 MatchValue / MatchAny（與 Qdrant 相同：陣列欄位任一元素符合即可）
+        """
+        mask = np.ones(self.count, dtype=bool)
+        for conditions, expected in ((query_filter.must, True), (query_filter.must_not, False)):
+            for condition in conditions or []:
+                if not isinstance(condition, FieldCondition) or not isinstance(condition.match, (MatchValue, MatchAny)):
+                    raise ValueError(f"mmap 引擎不支援的過濾條件: {condition}")
+                accepted = {condition.match.value} if isinstance(condition.match, MatchValue) else set(condition.match.any)
+                column = self._column(condition.key)
+                values = column.values() if column is not None else [None] * self.count
+                matched = np.fromiter(
+                    (bool(accepted & set(value)) if isinstance(value, list) else value in accepted for value in values),
+                    dtype=bool, count=self.count
+                )
+                mask &= matched if expected else ~matched
+        return mask
+
+    def _payload(self, row: int, with_payload: Any) -> Dict[str, Any]:
+        """取出單列 payload：True 為全部欄位，list 為指定欄位"""
+        if not with_payload:
+            return None
+        fields = self.meta["fields"] if with_payload is True else [field for field in with_payload if field in self.meta["fields"]]
+        return {field: self._column(field).get(row) for field in fields}
+
+    def _vector(self, row: int, with_vectors: Any) -> Any:
+        """取出單列向量（反量化為 float），True 為全部向量，list 為指定向量"""
+        if not with_vectors:
+            return None
+        names = self.meta["vectors"] if with_vectors is True else [name for name in with_vectors if name in self.vectors]
+        vectors = {}
+        for name in names:
+            vector = np.asarray(self.vectors[name][row], dtype=np.float32)
+            vectors[name] = (vector * self.scales[name][row] if name in self.scales else vector).tolist()
+        return vectors
+
+    def search(self, query_vector: List[float], top_k: int, using: str = None, query_filter: Filter = None,
+               score_threshold: float = None, with_payload: Any = True, with_vectors: Any = False) -> List[ScoredPoint]:
+        """以矩陣內積 + argpartition 取 top_k，回傳格式與 Qdrant query_points 的 points 相同"""
+        name = using or ""
+        if self.count == 0 or top_k <= 0:
+            return []
+        scores = self._scores(name, query_vector)
+        if query_filter is not None:
+            scores[~self._filter_mask(query_filter)] = -np.inf
+        k = min(top_k, self.count)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        rows = candidates[np.argsort(-scores[candidates])]
+        rows = rows[np.isfinite(scores[rows])]
+        if score_threshold is not None:
+            rows = rows[scores[rows] >= score_threshold]
+        ids = self._column(ID_COLUMN)
+        return [
+            ScoredPoint(
+                id=ids.get(row),
+                version=0,
+                score=float(scores[row]),
+                payload=self._payload(row, with_payload),
+                vector=self._vector(row, with_vectors)
+            )
+            for row in rows.tolist()
+        ]
+
+
+class MmapIndex:
+    def __init__(self, directory: str = config.MMAP_INDEX_DIRECTORY):
+        """
+        檢索端的 mmap 索引：依 collection 的 CURRENT 檔開啟最新版本，匯出新版本後自動切換
+        """
+        self.directory = directory
+        self._collections = {}  # collection -> (版本, MmapCollection)
+        self._lock = threading.Lock()
+
+    def get(self, collection: str) -> MmapCollection:
+        """取得 collection 目前版本，尚未匯出時拋出 MmapIndexNotExported"""
+        try:
+            with open(os.path.join(self.directory, collection, CURRENT_FILE), "r", encoding="utf-8") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            raise MmapIndexNotExported(f"{collection} 尚未匯出 mmap 索引，請執行 python tools/export_mmap_index.py")
+        with self._lock:
+            cached = self._collections.get(collection)
+            if cached is None or cached[0] != version:
+                cached = (version, MmapCollection(os.path.join(self.directory, collection, version)))
+                self._collections[collection] = cached
+                print(f"🗂️ 載入 mmap 索引 {collection} | 版本 {version} | {cached[1].count} 筆")
+            return cached[1]
@@ -0,0 +1,105 @@
+import os
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+
+# =======================
+# SQLite 持久層：所有讀寫都在單一背景執行緒執行，不阻塞 event loop
+# =======================
+class SQLiteStore:
+    def __init__(self, path: str, schema: Sequence[str], name: str, prune: Callable[[sqlite3.Connection], None] = None,
+                 prune_interval: float = 60.0, commit_every: int = 64) -> None:
+        """
+        開啟資料庫並建立 schema（CREATE TABLE / CREATE INDEX）；開啟失敗時拋出例外
+        - 寫入（write）只排入背景執行緒後立即返回，多筆寫入合併為一次 commit（佇列清空或累積 commit_every 筆時）
+        - 讀取（fetchone）以 await 等待背景執行緒，與寫入依序執行
+        - prune 為淘汰函式，距上次執行超過 prune_interval 秒時於背景執行緒執行（不在每次寫入時執行）
+        """
+        self.path = path
+        self.name = name
+        self.prune = prune
+        self.prune_interval = prune_interval
+        self.commit_every = commit_every
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0  # 已排入但尚未執行的寫入筆數
+        self._uncommitted = 0
+        self._last_prune = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 連線只在背景執行緒使用；timeout 為多個 worker 共用同一檔案時等待寫入鎖的秒數
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in schema:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def _commit(self) -> None:
+        """提交累積的寫入（背景執行緒）"""
+        if self._uncommitted:
+            self._conn.commit()
+            self._uncommitted = 0
+
+    def _maybe_prune(self) -> None:
+        """距上次淘汰超過 prune_interval 秒時執行淘汰（背景執行緒）"""
+        if self.prune is None or time.time() - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = time.time()
+        self.prune(self._conn)
+        self._uncommitted += 1
+
+    def _write(self, statements: List[Tuple[str, Tuple[Any, ...]]]) -> None:
+        """執行寫入，佇列清空或累積 commit_every 筆時才 commit（背景執行緒）"""
+        with self._lock:
+            self._pending -= 1
+            pending = self._pending
+        try:
+            for sql, params in statements:
+                self._conn.execute(sql, params)
+            self._uncommitted += 1
+            self._maybe_prune()
+            if pending == 0 or self._uncommitted >= self.commit_every:
+                self._commit()
+        except Exception as e:
+            print(f"⚠️ {self.name} 寫入持久層失敗: {str(e)}")
+            try:
+                self._conn.rollback()
+            except Exception:
+                pass
+            self._uncommitted = 0
+
+    def write(self, *statements: Tuple[str, Tuple[Any, ...]]) -> None:
+        """排入一組寫入 (sql, params)，同一組在同一次 commit 內完成；不等待執行結果"""
+        with self._lock:
+            self._pending += 1
+        try:
+            self._executor.submit(self._write, list(statements))
+        except RuntimeError:  # 已關閉
+            with self._lock:
+                self._pending -= 1
+
+    def _fetchone(self, sql: str, params: Tuple[Any, ...]) -> Optional[Tuple[Any, ...]]:
+        """查詢單筆資料（背景執行緒）"""
+        return self._conn.execute(sql, params).fetchone()
+
+    async def fetchone(self, sql: str, params: Tuple[Any, ...] = ()) -> Optional[Tuple[Any, ...]]:
+        """在背景執行緒查詢單筆資料，讀取失敗時回傳 None"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._fetchone, sql, params)
+        except Exception as e:
+            print(f"⚠️ {self.name} 讀取持久層失敗: {str(e)}")
+            return None
+
+    def close(self) -> None:
+        """等待已排入的寫入完成並關閉連線"""
+        try:
+            self._executor.submit(self._commit)
+        except RuntimeError:
+            return
+        self._executor.shutdown(wait=True)
+        self._conn.close()